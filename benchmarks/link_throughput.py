@@ -0,0 +1,154 @@
+"""
+Compares the build throughput of transformed programs linked with exec_loop.o, papi_utils.o and the PAPI libraries
+(the original 'static' mode) and with the prelinked harness object (see popsicle.exec_utils.kernel_runner.LINK_MODES).
+Every program is compiled once (with the first line of its (...)_params.txt), then linked in both modes.
+
+Usage (remember to source the config and run popsicle-init-time.sh first):
+    python benchmarks/link_throughput.py [input_dir] [-n LIMIT] [-r REPEAT] [--check] [--trials N] [--tolerance T]
+
+With --check, the binaries of both modes are executed and the medians of the printed counters and times are compared.
+
+By default, programs from $LORE_PROC_PATH are used.
+"""
+from __future__ import print_function
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import tempfile
+import time
+from popsicle.exec_utils.kernel_runner import LINK_MODES, link_inputs
+
+
+def load_programs(input_dir, limit):
+    """
+    :return: List of pairs (source path, compilation flags)
+    """
+    programs = []
+    for name in sorted(os.listdir(input_dir)):
+        file_prefix = os.path.join(input_dir, name, name)
+        try:
+            with open(file_prefix + '_params.txt', 'r') as fin:
+                params = fin.readline().strip()
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+        programs.append((file_prefix + '.c', ['-O0'] + shlex.split(params)))
+        if len(programs) == limit:
+            break
+
+    return programs
+
+
+def compile_objects(programs, build_dir):
+    """
+    :return: List of paths of the compiled objects and the mean compilation time (in seconds)
+    """
+    objects = []
+    start = time.perf_counter()
+
+    for i, (source_path, flags) in enumerate(programs):
+        obj_path = os.path.join(build_dir, str(i) + '.o')
+        subprocess.run(['gcc', '-c', source_path, '-o', obj_path] + flags, stdout=subprocess.DEVNULL, check=True)
+        objects.append(obj_path)
+
+    return objects, (time.perf_counter() - start) / len(programs)
+
+
+def link_time(objects, link_mode, repeat, build_dir):
+    """
+    :return: Paths of the linked binaries and the mean link time of a program (in seconds)
+    """
+    binaries = [os.path.join(build_dir, str(i) + '_' + link_mode) for i in range(len(objects))]
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        for obj_path, binary_path in zip(objects, binaries):
+            subprocess.run(['gcc', obj_path] + link_inputs(link_mode) + ['-o', binary_path],
+                           stdout=subprocess.DEVNULL, check=True)
+
+    return binaries, (time.perf_counter() - start) / (repeat * len(objects))
+
+
+def output_values(binary_path, trials):
+    """
+    Executes the binary, repeating the measured region trials times in one process (see exec_loop.c).
+    :return: Medians of the printed values (PAPI counters and time) or None if the execution failed
+    """
+    env = dict(os.environ, POPSICLE_TRIALS=str(trials))
+    res = subprocess.run([binary_path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env)
+    if res.returncode != 0:
+        return None
+
+    lines = res.stdout.decode().strip().split('\n')[-trials:]
+    try:
+        rows = [[float(v) for v in line.split(',')] for line in lines]
+    except ValueError:
+        return None
+
+    if len(rows) < trials or len(set(len(row) for row in rows)) > 1:
+        return None
+    return [statistics.median(column) for column in zip(*rows)]
+
+
+def compare_values(values, reference, tolerance):
+    """
+    :return: List of differing values: tuples (column name, value, reference value)
+    """
+    names = ['counter ' + str(i + 1) for i in range(len(reference) - 1)] + ['time']
+    return [(name, v, r) for name, v, r in zip(names, values, reference)
+            if abs(v - r) > tolerance * max(abs(v), abs(r))]
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('input_dir', nargs='?', default=os.environ.get('LORE_PROC_PATH'),
+                           help='Directory with transformed programs (default: $LORE_PROC_PATH)')
+    argparser.add_argument('-n', '--limit', type=int, default=20, help='Maximum number of programs (default: 20)')
+    argparser.add_argument('-r', '--repeat', type=int, default=3, help='How many times each program is linked')
+    argparser.add_argument('--check', action='store_true',
+                           help='Execute the binaries of both modes and compare the printed counters and times')
+    argparser.add_argument('--trials', type=int, default=5,
+                           help='With --check: number of executions of each binary (default: 5)')
+    argparser.add_argument('--tolerance', type=float, default=0.05,
+                           help='With --check: maximal relative difference of the medians (default: 0.05)')
+    args = argparser.parse_args()
+
+    programs = load_programs(args.input_dir, args.limit)
+    print('Loaded %d programs from %s' % (len(programs), args.input_dir))
+    if len(programs) == 0:
+        return
+
+    with tempfile.TemporaryDirectory(prefix='popsicle_') as build_dir:
+        objects, compile_time = compile_objects(programs, build_dir)
+        print('Compilation: %8.1f ms per program' % (compile_time * 1000))
+
+        binaries = {}
+        print('Linking:')
+        for link_mode in LINK_MODES:
+            binaries[link_mode], t = link_time(objects, link_mode, args.repeat, build_dir)
+            print('\t%-12s %8.1f ms per program, %6.1f builds/s' % (link_mode, t * 1000, 1 / (compile_time + t)))
+
+        if args.check:
+            mismatches = 0
+            for i, (source_path, _) in enumerate(programs):
+                outputs = [output_values(binaries[link_mode][i], args.trials) for link_mode in LINK_MODES]
+                reference, others = outputs[0], outputs[1:]
+
+                if reference is None or any(values is None or len(values) != len(reference) for values in others):
+                    mismatches += 1
+                    print('\tExecution failed or different columns: ' + source_path)
+                    continue
+
+                diffs = [d for values in others for d in compare_values(values, reference, args.tolerance)]
+                if len(diffs) > 0:
+                    mismatches += 1
+                    print('\tDifferent outputs of ' + source_path + ': ' +
+                          ', '.join('%s %g (%s: %g)' % (name, v, LINK_MODES[0], r) for name, v, r in diffs))
+            print('Outputs: %d of %d programs differ by more than %g%%' %
+                  (mismatches, len(programs), args.tolerance * 100))
+
+
+if __name__ == "__main__":
+    main()
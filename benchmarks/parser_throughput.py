@@ -0,0 +1,97 @@
+"""
+Compares the throughput of code transformation with a new CParser built for every file (the original behaviour) and
+with the parser shared by the whole process (popsicle.code_transform_utils.shared_parser).
+
+Usage (remember to source the config first):
+    python benchmarks/parser_throughput.py [input_dir] [-r REPEAT]
+
+By default, LORE programs from $LORE_ORIG_PATH are used.
+"""
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pycparser import c_parser
+from popsicle.code_transform_utils.code_transformer import CodeTransformer
+from popsicle.code_transform_utils.code_transform_utils import split_code
+from popsicle.code_transform_utils.shared_parser import get_parser
+
+STARTUP_SNIPPETS = {
+    'CParser()': 'from pycparser import c_parser; c_parser.CParser().parse("int x;")',
+    'get_parser()': 'from popsicle.code_transform_utils.shared_parser import get_parser; get_parser().parse("int x;")',
+}
+
+
+def load_sources(input_dir):
+    sources = []
+    for file_name in sorted(os.listdir(input_dir)):
+        if file_name.endswith('.c'):
+            with open(os.path.join(input_dir, file_name), 'r') as fin:
+                sources.append(split_code(fin.read()))
+    return sources
+
+
+def startup_time(snippet, env):
+    """
+    Time needed by a fresh interpreter to build a parser and parse a trivial program.
+    """
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, '-c', snippet], env=env)
+    return time.perf_counter() - start
+
+
+def throughput(sources, repeat, parser_factory):
+    """
+    :return: Number of transformed files per second
+    """
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        for includes, code in sources:
+            ct = CodeTransformer(
+                includes=includes,
+                code=code,
+                papi_scope='pragma',
+                main_name='loop',
+                modifiers_to_remove=['extern'],
+                gen_mallocs=True,
+                rename_bounds=True,
+                parser=parser_factory(),
+            )
+            try:
+                ct.transform()
+            except Exception:
+                pass
+
+    return repeat * len(sources) / (time.perf_counter() - start)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('input_dir', nargs='?', default=os.environ.get('LORE_ORIG_PATH'),
+                           help='Directory with C programs (default: $LORE_ORIG_PATH)')
+    argparser.add_argument('-r', '--repeat', type=int, default=3, help='How many times each file is transformed')
+    args = argparser.parse_args()
+
+    sources = load_sources(args.input_dir)
+    print('Loaded %d files from %s' % (len(sources), args.input_dir))
+
+    print('Startup (new interpreter, first parse):')
+    with tempfile.TemporaryDirectory() as empty_dir:
+        env = dict(os.environ, POPSICLE_PARSER_TABLES=empty_dir)
+        print('\t%-28s %8.3f s' % ('get_parser(), cold tables', startup_time(STARTUP_SNIPPETS['get_parser()'], env)))
+    for name, snippet in STARTUP_SNIPPETS.items():
+        print('\t%-28s %8.3f s' % (name, startup_time(snippet, dict(os.environ))))
+
+    get_parser()
+
+    print('Throughput:')
+    print('\t%-28s %8.1f files/s' % ('CParser() per file', throughput(sources, args.repeat, c_parser.CParser)))
+    print('\t%-28s %8.1f files/s' % ('shared parser', throughput(sources, args.repeat, get_parser)))
+
+
+if __name__ == "__main__":
+    main()
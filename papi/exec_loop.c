@@ -1,5 +1,6 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include "exec_loop.h"
 #include "papi_utils.h"
 
@@ -15,20 +16,50 @@ void print_result(int set, long_long* values, double time_spent) {
 }
 
 
+/*
+ * Value of an optional integer setting read from an environment variable.
+ */
+int env_int(const char* name, int default_value) {
+    const char* value = getenv(name);
+    return value != NULL ? atoi(value) : default_value;
+}
+
+
+/*
+ * Usage: exec_loop [events_file] [PARAM_X=value ...]
+ *
+ * Arguments in the form NAME=VALUE set the values of parameters read on runtime (see popsicle_param in papi_utils.h),
+ * like environment variables. The remaining argument is the path to the list of PAPI events to measure.
+ *
+ * The measured region is executed POPSICLE_WARMUP times without printing the results (default: 0), and then
+ * POPSICLE_TRIALS times (default: 1), printing a line for each execution. The arrays are initialised again before
+ * every execution unless POPSICLE_REINIT is 0 (see popsicle_init_needed).
+ */
 int main(int argc, char* argv []) {
 
     int set = PAPI_NULL;
     int event_codes[256];
     int event_count;
     int retval = 0;
+    char* events_path = NULL;
+
+    for(int i = 1; i < argc; ++i) {
+        char* sep = strchr(argv[i], '=');
+        if(sep != NULL) {
+            *sep = '\0';
+            setenv(argv[i], sep + 1, 1);
+        } else {
+            events_path = argv[i];
+        }
+    }
 
     initialize();
     exec(PAPI_multiplex_init());
 
-    if(argc >= 2) {
-        retval = load_event_names(argv[1], event_codes, &event_count);
+    if(events_path != NULL) {
+        retval = load_event_names(events_path, event_codes, &event_count);
         if(retval != 0) {
-            printf("Cannot open %s (error %d). \n", argv[1], retval);
+            printf("Cannot open %s (error %d). \n", events_path, retval);
             return retval;
         }
     } else {
@@ -43,9 +74,15 @@ int main(int argc, char* argv []) {
     exec(PAPI_add_events(set, event_codes, event_count));
 
     clock_t begin, end;
+    int warmup = env_int("POPSICLE_WARMUP", 0);
+    int trials = env_int("POPSICLE_TRIALS", 1);
 
-    loop(set, values, &begin, &end);
+    for(int trial = 0; trial < warmup + trials; ++trial) {
+        loop(set, values, &begin, &end);
 
-    double time_spent = (double)(end - begin) * 1000 / CLOCKS_PER_SEC;
-    print_result(set, values, time_spent);
+        if(trial >= warmup) {
+            double time_spent = (double)(end - begin) * 1000 / CLOCKS_PER_SEC;
+            print_result(set, values, time_spent);
+        }
+    }
 }
\ No newline at end of file
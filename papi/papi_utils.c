@@ -3,6 +3,10 @@
 #include <papi.h>
 #include <string.h>
 #include <errno.h>
+#include <sys/mman.h>
+
+#define CACHE_LINE_SIZE 64
+#define HUGE_PAGE_SIZE (2 * 1024 * 1024)
 
 void handle_error (int retval) {
     printf("PAPI error %d: %s\n", retval, PAPI_strerror(retval));
@@ -50,4 +54,85 @@ int load_event_names(char* file_path, int* res, int* number) {
 
     fclose(stream);
     return 0;
-}
\ No newline at end of file
+}
+
+/*
+ * Blocks allocated by popsicle_malloc() and alloc_aligned(). They are freed by popsicle_free_all() before the arrays
+ * of a program are allocated again (see popsicle_init_needed).
+ */
+static void** allocations = NULL;
+static size_t allocations_count = 0;
+static size_t allocations_capacity = 0;
+
+static void register_allocation(void* ptr) {
+    if(allocations_count == allocations_capacity) {
+        allocations_capacity = allocations_capacity > 0 ? 2 * allocations_capacity : 1024;
+        allocations = realloc(allocations, allocations_capacity * sizeof(void*));
+        if(allocations == NULL) {
+            printf("Cannot allocate the list of allocations.\n");
+            exit(1);
+        }
+    }
+    allocations[allocations_count++] = ptr;
+}
+
+void* popsicle_malloc(size_t size) {
+    void* ptr = malloc(size);
+
+    if(ptr == NULL) {
+        printf("Cannot allocate %zu bytes.\n", size);
+        exit(1);
+    }
+
+    register_allocation(ptr);
+    return ptr;
+}
+
+void popsicle_free_all() {
+    while(allocations_count > 0) {
+        free(allocations[--allocations_count]);
+    }
+}
+
+/*
+ * Decides whether the arrays of a program are (re)initialised before the next execution of the measured region:
+ * always before the first one, and before the following ones unless POPSICLE_REINIT is 0 (which is only safe if the
+ * program does not depend on the values of its arrays). The arrays of the previous execution are freed.
+ */
+int popsicle_init_needed() {
+    static int initialised = 0;
+    const char* reinit = getenv("POPSICLE_REINIT");
+
+    if(!initialised) {
+        initialised = 1;
+        return 1;
+    }
+
+    if(reinit != NULL && atoi(reinit) == 0) return 0;
+
+    popsicle_free_all();
+    return 1;
+}
+
+/*
+ * Allocates a block of memory aligned to the cache line size. If huge_pages is non-zero, the block is aligned to the
+ * huge page size instead and the kernel is advised to back it with transparent huge pages (it is only a hint).
+ */
+void* alloc_aligned(size_t size, int huge_pages) {
+    void* ptr = NULL;
+    size_t alignment = huge_pages ? HUGE_PAGE_SIZE : CACHE_LINE_SIZE;
+    int retval = posix_memalign(&ptr, alignment, size > 0 ? size : 1);
+
+    if(retval != 0) {
+        printf("Cannot allocate %zu bytes (error %d).\n", size, retval);
+        exit(1);
+    }
+
+#ifdef MADV_HUGEPAGE
+    if(huge_pages) madvise(ptr, size, MADV_HUGEPAGE);
+#endif
+
+    register_allocation(ptr);
+
+    return ptr;
+}
@@ -1,3 +1,7 @@
+#include <stddef.h>
+#include <stdio.h>
+#include <stdlib.h>
+
 void handle_error (int retval);
 
 int exec(int retval);
@@ -7,3 +11,48 @@ void initialize();
 void available_event_codes(int* res, int* number);
 
 int load_event_names(char* file_path, int* res, int* number);
+
+void* alloc_aligned(size_t size, int huge_pages);
+
+void* popsicle_malloc(size_t size);
+
+void popsicle_free_all();
+
+int popsicle_init_needed();
+
+/*
+ * A fast deterministic PRNG (xorshift64*) for initialising arrays. Unlike rand(), it is inlined and does not take
+ * any locks. The state is kept in a static variable of a static function to avoid warnings about unused variables.
+ */
+static inline unsigned long long* popsicle_rand_state() {
+    static unsigned long long state = 88172645463325252ULL;
+    return &state;
+}
+
+static inline void popsicle_srand(unsigned long long seed) {
+    unsigned long long* state = popsicle_rand_state();
+    *state = seed * 2685821657736338717ULL + 88172645463325252ULL;
+    if(*state == 0) *state = 88172645463325252ULL;      // the state must not be zero
+}
+
+static inline int popsicle_rand() {
+    unsigned long long* state = popsicle_rand_state();
+    *state ^= *state >> 12;
+    *state ^= *state << 25;
+    *state ^= *state >> 27;
+    return (int) ((*state * 2685821657736338717ULL) >> 33);
+}
+
+/*
+ * Value of a parameter read on runtime from an environment variable (or an argument PARAM_N=value of exec_loop).
+ * Programs compiled with -D PARAM_N='popsicle_param("PARAM_N")' can be executed with different parameter values
+ * without recompilation (used by popsicle-calibrate-lore and popsicle-exec-lore -r).
+ */
+static inline int popsicle_param(const char* name) {
+    const char* value = getenv(name);
+    if(value == NULL) {
+        fprintf(stderr, "Parameter %s is not set.\n", name);
+        exit(1);
+    }
+    return atoi(value);
+}
@@ -0,0 +1,252 @@
+from collections import namedtuple
+from subprocess import CalledProcessError
+from typing import Callable, Optional, Tuple
+import argparse
+import os
+import shlex
+from popsicle.catalog import Catalog, catalog_path
+from popsicle.exec_utils.build_cache import BuildCache
+from popsicle.exec_utils.kernel_runner import KernelRunner, physical_memory
+from popsicle.utils import check_config
+
+# Target window of measured times (in milliseconds). Programs running shorter than 100 ms are discarded during training
+# (see FileLoader) and the execution scripts kill the ones running longer than 10 s - both limits have some margin.
+MIN_TIME = 150
+MAX_TIME = 5000
+
+# A result of Calibrator.calibrate(). min_time and max_time are the times measured for min_param and max_param.
+Calibration = namedtuple('Calibration', ['min_param', 'max_param', 'min_time', 'max_time', 'runs'])
+
+
+class Calibrator:
+    """
+    Searches for the range of parameter values [min_param, max_param] for which the measured time of a program lands
+    inside the target window [min_time, max_time].
+
+    The parameter is first increased geometrically (start, start*growth, ...) until the program exceeds max_time or
+    fails (e.g. runs out of memory). Then both ends of the range are refined by bisection, up to given precision.
+    The time is assumed to be non-decreasing with the parameter value.
+    """
+    def __init__(self,
+                 measure: Callable[[int], Optional[float]],
+                 min_time: float=MIN_TIME,
+                 max_time: float=MAX_TIME,
+                 start: int=16,
+                 growth: float=2.0,
+                 max_value: int=10**7,
+                 precision: float=0.05):
+        """
+        :param measure: A function running the program with given parameter value, returning the measured time or
+            None if the program failed
+        :param min_time: Lower end of the target window
+        :param max_time: Upper end of the target window
+        :param start: First parameter value to try
+        :param growth: Factor by which the parameter is increased in the geometric phase
+        :param max_value: Maximum parameter value to try (for programs whose time does not depend on the parameter)
+        :param precision: Relative precision of the bisection
+        """
+        if start < 1 or growth <= 1 or max_value < start:
+            raise ValueError('Incorrect calibration parameters')
+
+        self.measure = measure
+        self.min_time = min_time
+        self.max_time = max_time
+        self.start = start
+        self.growth = growth
+        self.max_value = max_value
+        self.precision = precision
+
+        self.times = {}
+
+    def calibrate(self) -> Optional[Calibration]:
+        """
+        :return: Calibration or None if the program does not run successfully even for the smallest parameter value.
+            If the target window cannot be reached, min_param == max_param is the value giving the closest time.
+        """
+        good, bad = 0, None
+        param = self.start
+
+        while True:
+            if not self.__fits(param):
+                bad = param
+                break
+            good = param
+            if param >= self.max_value:
+                break
+            param = min(self.max_value, max(param + 1, int(param * self.growth)))
+
+        if bad is not None:
+            good, _ = self.__bisect(good, bad, self.__fits)
+
+        if good == 0:
+            return None
+
+        in_window = [p for p, t in self.times.items() if p <= good and t is not None and t >= self.min_time]
+        if len(in_window) > 0:
+            first_in = min(in_window)
+            below = max([p for p, t in self.times.items() if p < first_in and t is not None] + [0])
+            _, first_in = self.__bisect(below, first_in, self.__below_window)
+        else:
+            first_in = good
+
+        return Calibration(first_in, good, self.__time(first_in), self.__time(good), len(self.times))
+
+    # PRIVATE MEMBERS
+
+    def __time(self, param: int) -> Optional[float]:
+        if param not in self.times:
+            self.times[param] = self.measure(param)
+        return self.times[param]
+
+    def __fits(self, param: int) -> bool:
+        t = self.__time(param)
+        return t is not None and t <= self.max_time
+
+    def __below_window(self, param: int) -> bool:
+        t = self.__time(param)
+        return t is not None and t < self.min_time
+
+    def __bisect(self, low: int, high: int, condition: Callable[[int], bool]) -> Tuple[int, int]:
+        """
+        Narrows down the range [low, high] such that condition(low) holds and condition(high) does not.
+        Value 0 is assumed to satisfy the condition without checking it.
+        """
+        while high - low > max(1, int(low * self.precision)):
+            mid = (low + high) // 2
+            if condition(mid):
+                low = mid
+            else:
+                high = mid
+        return low, high
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-v', '--verbose', action='store_true', help='Print every measurement')
+    argparser.add_argument('-u', '--unroll', action='store_true',
+                           help='Calibrate programs with loop unrolling ($LORE_PROC_CLANG_PATH, compiled with clang '
+                                'without unrolling)')
+    argparser.add_argument('--min-time', type=float, default=MIN_TIME,
+                           help='Lower end of the target time window in ms (default: ' + str(MIN_TIME) + ')')
+    argparser.add_argument('--max-time', type=float, default=MAX_TIME,
+                           help='Upper end of the target time window in ms (default: ' + str(MAX_TIME) + ')')
+    argparser.add_argument('-t', '--timeout', type=float, default=10,
+                           help='Time limit of a single execution in seconds (default: 10)')
+    argparser.add_argument('-m', '--memory-fraction', type=float, default=0.5,
+                           help='Fraction of the physical memory a program can use (default: 0.5)')
+    argparser.add_argument('--start', type=int, default=16, help='First parameter value to try (default: 16)')
+    argparser.add_argument('--max-value', type=int, default=10**7,
+                           help='Maximum parameter value to try (default: 10^7)')
+    argparser.add_argument('--cflags', type=str, default=None,
+                           help='Compilation flags (default: -O0, or -O2 for programs with loop unrolling)')
+    argparser.add_argument('--build-cache-dir', type=str, default=os.environ.get('LORE_BUILD_CACHE_PATH'),
+                           help='Directory of the cache of compiled binaries (default: LORE_BUILD_CACHE_PATH)')
+    argparser.add_argument('--no-build-cache', action='store_true', help='Compile every binary')
+    args = argparser.parse_args()
+    verbose = args.verbose
+    unroll = args.unroll
+
+    var_name = 'LORE_PROC_CLANG_PATH' if unroll else 'LORE_PROC_PATH'
+    check_config([var_name])
+    proc_dir = os.path.abspath(os.environ[var_name])
+
+    if unroll:
+        compiler = 'clang'
+        flags = shlex.split(args.cflags if args.cflags is not None else '-O2') + ['-DPRAGMA_UNROLL="nounroll"']
+    else:
+        compiler = 'gcc'
+        flags = shlex.split(args.cflags if args.cflags is not None else '-O0')
+
+    cache = None
+    if args.build_cache_dir is not None and not args.no_build_cache:
+        cache = BuildCache(args.build_cache_dir)
+
+    memory_limit = int(physical_memory() * args.memory_fraction)
+    print('Memory limit: ' + str(memory_limit // 2**20) + ' MB')
+
+    catalog = Catalog(catalog_path(proc_dir)) if os.path.isfile(catalog_path(proc_dir)) else None
+
+    if catalog is not None:
+        dirs = [k['name'] for k in catalog.kernels()]
+    else:
+        dirs = sorted(os.listdir(proc_dir))
+    n_dirs = len(dirs)
+
+    calibrated = 0
+    out_of_window = 0
+    failed = 0
+
+    for i, file_name in enumerate(dirs):
+        file_prefix = os.path.join(proc_dir, file_name, file_name)
+        if not os.path.isfile(file_prefix + '.c'):
+            continue
+
+        print('[' + str(i + 1) + '/' + str(n_dirs) + '] Calibrating ' + file_name)
+
+        if catalog is not None:
+            params_names = [p for p in catalog.get(file_name)['params_names'].split(',') if len(p) > 0]
+        else:
+            try:
+                with open(file_prefix + '_params_names.txt', 'r') as fin:
+                    params_names = [p for p in fin.read().strip().split(',') if len(p) > 0]
+            except FileNotFoundError:
+                failed += 1
+                print('\tFile (...)_params_names.txt is missing.')
+                continue
+
+        if len(params_names) == 0:
+            failed += 1
+            print('\tNo parameters to calibrate')
+            continue
+
+        with KernelRunner(file_prefix + '.c', params_names, compiler, flags, cache) as runner:
+            try:
+                runner.compile()
+            except CalledProcessError as e:
+                failed += 1
+                print('\tCompilation error:', e.stderr.decode().strip())
+                continue
+
+            def measure(value):
+                time = runner.run({p: value for p in params_names}, args.timeout, memory_limit)
+                if verbose:
+                    print('\t' + str(value) + ': ' + (str(time) + ' ms' if time is not None else 'failed'))
+                return time
+
+            calibration = Calibrator(measure, args.min_time, args.max_time, args.start,
+                                     max_value=args.max_value).calibrate()
+
+        if calibration is None:
+            failed += 1
+            print('\tThe program fails even for the smallest parameter value')
+            continue
+
+        print('\tparams: ' + str(calibration.min_param) + '-' + str(calibration.max_param) +
+              ', time: ' + str(calibration.min_time) + '-' + str(calibration.max_time) + ' ms' +
+              ' (' + str(calibration.runs) + ' runs)')
+
+        if calibration.min_time < args.min_time:
+            out_of_window += 1
+            print('\tCannot reach the minimum time')
+
+        with open(file_prefix + '_min_param.txt', 'w') as fout:
+            fout.write(str(calibration.min_param))
+
+        with open(file_prefix + '_max_param.txt', 'w') as fout:
+            fout.write(str(calibration.max_param))
+
+        if catalog is not None:
+            catalog.set_range(file_name, calibration.min_param, calibration.max_param)
+
+        calibrated += 1
+
+    if catalog is not None:
+        catalog.close()
+
+    print('========')
+    print(str(calibrated) + ' calibrated (' + str(out_of_window) + ' below the time window), ' + str(failed) +
+          ' skipped')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+from __future__ import print_function
+import argparse
+import os
+import sqlite3
+import time
+from popsicle.utils import check_config
+
+# Name of the catalog file in the output directory of the code transformation
+CATALOG_FILE = 'catalog.db'
+
+# Execution modes (see popsicle-exec.sh) which are recorded separately
+EXEC_MODES = ('time', 'gcc', 'unroll')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS kernels (
+    name TEXT PRIMARY KEY,
+    status TEXT NOT NULL,               -- 'parsed' or 'failed'
+    error TEXT,
+    params_names TEXT,                  -- comma-separated, e.g. 'PARAM_N,PARAM_M'
+    max_param INTEGER,
+    min_param INTEGER,                  -- NULL unless calibrated
+    max_arr_dim INTEGER,
+    loop_depth INTEGER,
+    source_path TEXT,
+    code_path TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS kernels_status_depth ON kernels (status, loop_depth);
+
+CREATE TABLE IF NOT EXISTS params (
+    name TEXT NOT NULL REFERENCES kernels (name) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    defines TEXT NOT NULL,              -- a line of (...)_params.txt, e.g. '-D PARAM_N=100'
+    PRIMARY KEY (name, idx)
+);
+
+CREATE TABLE IF NOT EXISTS executions (
+    name TEXT NOT NULL REFERENCES kernels (name) ON DELETE CASCADE,
+    mode TEXT NOT NULL,
+    updated REAL,
+    PRIMARY KEY (name, mode)
+);
+'''
+
+
+def catalog_path(proc_dir):
+    return os.path.join(proc_dir, CATALOG_FILE)
+
+
+class Catalog:
+    """
+    An SQLite index of the programs in an output directory of the code transformation: one row per program with its
+    transformation status, parameters and artifact paths, its generated parameter sets and the execution modes in
+    which it has been run. It is kept in sync with the per-program text files (which are still written for the Bash
+    scripts), but it can be queried without scanning the directory.
+
+    Usage:
+        with Catalog(catalog_path(proc_dir)) as catalog:
+            catalog.kernels(loop_depth=3, not_executed='time')
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def put_parsed(self, name, source_path, code_path, params_names, max_param, max_arr_dim, loop_depth):
+        """
+        Records a successful transformation. The calibrated range, parameter sets and executions of the program are
+        kept, like the files of the previous run.
+        :param params_names: List of parameter names, e.g. ['PARAM_N']
+        """
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO kernels (name, status, error, params_names, max_param, max_arr_dim, loop_depth, '
+                'source_path, code_path, updated) VALUES (?, \'parsed\', NULL, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET status = excluded.status, error = NULL, '
+                'params_names = excluded.params_names, max_param = excluded.max_param, '
+                'max_arr_dim = excluded.max_arr_dim, loop_depth = excluded.loop_depth, '
+                'source_path = excluded.source_path, code_path = excluded.code_path, updated = excluded.updated',
+                (name, ','.join(params_names), max_param, max_arr_dim, loop_depth, source_path, code_path,
+                 time.time()))
+
+    def put_failed(self, name, source_path, error):
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO kernels (name, status, error, source_path, updated) VALUES (?, \'failed\', ?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET status = excluded.status, error = excluded.error, '
+                'source_path = excluded.source_path, updated = excluded.updated',
+                (name, error, source_path, time.time()))
+
+    def set_range(self, name, min_param, max_param):
+        """
+        Records the range of parameters found by popsicle-calibrate-lore.
+        """
+        with self.conn:
+            self.conn.execute('UPDATE kernels SET min_param = ?, max_param = ?, updated = ? WHERE name = ?',
+                              (min_param, max_param, time.time(), name))
+
+    def set_params(self, name, defines):
+        """
+        Replaces the parameter sets of a program. Its executions are reset, as they used the previous parameters.
+        :param defines: List of lines of (...)_params.txt
+        """
+        with self.conn:
+            self.conn.execute('DELETE FROM params WHERE name = ?', (name,))
+            self.conn.execute('DELETE FROM executions WHERE name = ?', (name,))
+            self.conn.executemany('INSERT INTO params (name, idx, defines) VALUES (?, ?, ?)',
+                                  [(name, i, d) for i, d in enumerate(defines)])
+
+    def set_executed(self, name, mode):
+        """
+        :param mode: One of EXEC_MODES
+        """
+        if mode not in EXEC_MODES:
+            raise ValueError('Incorrect execution mode: ' + str(mode))
+
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO executions (name, mode, updated) VALUES (?, ?, ?)',
+                              (name, mode, time.time()))
+
+    def get(self, name):
+        """
+        :return: The row of a program (sqlite3.Row, see SCHEMA) or None if not found
+        """
+        return self.conn.execute('SELECT * FROM kernels WHERE name = ?', (name,)).fetchone()
+
+    def kernels(self, status='parsed', loop_depth=None, not_executed=None):
+        """
+        Finds programs, sorted by name.
+
+        :param status: 'parsed', 'failed' or None (any)
+        :param loop_depth: Only programs with this loop depth (if not None)
+        :param not_executed: Only programs not executed yet in this mode (if not None, see EXEC_MODES)
+        :return: List of rows (sqlite3.Row, see SCHEMA)
+        """
+        conditions, args = [], []
+
+        if status is not None:
+            conditions.append('status = ?')
+            args.append(status)
+        if loop_depth is not None:
+            conditions.append('loop_depth = ?')
+            args.append(loop_depth)
+        if not_executed is not None:
+            conditions.append('NOT EXISTS (SELECT 1 FROM executions e WHERE e.name = kernels.name AND e.mode = ?)')
+            args.append(not_executed)
+
+        where = ' WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else ''
+        return self.conn.execute('SELECT * FROM kernels' + where + ' ORDER BY name', args).fetchall()
+
+    def params(self, name):
+        """
+        :return: List of parameter sets of a program, as in (...)_params.txt
+        """
+        rows = self.conn.execute('SELECT defines FROM params WHERE name = ? ORDER BY idx', (name,)).fetchall()
+        return [row['defines'] for row in rows]
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Query the catalog of transformed programs')
+    argparser.add_argument('-u', '--unroll', action='store_true',
+                           help='Use the catalog of programs with loop unrolling ($LORE_PROC_CLANG_PATH)')
+    subparsers = argparser.add_subparsers(dest='command')
+
+    list_parser = subparsers.add_parser('list', help='Print names of programs (one per line)')
+    list_parser.add_argument('--status', choices=['parsed', 'failed', 'any'], default='parsed',
+                             help='Transformation status (default: parsed)')
+    list_parser.add_argument('--loop-depth', type=int, default=None, help='Only programs with this loop depth')
+    list_parser.add_argument('--not-executed', choices=EXEC_MODES, default=None,
+                             help='Only programs not executed yet in this mode')
+
+    params_parser = subparsers.add_parser('params', help='Print parameter sets of a program (one per line)')
+    params_parser.add_argument('name', type=str)
+
+    executed_parser = subparsers.add_parser('mark-executed', help='Record that a program has been executed')
+    executed_parser.add_argument('mode', choices=EXEC_MODES)
+    executed_parser.add_argument('name', type=str)
+
+    args = argparser.parse_args()
+
+    var_name = 'LORE_PROC_CLANG_PATH' if args.unroll else 'LORE_PROC_PATH'
+    check_config([var_name])
+    path = catalog_path(os.path.abspath(os.environ[var_name]))
+
+    if args.command is None:
+        argparser.error('a command is required')
+
+    if not os.path.isfile(path):
+        raise FileNotFoundError('Catalog ' + path + ' does not exist - run popsicle-transform-lore first')
+
+    with Catalog(path) as catalog:
+        if args.command == 'list':
+            status = None if args.status == 'any' else args.status
+            for row in catalog.kernels(status, args.loop_depth, args.not_executed):
+                print(row['name'])
+
+        elif args.command == 'params':
+            for defines in catalog.params(args.name):
+                print(defines)
+
+        elif args.command == 'mark-executed':
+            catalog.set_executed(args.name, args.mode)
+
+
+if __name__ == "__main__":
+    main()
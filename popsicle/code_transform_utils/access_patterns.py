@@ -0,0 +1,184 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from pycparser import c_ast
+from popsicle.code_transform_utils.code_transform_utils import FusableVisitor, NodeCollector
+from popsicle.code_transform_utils.sym_expr import SymExpr
+from popsicle.code_transform_utils.trip_count import loop_range, to_sym_expr
+
+# Classes of array references, relative to the counter of the innermost enclosing loop
+STRIDES = ('unit', 'non_unit', 'column', 'invariant', 'indirect')
+
+# Columns added to metadata.csv (in this order)
+ACCESS_FEATURES = (
+    'stride_unit',          # number of references in the innermost loops by stride class (see classify_stride)
+    'stride_non_unit',
+    'stride_column',
+    'stride_invariant',
+    'stride_indirect',
+    'reuse_distance',       # mean reuse distance of references with temporal reuse (see reuse_distance), -1 if none
+    'group_reuse',          # references to the same elements as another one, up to a constant offset
+    'no_reuse',             # references without temporal reuse
+)
+
+
+# noinspection PyPep8Naming
+class ArrayAccessCollector(FusableVisitor):
+    """
+    Collects all array accesses. A multidimensional reference (e.g. A[i][j]) is a single access, references used in
+    subscripts (e.g. B[i] in A[B[i]]) are collected as well.
+
+    Attributes:
+        accesses: List[Tuple[str, List[c_ast.Node]]] - (array name, subscripts from the first dimension)
+    """
+    def __init__(self, accesses):
+        self.accesses = accesses
+
+    def visit_ArrayRef(self, node):
+        subscripts = []
+        while type(node) is c_ast.ArrayRef:
+            subscripts.insert(0, node.subscript)
+            node = node.name
+
+        if type(node) is c_ast.ID:
+            self.accesses.append((node.name, subscripts))
+
+        for sub in subscripts:
+            self.visit(sub)
+
+
+def loop_counter(node: c_ast.For) -> Optional[str]:
+    try:
+        return loop_range(node)[0]
+    except ValueError:
+        return None
+
+
+def innermost_bodies(items: List[c_ast.Node], counters: Tuple=()) -> List[Tuple[Tuple, List[c_ast.Node]]]:
+    """
+    :return: For each innermost for loop: (counters of the enclosing loops from the outermost one, body)
+    """
+    collector = NodeCollector(['For'])
+    for item in items:
+        collector.visit(item)
+
+    res = []
+    for node in collector.nodes:
+        body = [node.stmt] if node.stmt is not None else []
+        inner = innermost_bodies(body, counters + (loop_counter(node),))
+        res.extend(inner if len(inner) > 0 else [(counters + (loop_counter(node),), body)])
+    return res
+
+
+def subscript_exprs(subscripts: List[c_ast.Node]) -> Optional[List[SymExpr]]:
+    """
+    :return: Subscripts as SymExpr or None if any of them is indirect (contains an array reference, a function call
+        or a pointer dereference)
+    """
+    try:
+        return [to_sym_expr(sub) for sub in subscripts]
+    except ValueError:
+        return None
+
+
+def counter_coefficient(expr: SymExpr, counter: str) -> Optional[int]:
+    """
+    :return: Coefficient of counter in expr, 0 if it does not depend on counter or None if it is not linear in it
+    """
+    coef = 0
+    for monomial, c in expr.terms:
+        if monomial == (counter,):
+            coef += c
+        elif counter in SymExpr({monomial: 1}).symbols():
+            return None
+    return coef
+
+
+def classify_stride(exprs: Optional[List[SymExpr]], counter: Optional[str]) -> str:
+    """
+    Classifies an array reference by the distance between the elements accessed in consecutive iterations of the
+    innermost loop:
+        unit - only the last subscript depends on the counter, with coefficient 1 or -1 (e.g. A[i][j] in j loop)
+        non_unit - only the last subscript depends on the counter, with another coefficient (e.g. A[2*j])
+        column - another subscript depends on the counter, i.e. every iteration accesses a different row (A[j][i])
+        invariant - the reference does not depend on the counter (e.g. A[i] in j loop)
+        indirect - the subscripts cannot be analysed (e.g. A[B[j]]) or the loop counter is unknown
+
+    :param exprs: Subscripts (None if indirect, see subscript_exprs)
+    :param counter: Counter of the innermost loop
+    """
+    if exprs is None or counter is None:
+        return 'indirect'
+
+    coefs = [counter_coefficient(e, counter) for e in exprs]
+
+    if all(c == 0 for c in coefs):
+        return 'invariant'
+    if any(c != 0 for c in coefs[:-1]):
+        return 'column'
+    if coefs[-1] in (1, -1):
+        return 'unit'
+    return 'non_unit'
+
+
+def reuse_distance(exprs: List[SymExpr], counters: Tuple) -> Optional[int]:
+    """
+    Estimates the reuse distance of an array reference, i.e. after how many iterations the same element is accessed
+    again. The reuse is carried by the innermost loop whose counter does not appear in the subscripts. The distance
+    is returned as the number of loops inside it - the number of accesses between reuses grows as N^distance.
+
+    Example: A[i][k] in loops (i, j, k) -> 1 (reused in every iteration of j, after N iterations of k)
+    :return: Reuse distance or None if the reference has no temporal reuse
+    """
+    symbols = set()
+    for e in exprs:
+        symbols.update(e.symbols())
+
+    for distance, counter in enumerate(reversed(counters)):
+        if counter is not None and counter not in symbols:
+            return distance
+    return None
+
+
+def access_pattern_features(items: List[c_ast.Node]) -> Dict[str, float]:
+    """
+    Describes the memory access patterns of the innermost loops in given statements.
+    :param items: Statements of the measured region
+    :return: Dict: feature name (see ACCESS_FEATURES) -> value
+    """
+    strides = Counter()
+    distances = []
+    group_reuse = 0
+    no_reuse = 0
+
+    for counters, body in innermost_bodies(items):
+        accesses = []
+        collector = ArrayAccessCollector(accesses)
+        for stmt in body:
+            collector.visit(stmt)
+
+        # references with the same array and the same subscripts up to constant terms, e.g. c[j] and c[j+1]
+        groups = Counter()
+
+        for arr, subscripts in accesses:
+            exprs = subscript_exprs(subscripts)
+            strides[classify_stride(exprs, counters[-1])] += 1
+
+            if exprs is None:
+                no_reuse += 1
+                continue
+
+            groups[(arr, tuple(e.variable_part() for e in exprs))] += 1
+
+            distance = reuse_distance(exprs, counters)
+            if distance is None:
+                no_reuse += 1
+            else:
+                distances.append(distance)
+
+        group_reuse += sum(n - 1 for n in groups.values())
+
+    features = {'stride_' + s: strides[s] for s in STRIDES}
+    features['reuse_distance'] = round(sum(distances) / len(distances), 3) if len(distances) > 0 else -1
+    features['group_reuse'] = group_reuse
+    features['no_reuse'] = no_reuse
+    return features
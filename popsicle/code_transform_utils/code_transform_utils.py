@@ -7,11 +7,145 @@ from typing import List, Tuple
 from pycparser import c_ast
 
 from popsicle.code_transform_utils.exceptions import ParseException
-from popsicle.code_transform_utils.expr_estimator import ExprEstimator
+from popsicle.code_transform_utils.expr_estimator import ExprEstimator, MAX_OPTIONS
+
+
+# Returned by visit_<NodeClass> method of a FusableVisitor to continue traversal into the children of visited node
+VISIT_CHILDREN = True
+
+
+# noinspection PyPep8Naming
+class FusableVisitor(c_ast.NodeVisitor):
+    """
+    A NodeVisitor which never recurses by itself, so that it can be run by FusedVisitor together with other visitors
+    in a single traversal of the AST.
+
+    As in NodeVisitor, visit_<NodeClass> methods are called for matching nodes. The children of such node are only
+    visited if the method returns VISIT_CHILDREN. Nodes without a matching method are always traversed.
+    Optional leave_<NodeClass> methods are called after all children of a node have been visited.
+    """
+    def handler(self, c_ast_type_name, prefix='visit_'):
+        """
+        :return: The method handling nodes of given type (or None)
+        """
+        return getattr(self, prefix + c_ast_type_name, None)
+
+    def visit(self, node):
+        c_ast_type_name = node.__class__.__name__
+
+        try:
+            method, leave = self._handlers_cache[c_ast_type_name]
+        except AttributeError:
+            self._handlers_cache = {}
+            return self.visit(node)
+        except KeyError:
+            method, leave = self.handler(c_ast_type_name), self.handler(c_ast_type_name, 'leave_')
+            self._handlers_cache[c_ast_type_name] = (method, leave)
+
+        if method is None or method(node) is VISIT_CHILDREN:
+            for _, child in node.children():
+                self.visit(child)
+
+        if leave is not None:
+            leave(node)
+
+
+class FusedVisitor:
+    """
+    Runs multiple FusableVisitors in one traversal of the AST. Each visitor receives exactly the same calls, in the
+    same order, as if it was run separately.
+
+    An exception raised by one of the visitors does not stop the traversal - the visitor is excluded from the rest
+    of it and the exception is stored, to be re-raised with raise_error(). This way the caller can reproduce the order
+    of errors of the separate traversals.
+
+    Example:
+        fv = FusedVisitor([v1, v2])
+        fv.visit(ast)           # equivalent to: v1.visit(ast); v2.visit(ast)
+        fv.raise_error(v1)
+        fv.raise_error(v2)
+    """
+    def __init__(self, visitors):
+        self.visitors = list(visitors)
+        self.errors = {}
+        self.__handlers = {}
+
+    def raise_error(self, visitor):
+        """
+        Re-raises the exception raised by given visitor during the traversal (if any).
+        """
+        i = self.visitors.index(visitor)
+        if i in self.errors:
+            raise self.errors[i]
+
+    def visit(self, node):
+        self.__visit(node, list(range(len(self.visitors))))
+
+    # PRIVATE MEMBERS
+
+    def __get_handlers(self, c_ast_type_name):
+        """
+        :return: Dict: visitor index -> (visit method, leave method), only for visitors handling given node type
+        """
+        handlers = self.__handlers.get(c_ast_type_name)
+
+        if handlers is None:
+            handlers = {}
+            for i, v in enumerate(self.visitors):
+                visit, leave = v.handler(c_ast_type_name), v.handler(c_ast_type_name, 'leave_')
+                if visit is not None or leave is not None:
+                    handlers[i] = (visit, leave)
+            self.__handlers[c_ast_type_name] = handlers
+
+        return handlers
+
+    def __visit(self, node, active):
+        """
+        :param active: Indices of visitors which should visit this node
+        """
+        handlers = self.__get_handlers(node.__class__.__name__)
+        leaving = []
+
+        if len(handlers) == 0:
+            # the most common case - nobody is interested in this node
+            descending = active
+        else:
+            descending = []
+
+            for i in active:
+                if i not in handlers:
+                    descending.append(i)
+                    continue
+
+                visit, leave = handlers[i]
+
+                try:
+                    if visit is None or visit(node) is VISIT_CHILDREN:
+                        descending.append(i)
+                except Exception as e:
+                    self.errors[i] = e
+                    continue
+
+                if leave is not None:
+                    leaving.append(i)
+
+        for _, child in node.children():
+            if len(self.errors) > 0:
+                descending = [i for i in descending if i not in self.errors]
+            if len(descending) == 0:
+                break
+            self.__visit(child, descending)
+
+        for i in leaving:
+            if i not in self.errors:
+                try:
+                    handlers[i][1](node)
+                except Exception as e:
+                    self.errors[i] = e
 
 
 # noinspection PyPep8Naming
-class ArrayDeclVisitor(c_ast.NodeVisitor):
+class ArrayDeclVisitor(FusableVisitor):
     """
     Used to determine arrays' sizes and data types.
     Arrays declared as pointers with asterisk syntax are handled by PtrDeclVisitor.
@@ -63,13 +197,13 @@ class ArrayDeclToPtrVisitor(c_ast.NodeVisitor):
 
 
 # noinspection PyPep8Naming
-class ArrayRefVisitor(c_ast.NodeVisitor):
+class ArrayRefVisitor(FusableVisitor):
     """
     For each array, the references are collected to approximate its maximal size.
 
     Attributes:
-        refs: Dict[str,Set[str]] - array name -> encountered references
-        maxs: Dict[str,Set[str]] - variable name -> possible maximal values
+        refs: Dict[str,Set[SymExpr]] - array name -> encountered references
+        maxs: Dict[str,Set[SymExpr]] - variable name -> possible maximal values
 
     Example:
         Input:
@@ -78,9 +212,10 @@ class ArrayRefVisitor(c_ast.NodeVisitor):
         Output:
             refs: {'A': {'N', 'N+1', '42'}}
     """
-    def __init__(self, refs, maxs):
+    def __init__(self, refs, maxs, max_options=MAX_OPTIONS, stats=None):
         self.refs = refs
         self.maxs = maxs
+        self.estimator = ExprEstimator(max_options=max_options, stats=stats)
 
     def visit_ArrayRef(self, node):
         sub = node.subscript
@@ -89,7 +224,7 @@ class ArrayRefVisitor(c_ast.NodeVisitor):
         refs = [{sub}]
 
         while type(node.name) is c_ast.ArrayRef:
-            s_eval = ExprEstimator().estimate(node.name.subscript)
+            s_eval = self.estimator.estimate(node.name.subscript)
             if len(s_eval) > 0:
                 refs.insert(0, s_eval)
             node = node.name
@@ -104,7 +239,7 @@ class ArrayRefVisitor(c_ast.NodeVisitor):
 
 
 # noinspection PyPep8Naming
-class AssignmentVisitor(c_ast.NodeVisitor):
+class AssignmentVisitor(FusableVisitor):
     """
     Finds all variable assignments, treating their right sides as possible maximal values.
     The result is appended to existing maxs. Refs remain unchanged.
@@ -112,8 +247,8 @@ class AssignmentVisitor(c_ast.NodeVisitor):
         (see Example 2)
 
     Attributes:
-        refs: Dict[str,Set[str]] - array name -> encountered references
-        maxs: Dict[str,Set[str]] - variable name -> possible maximal values
+        refs: Dict[str,Set[SymExpr]] - array name -> encountered references
+        maxs: Dict[str,Set[SymExpr]] - variable name -> possible maximal values
 
     Example 1:
         Input:
@@ -133,9 +268,11 @@ class AssignmentVisitor(c_ast.NodeVisitor):
         Output:
             maxs: {'i': {'N', '0'}, 'j': {'M', 'N', '0'}}
     """
-    def __init__(self, refs, maxs):
+    def __init__(self, refs, maxs, max_options=MAX_OPTIONS, stats=None):
         self.refs = refs
         self.maxs = maxs
+        self.max_options = max_options
+        self.stats = stats
 
     def visit_Assignment(self, node):
         if node.op == '=':
@@ -143,7 +280,8 @@ class AssignmentVisitor(c_ast.NodeVisitor):
             right = node.rvalue
 
             if type(left) is c_ast.ID:
-                right_est = ExprEstimator(self.maxs).estimate(right)
+                # maxs change after each assignment, so the estimations cannot be reused
+                right_est = ExprEstimator(self.maxs, max_options=self.max_options, stats=self.stats).estimate(right)
                 if len(right_est) > 0:
                     if left.name in self.maxs:
                         self.maxs[left.name].update(right_est)
@@ -215,7 +353,7 @@ class DeclRemoveModifiersVisitor(c_ast.NodeVisitor):
 
 
 # noinspection PyPep8Naming
-class ForDepthCounter(c_ast.NodeVisitor):
+class ForDepthCounter(FusableVisitor):
     """
     Determines the maximal depth of nested for loops.
 
@@ -237,10 +375,13 @@ class ForDepthCounter(c_ast.NodeVisitor):
         self.result = depth
 
     def visit_For(self, node):
-        # node.show()
-        fdc = ForDepthCounter(self.depth + 1)
-        fdc.visit(node.stmt)
-        self.result = max(self.result, fdc.result)
+        self.depth += 1
+        self.result = max(self.result, self.depth)
+        return VISIT_CHILDREN
+
+    # noinspection PyUnusedLocal
+    def leave_For(self, node):
+        self.depth -= 1
 
 
 # noinspection PyPep8Naming,PyMethodMayBeStatic
@@ -274,12 +415,12 @@ class ForPragmaUnrollVisitor(c_ast.NodeVisitor):
 
 
 # noinspection PyPep8Naming
-class ForVisitor(c_ast.NodeVisitor):
+class ForVisitor(FusableVisitor):
     """
     Inspects for loops conditions to determine the maximal values of counter variables.
 
     Attributes:
-        maxs: Dict[str,Set[str]] - [variable name] -> [set of possible maximal values]
+        maxs: Dict[str,Set[SymExpr]] - [variable name] -> [set of possible maximal values]
         bounds: Set[str] - names of the variables needed to determine loop bounds. These variables are meant to be
             specified at compilation time.
 
@@ -290,9 +431,10 @@ class ForVisitor(c_ast.NodeVisitor):
             maxs: {'i': {'N+1'}}
             bounds: {'N'}
     """
-    def __init__(self, maxs, bounds):
+    def __init__(self, maxs, bounds, max_options=MAX_OPTIONS, stats=None):
         self.maxs = maxs
         self.bounds = bounds
+        self.estimator = ExprEstimator(max_options=max_options, stats=stats)
 
     def visit_For(self, node):
         nxt = node.next
@@ -310,7 +452,7 @@ class ForVisitor(c_ast.NodeVisitor):
 
         counter = cond.left
         bound = cond.right
-        bound_eval = ExprEstimator().estimate(bound)
+        bound_eval = self.estimator.estimate(bound)
 
         if type(counter) is not c_ast.ID:
             return
@@ -325,11 +467,11 @@ class ForVisitor(c_ast.NodeVisitor):
         for nxt in id_visitor.names:
             self.bounds.add(nxt)
 
-        c_ast.NodeVisitor.generic_visit(self, node)
+        return VISIT_CHILDREN
 
 
 # noinspection PyPep8Naming,PyPep8Naming
-class FuncDefFindVisitor(c_ast.NodeVisitor):
+class FuncDefFindVisitor(FusableVisitor):
     """
     Finds the declaration node of specified function
     """
@@ -358,8 +500,108 @@ class IDVisitor(c_ast.NodeVisitor):
         c_ast.NodeVisitor.generic_visit(self, node)
 
 
+class NodeCollector(FusableVisitor):
+    """
+    Collects all nodes of given types in the order of traversal. The children of collected nodes are not visited.
+    Useful to defer processing of some nodes until a FusedVisitor traversal is finished.
+
+    Attributes:
+        nodes: List[c_ast.Node] - collected nodes
+    """
+    def __init__(self, c_ast_type_names):
+        self.c_ast_type_names = set(c_ast_type_names)
+        self.nodes = []
+
+    def handler(self, c_ast_type_name, prefix='visit_'):
+        if prefix == 'visit_' and c_ast_type_name in self.c_ast_type_names:
+            return self.nodes.append
+        return None
+
+
+# Categories of operations counted by OpCountVisitor
+OP_CATEGORIES = {
+    '+': 'add', '-': 'add', 'p++': 'add', '++': 'add', 'p--': 'add', '--': 'add',
+    '*': 'mul',
+    '/': 'div', '%': 'div',
+    '<': 'cmp', '>': 'cmp', '<=': 'cmp', '>=': 'cmp', '==': 'cmp', '!=': 'cmp',
+    '&&': 'logic', '||': 'logic', '!': 'logic',
+    '&': 'bitwise', '|': 'bitwise', '^': 'bitwise', '<<': 'bitwise', '>>': 'bitwise', '~': 'bitwise',
+}
+
+
 # noinspection PyPep8Naming
-class PtrDeclVisitor(c_ast.NodeVisitor):
+class OpCountVisitor(FusableVisitor):
+    """
+    Counts operations (by category, see OP_CATEGORIES), function calls and array accesses in a fragment of code.
+    A multidimensional reference (e.g. A[i][j]) is a single access. Compound assignments (e.g. A[i] += x) count as
+    both a load and a store.
+
+    Attributes:
+        counts: Counter - category -> number of operations, 'call', 'load' and 'store' -> number of calls/accesses
+
+    Example:
+        Input:
+            code: 'A[i][j] = B[i] * 2 + f(x);'
+        Output:
+            counts: {'store': 1, 'load': 1, 'mul': 1, 'add': 1, 'call': 1}
+    """
+    def __init__(self, counts):
+        self.counts = counts
+
+    def visit_ArrayRef(self, node):
+        self.counts['load'] += 1
+        self.__visit_subscripts(node)
+
+    def visit_Assignment(self, node):
+        if node.op != '=':
+            self.__count_op(node.op[:-1])
+
+        if type(node.lvalue) is c_ast.ArrayRef:
+            self.counts['store'] += 1
+            if node.op != '=':
+                self.counts['load'] += 1
+            self.__visit_subscripts(node.lvalue)
+        else:
+            self.visit(node.lvalue)
+
+        self.visit(node.rvalue)
+
+    def visit_BinaryOp(self, node):
+        self.__count_op(node.op)
+        return VISIT_CHILDREN
+
+    # noinspection PyUnusedLocal
+    def visit_FuncCall(self, node):
+        self.counts['call'] += 1
+        if node.args is not None:
+            self.visit(node.args)
+
+    def visit_UnaryOp(self, node):
+        if node.op == '*':
+            # dereference, not a multiplication
+            self.counts['load'] += 1
+        elif node.op != '&':
+            self.__count_op(node.op)
+
+        if node.op in ('p++', '++', 'p--', '--') and type(node.expr) is c_ast.ArrayRef:
+            self.counts['store'] += 1
+
+        return VISIT_CHILDREN
+
+    # PRIVATE MEMBERS
+
+    def __count_op(self, op):
+        if op in OP_CATEGORIES:
+            self.counts[OP_CATEGORIES[op]] += 1
+
+    def __visit_subscripts(self, node):
+        while type(node) is c_ast.ArrayRef:
+            self.visit(node.subscript)
+            node = node.name
+
+
+# noinspection PyPep8Naming
+class PtrDeclVisitor(FusableVisitor):
     """
     Used to determine the arrays data types.
     This visitor handles pointers declarations only. For bracket syntax declarations see ArrayDeclVisitor.
@@ -449,7 +691,7 @@ class SingleToCompoundVisitor(c_ast.NodeVisitor):
 
 
 # noinspection PyPep8Naming
-class StructVisitor(c_ast.NodeVisitor):
+class StructVisitor(FusableVisitor):
     """
     Determines if the code contains struct. Structs are not supported during some code generation tasks - in such case,
     the program will be skipped.
@@ -463,7 +705,7 @@ class StructVisitor(c_ast.NodeVisitor):
 
 
 # noinspection PyPep8Naming
-class VarTypeVisitor(c_ast.NodeVisitor):
+class VarTypeVisitor(FusableVisitor):
     """
     Used to determine the variables data types.
 
@@ -485,6 +727,10 @@ def build_decl(var_name: str, var_type: str) -> c_ast.Decl:
     return c_ast.Decl(var_name, [], [], [], type_decl, None, None)
 
 
+# Size of a pointer in the generated code (used to estimate the size of allocated memory)
+POINTER_SIZE = 8
+
+
 def dtype_size(dtype):
     dtype = dtype.split(' ')[-1]    # signed, unsigned etc
 
@@ -1,7 +1,20 @@
+from collections import namedtuple
+from typing import Iterable, Tuple, Iterator
 from pycparser import c_generator
 from popsicle.code_transform_utils.code_transformer_ast import CodeTransformerAST
 from popsicle.code_transform_utils.code_transformer_str import CodeTransformerStr
-from popsicle.code_transform_utils.code_transform_utils import remove_comments
+from popsicle.code_transform_utils.code_transform_utils import remove_comments, split_code
+from popsicle.code_transform_utils.shared_parser import get_parser
+from popsicle.utils import time_limit, profile_stage, StageProfiler
+
+# Should be increased whenever a change in the transformation affects its output (invalidates TransformCache)
+TRANSFORMER_VERSION = 8
+
+# A result of CodeTransformer.transform_many(). If the transformation failed, error contains the exception and all
+# other fields (except name and profile) are None. profile is a list of StageProfiler records (or None if disabled).
+TransformResult = namedtuple('TransformResult',
+                             ['name', 'code', 'max_param', 'max_arr_dim', 'loop_depth', 'bounds', 'trip_counts',
+                              'static_features', 'access_features', 'profile', 'error'])
 
 
 class CodeTransformer:
@@ -17,8 +30,15 @@ class CodeTransformer:
                  rename_bounds=False,
                  add_pragma_unroll=False,
                  gen_mallocs=False,
+                 malloc_layout='pointers',
+                 huge_pages=False,
+                 initialiser='rand',
+                 seed=0,
                  modifiers_to_remove=None,
                  verbose=False,
+                 parser=None,
+                 generator=None,
+                 profiler=None,
                  ):
 
         if modifiers_to_remove is None:
@@ -34,52 +54,121 @@ class CodeTransformer:
         self.rename_bounds = rename_bounds
         self.add_pragma_unroll = add_pragma_unroll
         self.gen_mallocs = gen_mallocs
+        self.malloc_layout = malloc_layout
+        self.huge_pages = huge_pages
+        self.initialiser = initialiser
+        self.seed = seed
         self.main_name = main_name
         self.modifiers_to_remove = modifiers_to_remove
         self.verbose = verbose
+        self.parser = parser
+        self.generator = generator
+        self.profiler = profiler
 
         self.pp = None
         self.max_param = None
         self.max_arr_dim = None
         self.loop_depth = None
+        self.trip_counts = None
+        self.static_features = None
+        self.access_features = None
 
     def transform(self, return_mode='all'):
-        self.__run_preprocessing()
+        with profile_stage(self.profiler, 'preprocessing'):
+            self.__run_preprocessing()
         self.__run_parser(return_mode)
-        self.__run_str_transform()
+        with profile_stage(self.profiler, 'str_transform'):
+            self.__run_str_transform()
 
         return self.code
 
+    @classmethod
+    def transform_many(cls,
+                       sources: Iterable[Tuple[str, str]],
+                       timeout: float=None,
+                       profile: bool=False,
+                       **options) -> Iterator[TransformResult]:
+        """
+        Transforms a stream of programs, yielding a TransformResult for each of them as soon as it is ready.
+        The parser and the C generator are shared by all transformations and no result is retained after it has been
+        yielded, so any number of sources can be processed in constant memory (if sources is lazy as well).
+        A failure of a single program does not stop the processing - the exception is reported in its result instead.
+
+        :param sources: Iterable of pairs (name, source code). Source code is split with split_code().
+        :param timeout: Time limit (in seconds) for transforming a single program (see time_limit)
+        :param profile: If enabled, the time and memory of each stage are recorded in TransformResult.profile
+        :param options: CodeTransformer constructor parameters (except includes and code)
+        """
+        if options.get('parser') is None:
+            options['parser'] = get_parser()
+        if options.get('generator') is None:
+            options['generator'] = c_generator.CGenerator()
+
+        for name, source in sources:
+            profiler = StageProfiler() if profile else None
+            records = profiler.records if profile else None
+
+            try:
+                with time_limit(timeout):
+                    with profile_stage(profiler, 'split_code'):
+                        includes, code = split_code(source)
+                    ct = cls(includes=includes, code=code, profiler=profiler, **options)
+                    code = ct.transform()
+            except Exception as e:
+                yield TransformResult(name, None, None, None, None, None, None, None, None, records, e)
+                continue
+
+            yield TransformResult(name, code, ct.max_param, ct.max_arr_dim, ct.loop_depth, sorted(ct.pp.bounds),
+                                  ct.trip_counts, ct.static_features, ct.access_features, records, None)
+
     # PRIVATE MEMBERS
 
     def __run_preprocessing(self):
         self.code = remove_comments(self.code)
 
     def __run_parser(self, return_mode='all'):
-        pp = CodeTransformerAST(self.code, self.verbose, not self.gen_mallocs, main_name=self.main_name)
-        pp.single_to_compound()
-        pp.remove_modifiers(self.modifiers_to_remove)
-        pp.add_papi(self.papi_scope)
+        with profile_stage(self.profiler, 'parse'):
+            pp = CodeTransformerAST(self.code, self.verbose, not self.gen_mallocs, main_name=self.main_name,
+                                    parser=self.parser)
+
+        with profile_stage(self.profiler, 'prepare'):
+            pp.single_to_compound()
+            pp.remove_modifiers(self.modifiers_to_remove)
+            pp.add_papi(self.papi_scope)
 
         if self.gen_mallocs:
-            pp.analyse()
+            with profile_stage(self.profiler, 'analyse'):
+                pp.analyse()
 
-            self.max_param, self.max_arr_dim, self.loop_depth = pp.find_max_param()
+            with profile_stage(self.profiler, 'find_max_param'):
+                self.max_param, self.max_arr_dim, self.loop_depth = pp.find_max_param()
 
-            pp.arr_to_ptr_decl()
-            pp.gen_mallocs()
-            
-            if not self.rename_bounds:
-                pp.remove_bound_decls()
+            with profile_stage(self.profiler, 'features'):
+                self.trip_counts = pp.find_trip_counts()
+                self.static_features = pp.find_static_features(self.trip_counts)
+                self.access_features = pp.find_access_features()
 
-        if self.add_pragma_unroll:
-            pp.add_pragma_unroll()
+            with profile_stage(self.profiler, 'gen_mallocs'):
+                pp.arr_to_ptr_decl()
+                pp.gen_mallocs(self.malloc_layout, self.initialiser)
 
-        if self.rename_bounds:
-            pp.rename_bounds()
+                if not self.rename_bounds:
+                    pp.remove_bound_decls()
+        else:
+            # access patterns need no analysis, so they are available for user programs (see popsicle-predict.sh)
+            with profile_stage(self.profiler, 'features'):
+                self.access_features = pp.find_access_features()
+
+        with profile_stage(self.profiler, 'rename'):
+            if self.add_pragma_unroll:
+                pp.add_pragma_unroll()
+
+            if self.rename_bounds:
+                pp.rename_bounds()
 
-        generator = c_generator.CGenerator()
-        self.code = generator.visit(pp.main if return_mode == 'main' else pp.ast)
+        with profile_stage(self.profiler, 'generate'):
+            generator = self.generator if self.generator is not None else c_generator.CGenerator()
+            self.code = generator.visit(pp.main if return_mode == 'main' else pp.ast)
         self.pp = pp
 
     def __run_str_transform(self):
@@ -94,4 +183,10 @@ class CodeTransformer:
         if self.gen_mallocs:
             pt.add_max_macro()
 
+            if self.malloc_layout == 'flat':
+                pt.add_huge_pages_macro(self.huge_pages)
+
+            if self.initialiser == 'fast':
+                pt.add_rand_seed_macro(self.seed)
+
         self.code = pt.includes + pt.code
@@ -1,32 +1,46 @@
+from collections import Counter, defaultdict
 from typing import Iterable
-from pycparser import c_ast, c_parser
-from popsicle.code_transform_utils.expr_estimator import ExprEstimator, remove_non_extreme_numbers
+from pycparser import c_ast
+from popsicle.code_transform_utils.access_patterns import access_pattern_features
+from popsicle.code_transform_utils.shared_parser import get_parser
+from popsicle.code_transform_utils.expr_estimator import ExprEstimator, MAX_OPTIONS
 from popsicle.code_transform_utils.malloc_builder import MallocBuilder
+from popsicle.code_transform_utils.sym_expr import keep_max_constants, remove_dominated
+from popsicle.code_transform_utils.static_features import extract_static_features
+from popsicle.code_transform_utils.trip_count import loop_nest_trip_counts
 from popsicle.code_transform_utils.code_transform_utils import ArrayRefVisitor, ForVisitor, AssignmentVisitor, \
     PtrDeclVisitor, StructVisitor, ArrayDeclVisitor, VarTypeVisitor, ForPragmaUnrollVisitor, \
     DeclRemoveModifiersVisitor, FuncDefFindVisitor, CompoundInsertNextToVisitor, ForDepthCounter, \
     SingleToCompoundVisitor, ParseException, ReturnIntVisitor, ArrayDeclToPtrVisitor, papi_instr, pragma_unroll, \
-    loop_func_params, RemoveBoundDeclsVisitor, dtype_size
+    loop_func_params, RemoveBoundDeclsVisitor, dtype_size, FusedVisitor, NodeCollector, POINTER_SIZE
 import math
 
+# Parameters are assigned to int variables (and read with atoi on runtime), so they cannot exceed INT_MAX
+INT_MAX = 2 ** 31 - 1
+
 
 class CodeTransformerAST:
-    def __init__(self, code, verbose=False, allow_struct=False, main_name='main'):
+    def __init__(self, code, verbose=False, allow_struct=False, main_name='main', parser=None):
         self.maxs = {}
         self.refs = {}
         self.dims = {}
         self.dtypes = {}
         self.bounds = set()
+        self.for_depth = None
         self.verbose = verbose
 
         self.memory_limit = 200000000
         self.n_iter_limit = 20000000000
+        self.max_options = MAX_OPTIONS
+        self.estimator_stats = Counter()
 
-        astparser = c_parser.CParser()
+        astparser = parser if parser is not None else get_parser()
         self.ast = astparser.parse(code)
 
         ffv = FuncDefFindVisitor(main_name)
-        ffv.visit(self.ast)
+        sv = StructVisitor()
+        FusedVisitor([ffv] if allow_struct else [ffv, sv]).visit(self.ast)
+
         if ffv.res is not None:
             self.main = ffv.res
         else:
@@ -35,11 +49,8 @@ class CodeTransformerAST:
         if verbose:
             self.ast.show()
 
-        if not allow_struct:
-            sv = StructVisitor()
-            sv.visit(self.ast)
-            if sv.contains_struct:
-                raise ParseException('Skipping - file contains struct')
+        if not allow_struct and sv.contains_struct:
+            raise ParseException('Skipping - file contains struct')
 
     def rename_bounds(self):
         """
@@ -47,7 +58,7 @@ class CodeTransformerAST:
         The actual values should be injected at compilation time (-D option in gcc)
         """
         inits = [c_ast.Assignment('=', c_ast.ID(n), c_ast.ID('PARAM_' + n.upper()))
-                 for n in self.bounds]
+                 for n in sorted(self.bounds)]
         self.main.body.block_items[0:0] = inits
 
     def add_papi(self, scope):
@@ -91,24 +102,50 @@ class CodeTransformerAST:
             bounds
             maxs
             refs
+            dtypes
+            dims
+            for_depth
+
+        All visitors are run in a single traversal of the AST (see FusedVisitor). The results are the same as if they
+        were run one by one in the following order:
+            ForVisitor, AssignmentVisitor, ArrayRefVisitor, PtrDeclVisitor, ArrayDeclVisitor, VarTypeVisitor
         """
-        ForVisitor(self.maxs, self.bounds).visit(self.ast)
-        AssignmentVisitor(self.refs, self.maxs).visit(self.ast)
+        ptr_dtypes = {}
+        arr_dtypes = {}
+        var_dtypes = {}
+
+        fv = ForVisitor(self.maxs, self.bounds, self.max_options, self.estimator_stats)
+        assignments = NodeCollector(['Assignment'])
+        arv = ArrayRefVisitor(self.refs, self.maxs, self.max_options, self.estimator_stats)
+        pdv = PtrDeclVisitor(ptr_dtypes)
+        adv = ArrayDeclVisitor(arr_dtypes, self.dims)
+        vtv = VarTypeVisitor(var_dtypes)
+        fdc = ForDepthCounter(0)
+
+        fused = FusedVisitor([fv, assignments, arv, pdv, adv, vtv, fdc])
+        fused.visit(self.ast)
+        fused.raise_error(fv)
+
+        # AssignmentVisitor relies on maxs found by ForVisitor in the whole code, so it has to be deferred
+        av = AssignmentVisitor(self.refs, self.maxs, self.max_options, self.estimator_stats)
+        for node in assignments.nodes:
+            av.visit(node)
 
         for var in self.maxs:
-            self.maxs[var] = set(remove_non_extreme_numbers(self.maxs[var]))
+            self.maxs[var] = keep_max_constants(self.maxs[var])
 
-        ArrayRefVisitor(self.refs, self.maxs).visit(self.ast)
+        fused.raise_error(arv)
 
         for arr in self.refs:
-            new_refs = []
-            for ref in self.refs[arr]:
-                new_refs.append(ExprEstimator(self.maxs, arr).estimate(ref))
-            self.refs[arr] = new_refs
+            estimator = ExprEstimator(self.maxs, arr, self.max_options, self.estimator_stats)
+            self.refs[arr] = [remove_dominated(estimator.estimate(ref)) for ref in self.refs[arr]]
 
-        PtrDeclVisitor(self.dtypes).visit(self.ast)
-        ArrayDeclVisitor(self.dtypes, self.dims).visit(self.ast)
-        VarTypeVisitor(self.dtypes).visit(self.ast)
+        # each visitor overwrites data types found by the previous ones
+        for visitor, dtypes in ((pdv, ptr_dtypes), (adv, arr_dtypes), (vtv, var_dtypes)):
+            fused.raise_error(visitor)
+            self.dtypes.update(dtypes)
+
+        self.for_depth = fdc.result
 
         self.bounds.difference_update(self.refs.keys())
 
@@ -124,7 +161,9 @@ class CodeTransformerAST:
     def find_max_param(self):
         """
         Attempts to find the maximal value of program parameters. The upper bound is either imposed by limited memory
-        (based on arrays dimensionality and their number) or loop count (based on for loop depth)
+        (based on the estimated sizes of all arrays) or loop count (based on for loop depth). It never exceeds INT_MAX.
+        If the sizes of the arrays do not grow with the parameter, the rough bound assuming max_arr_dim-dimensional
+        arrays of size param is used instead.
 
         if multiple parameters are present, all are assumed to be equal.
         :return: The maximal parameter
@@ -133,6 +172,10 @@ class CodeTransformerAST:
             raise ParseException('No refs found - cannot determine max_arr_dim')
 
         max_arr_dim = max([len(refs) for refs in self.refs.values()])
+
+        if not any(self.__is_array(var) for var in self.dtypes):
+            raise ParseException('Data types of arrays not found - cannot determine memory usage')
+
         max_el_size = max([dtype_size(dtype) for var, dtype in self.dtypes.items() if self.__is_array(var)])
         arr_count = len(self.refs)
 
@@ -143,18 +186,40 @@ class CodeTransformerAST:
             1 / max_arr_dim
         )
 
-        max_param_loop = math.pow(
+        max_param_loop = int(math.pow(
             self.n_iter_limit,
             1 / loop_depth
-        )
-        max_param = int(min(max_param_arr, max_param_loop))
+        ))
+
+        # a rough bound, assuming that every array has max_arr_dim dimensions of size param
+        static_max_param = min(int(min(max_param_arr, max_param_loop)), INT_MAX)
+
+        if self.__memory_usage(max_param_loop) <= self.memory_limit:
+            # the sizes do not grow with the parameter (e.g. A[i % 1000]) or they are not evaluated (Opaque options)
+            return static_max_param, max_arr_dim, loop_depth
+
+        # memory usage grows with the parameter, so the greatest value within the limit can be found by bisection
+        low, high = 0, max_param_loop
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.__memory_usage(mid) <= self.memory_limit:
+                low = mid
+            else:
+                high = mid - 1
+        max_param = min(low, INT_MAX)
 
         return max_param, max_arr_dim, loop_depth
 
-    def gen_mallocs(self):
+    def gen_mallocs(self, layout='pointers', initialiser='rand'):
         """
-        Generates code responsible for array allocation and initialisation
+        Generates code responsible for array allocation and initialisation.
+        The code is guarded by popsicle_init_needed() (see papi_utils.c), so that exec_loop can execute the measured
+        region several times in one process, initialising the arrays again only if needed.
+        :param layout: Memory layout of multidimensional arrays (see MallocBuilder)
+        :param initialiser: Initialisation of array elements (see MallocBuilder)
         """
+        items = []
+
         for arr in self.refs:
             ref = self.refs[arr]
 
@@ -163,8 +228,41 @@ class CodeTransformerAST:
                     raise ParseException('Unknown dimensions of array ' + arr)
 
             if arr in self.dtypes:
-                mb = MallocBuilder(arr, self.dtypes[arr], ref)
-                self.main.body.block_items[0:0] = mb.generate()
+                mb = MallocBuilder(arr, self.dtypes[arr], ref, initialiser=initialiser, layout=layout)
+                items[0:0] = mb.generate()
+
+        if len(items) > 0:
+            init_needed = c_ast.FuncCall(c_ast.ID('popsicle_init_needed'), c_ast.ExprList([]))
+            self.main.body.block_items.insert(0, c_ast.If(init_needed, c_ast.Compound(items), None))
+
+    def find_access_features(self):
+        """
+        Classifies the array references in the innermost loops of the measured region by their stride and estimates
+        their reuse distance (see access_pattern_features).
+        :return: Dict: feature name -> value
+        """
+        return access_pattern_features(self.__measured_region())
+
+    def find_static_features(self, trip_counts=None):
+        """
+        Describes the program with features which do not require its execution (see extract_static_features).
+        Should be called after analyse().
+        :param trip_counts: Result of find_trip_counts() (computed again if not provided)
+        :return: Dict: feature name -> value
+        """
+        if trip_counts is None:
+            trip_counts = self.find_trip_counts()
+
+        return extract_static_features(self.__measured_region(), self.refs, self.dtypes, self.__for_depth(),
+                                       trip_counts)
+
+    def find_trip_counts(self):
+        """
+        Determines the trip counts of all loop nests in the measured region (see __measured_region), as functions of
+        the program parameters (PARAM_*). Should be called after analyse() and before gen_mallocs().
+        :return: List of TripCount (None for the nests which cannot be analysed)
+        """
+        return loop_nest_trip_counts(self.__measured_region(), {b: 'PARAM_' + b.upper() for b in self.bounds})
 
     def print_debug_info(self):
         print('maxs: ', self.maxs)
@@ -172,6 +270,7 @@ class CodeTransformerAST:
         print('refs: ', self.refs)
         print('dtypes: ', self.dtypes)
         print('dims: ', self.dims)
+        print('estimator stats: ', dict(self.estimator_stats))
 
     def remove_bound_decls(self):
         """
@@ -218,6 +317,9 @@ class CodeTransformerAST:
         Finds the maximal depth of nested for loops.
         :return: Max depth
         """
+        if self.for_depth is not None:
+            return self.for_depth
+
         fdc = ForDepthCounter(0)
         fdc.visit(self.ast)
         return fdc.result
@@ -225,6 +327,59 @@ class CodeTransformerAST:
     def __is_array(self, var_name):
         return var_name in self.refs
 
+    def __memory_usage(self, param):
+        """
+        Estimates the number of bytes allocated by the code generated by gen_mallocs(), assuming that all program
+        parameters are equal to param.
+        In both layouts of MallocBuilder, the tables of pointers to the rows of the next dimension are allocated
+        together with the elements, so they are included as well (the alignment padding of the flat layout is not).
+        """
+        values = defaultdict(lambda: param)
+        usage = 0
+
+        for arr, ref in self.refs.items():
+            if arr not in self.dtypes:
+                continue
+
+            cells = 1
+            for depth, dim_size in enumerate(ref):
+                cells *= max(self.__eval_size(dim_size, values, param), 0) + 2
+                el_size = dtype_size(self.dtypes[arr]) if depth == len(ref) - 1 else POINTER_SIZE
+                usage += cells * el_size
+
+        return usage
+
+    @staticmethod
+    def __eval_size(dim_size, values, default):
+        """
+        :return: The maximum of dim_size options evaluated with given values of parameters or default if none of the
+            options can be evaluated
+        """
+        evaluated = []
+        for option in dim_size:
+            try:
+                evaluated.append(option.evaluate(values))
+            except (ZeroDivisionError, ValueError, KeyError):
+                pass
+
+        return max(evaluated) if len(evaluated) > 0 else default
+
+    def __measured_region(self):
+        """
+        :return: Statements of the main function between '#pragma scop' and '#pragma endscop' (or all of them if there
+            are no such pragmas)
+        """
+        items = self.main.body.block_items or []
+        pragmas = [i for i, item in enumerate(items) if type(item) is c_ast.Pragma]
+        scop = [i for i in pragmas if items[i].string == 'scop']
+        endscop = [i for i in pragmas if items[i].string == 'endscop']
+
+        if len(scop) > 0:
+            end = min([i for i in endscop if i > scop[0]] + [len(items)])
+            items = items[scop[0] + 1:end]
+
+        return items
+
     def __return_int(self):
         """
         Changes every 'return;' to 'return 0;'
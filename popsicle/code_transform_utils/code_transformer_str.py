@@ -30,6 +30,24 @@ class CodeTransformerStr:
     def add_max_macro(self):
         self.includes += '#define MAX(x, y) (((x) > (y)) ? (x) : (y))\n'
 
+    def add_huge_pages_macro(self, huge_pages=False):
+        """
+        Adds a default value of HUGE_PAGES macro, which enables huge pages for arrays allocated in the flat layout.
+        It can be overridden on compilation time (-D HUGE_PAGES=1).
+        """
+        self.includes += '#ifndef HUGE_PAGES\n'
+        self.includes += '#define HUGE_PAGES ' + ('1' if huge_pages else '0') + '\n'
+        self.includes += '#endif\n'
+
+    def add_rand_seed_macro(self, seed=0):
+        """
+        Adds a default value of RAND_SEED macro, which seeds the fast initialiser of arrays.
+        It can be overridden on compilation time (-D RAND_SEED=42).
+        """
+        self.includes += '#ifndef RAND_SEED\n'
+        self.includes += '#define RAND_SEED ' + str(int(seed)) + '\n'
+        self.includes += '#endif\n'
+
     def add_pragma_macro(self):
         """
         Adds a macro to expand PRAGMA(PRAGMA_UNROLL);
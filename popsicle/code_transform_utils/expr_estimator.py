@@ -1,123 +1,187 @@
-from typing import Set, Mapping, List, Iterable
-from pycparser import c_ast
+from collections import Counter
+from typing import Set, Mapping
+from pycparser import c_ast, c_generator
 
 from popsicle.code_transform_utils.exceptions import ParseException
+from popsicle.code_transform_utils.sym_expr import SymExpr, keep_max_constants, remove_dominated, parse_constant, \
+    upper_envelope
 
-
-def remove_non_extreme_numbers(s: Iterable[str], leave_min=True) -> Iterable[str]:
-    """
-    Removes from an iterable all numbers which are neither minimal or maximal.
-    All non-numeric elements are left untouched.
-    The order of elements might be different in the output.
-
-    Example: ['3', '6', 'N', '7'] -> ['N', '3', '7']
-    :param s: Iterable of expressions as strings
-    :param leave_min: If set to True, preserve minimal and maximum value from s. Otherwise, only maximum is preserved.
-    :return: Transformed iterable
-    """
-    max_num = float('-inf')
-    min_num = 0
-    res = []
-
-    for el in s:
-        if type(el) is str and el.isdecimal():
-            el_num = int(el)
-            min_num = min(min_num, el_num)
-            max_num = max(max_num, el_num)
-        elif el is not None:
-            res.append(el)
-
-    if max_num > 0:
-        res.append(str(max_num))
-    if leave_min and min_num > 0 and min_num != max_num:
-        res.append(str(min_num))
-
-    return res
+# Default limit of the number of options estimated for a single expression (see ExprEstimator)
+MAX_OPTIONS = 32
 
 
-def eval_basic_op(l: str, op: str, r: str) -> str:
+def expr_sort_key(expr: any) -> tuple:
     """
-    Evaluate a basic arithmetic operation
-    :param l: Left operand
-    :param op: Operator
-    :param r: Right operand
-    :return: Result or a string representing the operation if it cannot be calculated
+    A key for sorting expressions (strings or c_ast nodes) in a deterministic order.
+    Sets of expressions are iterated in an order depending on hashes, which differ between Python processes - sorting
+    them first makes the estimation reproducible.
     """
-    if l.isdecimal() and r.isdecimal():
-        l_num = int(l)
-        r_num = int(r)
-        if op == '+':
-            return str(l_num + r_num)
-        if op == '-':
-            return str(l_num - r_num)
-        if op == '*':
-            return str(l_num * r_num)
-
-    return l + op + r
+    if type(expr) is str:
+        return expr, ''
+    if type(expr) is SymExpr:
+        return str(expr), 'SymExpr'
+    return c_generator.CGenerator().visit(expr), type(expr).__name__
 
 
 class ExprEstimator:
     def __init__(self,
-                 maxs: Mapping[str, Set[str]]=None,
+                 maxs: Mapping[str, Set[SymExpr]]=None,
                  var: str=None,
-                 parent_calls: List[any]=None):
+                 max_options: int=MAX_OPTIONS,
+                 stats: Counter=None):
 
         """
         Attempts to find a set of expressions which *might* represent the maximal value of expr. The primary use of this
         function is determining the size of an array based on its uses in the code.
 
+        The results are canonical SymExpr objects, so equivalent options (e.g. N+1-1 and N) are merged. Variables are
+        replaced with their possible maximal values transitively, e.g. for maxs {'j': {i+1}, 'i': {N}} the estimation
+        of j is N+1. Of options which differ only by a constant term, only the greatest one is preserved.
+
+        The estimation of every node is memoized, so an estimator should not be used anymore after maxs have changed.
+        Cyclic dependencies (e.g. maxs {'i': {j, N}, 'j': {i}}) are cut - a variable whose estimation is in progress
+        contributes no options. The estimations depending on such a cut are partial (j estimated within i is empty),
+        so they are not memoized, unless the cut is at the memoized node itself.
+        The number of options for a single node is limited by max_options - when exceeded, options dominated by others
+        are removed (see remove_dominated) and if it's still not enough, the longest options are replaced with their
+        upper envelope (see upper_envelope), so the estimation may grow, but never miss the maximum. If the envelope
+        cannot be proven to dominate them (because of Opaque factors), ParseException is raised.
+
         :param maxs: A map containing possible upper bounds for variables
         :param var: Which variable is estimated. Used
-        :param parent_calls: History of expressions from previous recurrent calls  - prevents infinite loop
+        :param max_options: Maximal number of options estimated for a single node (None means no limit)
+        :param stats: Counter updated with statistics of estimation:
+            'memo_hits' - estimations taken from memo
+            'capped' - how many times the number of options exceeded max_options
+            'pruned' - how many options have been removed as dominated by others
+            'truncated' - how many options have been replaced with their envelope to satisfy max_options
         """
         
         self.maxs = {} if maxs is None else maxs
-        self.parent_calls = [] if parent_calls is None else parent_calls
         self.var = var
+        self.max_options = max_options
+        self.stats = Counter() if stats is None else stats
 
-    def estimate(self, expr: any) -> Set[str]:
+        self.memo = {}
+        self.in_progress = {}       # key -> depth of its estimation
+        self.cut_depth = None       # the lowest depth of an in-progress key hit by the current estimation
+
+    def estimate(self, expr: any) -> Set[SymExpr]:
         """
-        :param expr: An expression to estimate
-        :return: Set of C expressions which might evaluate to the maximal possible value of expr.
+        :param expr: An expression to estimate - c_ast node, SymExpr, variable name or a set/list of them
+        :return: Set of expressions which might evaluate to the maximal possible value of expr.
         """
-    
+
+        # multiple options (not memoized - the collection might be modified later)
+        if type(expr) is set or type(expr) is list:
+            return self.__estimate(expr)
+
+        key = expr if type(expr) is str or type(expr) is SymExpr else id(expr)
+
+        # callers are free to modify the result, so the memoized sets are always copied
+        if key in self.memo:
+            self.stats['memo_hits'] += 1
+            return set(self.memo[key])
+
         # prevent infinite loop
-        if expr in self.parent_calls:
+        if key in self.in_progress:
+            self.__cut(self.in_progress[key])
             return set()
-        self.parent_calls.append(expr)
-    
+
+        depth = len(self.in_progress)
+        outer_cut_depth, self.cut_depth = self.cut_depth, None
+        self.in_progress[key] = depth
+        try:
+            options = self.__estimate(expr)
+        finally:
+            del self.in_progress[key]
+            cut_depth, self.cut_depth = self.cut_depth, outer_cut_depth
+
+        # a cycle cut at an outer estimation makes the result partial - it is only valid within that estimation
+        if cut_depth is not None and cut_depth < depth:
+            self.__cut(cut_depth)
+        else:
+            self.memo[key] = frozenset(options)
+        return options
+
+    # PRIVATE MEMBERS
+
+    def __cut(self, depth: int):
+        if self.cut_depth is None or depth < self.cut_depth:
+            self.cut_depth = depth
+
+    def __estimate(self, expr: any) -> Set[SymExpr]:
         # multiple options => take into account all of them
         if type(expr) is set or type(expr) is list:
-            options = []
-            for e in expr:
-                options.extend(self.estimate(e))
-    
+            options = set()
+            for e in (sorted(expr, key=expr_sort_key) if type(expr) is set else expr):
+                options.update(self.estimate(e))
+
         # variable name => check maxs (possible upper bounds)
         elif type(expr) is str:
-            options = self.maxs[expr] if expr in self.maxs else [expr]
-    
+            options = self.estimate(set(self.maxs[expr])) if expr in self.maxs else {SymExpr.symbol(expr)}
+
+        # symbolic expression => estimate each variable
+        elif type(expr) is SymExpr:
+            options = expr.substitute(self.estimate)
+
         # variable => subsequent call with type(expr)=str
         elif type(expr) is c_ast.ID:
             if self.var is not None and expr.name not in self.maxs:
                 # size of an array depends on a variable whose value is unknown
                 raise ParseException(
                     'Variable-dependent array size detected: size of ' + self.var + ' depends on ' + expr.name)
-    
+
             options = self.estimate(expr.name)
-    
+
         # binary operation => try to evaluate if possible
         elif type(expr) is c_ast.BinaryOp:
             ls = self.estimate(expr.left)
             rs = self.estimate(expr.right)
-            options = [eval_basic_op(l, expr.op, r) for l in ls for r in rs]
-    
+            options = {SymExpr.binary_op(l, expr.op, r) for l in ls for r in rs}
+
         # constant => take value
         elif type(expr) is c_ast.Constant:
-            options = [expr.value]
-    
+            options = {parse_constant(expr.value)}
+
         # unsupported object
         else:
-            options = []
-    
-        options = remove_non_extreme_numbers(options)
-        return set(options)
+            options = set()
+
+        options = keep_max_constants(options)
+        return self.__limit_width(options)
+
+    def __limit_width(self, options: Set[SymExpr]) -> Set[SymExpr]:
+        """
+        Makes sure that the number of options does not exceed max_options.
+        """
+        if self.max_options is None or len(options) <= self.max_options:
+            return options
+
+        self.stats['capped'] += 1
+
+        # remove_dominated() works in quadratic time, so the number of options is reduced beforehand
+        pruned = self.__truncate(options, 2 * self.max_options)
+        pruned = remove_dominated(pruned)
+        self.stats['pruned'] += min(len(options), 2 * self.max_options) - len(pruned)
+
+        return self.__truncate(pruned, self.max_options)
+
+    def __truncate(self, options: Set[SymExpr], limit: int) -> Set[SymExpr]:
+        """
+        Preserves the first (shortest) limit-1 options and replaces the other ones with their upper envelope.
+        :raises ParseException: If the envelope does not dominate all replaced options
+        """
+        if len(options) <= limit:
+            return options
+
+        options = sorted(options, key=lambda e: (len(str(e)), str(e)))
+        kept, replaced = options[:limit - 1], options[limit - 1:]
+
+        envelope = upper_envelope(replaced)
+        if not all(envelope.dominates(e) for e in replaced):
+            raise ParseException('Too many possible sizes' + (' of ' + self.var if self.var is not None else '') +
+                                 ' to bound them safely (' + str(len(options)) + ' options)')
+
+        self.stats['truncated'] += len(replaced)
+        return set(kept) | {envelope}
@@ -1,18 +1,28 @@
+import zlib
 from typing import List
 from pycparser import c_ast
-from popsicle.code_transform_utils.code_transform_utils import exprs_prod
-from popsicle.code_transform_utils.expr_estimator import remove_non_extreme_numbers
+from popsicle.code_transform_utils.code_transform_utils import exprs_prod, exprs_sum, build_decl
+from popsicle.code_transform_utils.sym_expr import remove_dominated
+
+# 'pointers' - every row of a multidimensional array is allocated with a separate malloc
+# 'flat' - all elements are stored in a single aligned block, addressed by tables of row pointers
+LAYOUTS = ('pointers', 'flat')
+
+# 'rand' - rand() from the standard library
+# 'polybench' - a formula based on the indices, like in Polybench
+# 'fast' - popsicle_rand() from papi_utils.h, seeded separately for each array with RAND_SEED macro
+INITIALISERS = ('rand', 'polybench', 'fast')
 
 
 def max_set(exprs):
     """
     Transforms an iterable of expressions into a C expression which will evalueate to its maximum.
     MAX(x, y) macro must be included to the C program.
-    If there are multiple integer values in the iterable, only the greatest one is preserved
-    (see remove_non_extreme_numbers)
+    Expressions which can never be the greatest ones are removed (see remove_dominated), so the MAX tree contains only
+    the options which cannot be compared statically.
 
-    Example: ['3', '6', '7', 'N', 'K'] -> 'MAX(MAX(7, N), 'K')'
-    :param exprs: An iterable of expressions as strings
+    Example: [3, 6, 7, N, N+1, K] -> 'MAX(MAX(7, K), N+1)'
+    :param exprs: An iterable of expressions (as SymExpr) or a single expression as string
     :return: Output string
     """
 
@@ -31,8 +41,7 @@ def max_set(exprs):
     if type(exprs) is str:
         return c_ast.ID(exprs)
 
-    exprs = remove_non_extreme_numbers(exprs, leave_min=False)
-    exprs = [c_ast.ID(e) for e in exprs]
+    exprs = [c_ast.ID(str(e)) for e in sorted(remove_dominated(exprs))]
 
     return max_set_recur(exprs)
 
@@ -44,42 +53,99 @@ class MallocBuilder:
     A constant of 2 is added to the size just in case of minor imprecision.
 
     Example 1:
-        malloc('A', 'int', ['N+42'], 0)
+        malloc('A', 'int', [{N+42}], 0)
         ->
-        A = malloc((N+42+2)*sizeof(int));
+        A = popsicle_malloc((N+42+2)*sizeof(int));
         for(int i_0=0; i_0<N+42+2; ++i_0) {
             A[i_0] = (int)rand();
         }
 
     Example 2:
-        malloc('A', 'int', ['M', 'N'], 0)
+        malloc('A', 'int', [{M}, {N}], 0)
         ->
-        A = malloc((M+2)*sizeof(*int))
+        A = popsicle_malloc((M+2)*sizeof(*int))
         for(int i_0=0; i_0<M+2; ++i_0) {
-            A[i_0] = malloc((N+2)*sizeof(int))
+            A[i_0] = popsicle_malloc((N+2)*sizeof(int))
             for(int i_1=0; i_1<N+2; ++i_1) {
                 A[i_0][i_1] = (int)rand();
             }
         }
 
+    Example 3 (layout='flat'):
+        malloc('A', 'int', [{M}, {N}], 0)
+        ->
+        {
+            long A_dim0 = M + 2;
+            long A_dim1 = N + 2;
+            int* A_lvl1 = alloc_aligned(A_dim0 * A_dim1 * sizeof(int), HUGE_PAGES);
+            A = alloc_aligned(A_dim0 * sizeof(int*), 0);
+            for(int i_0=0; i_0<A_dim0; ++i_0) {
+                A[i_0] = A_lvl1 + i_0 * A_dim1;
+            }
+        }
+        for(int i_0=0; i_0<M; ++i_0) {
+            for(int i_1=0; i_1<N; ++i_1) {
+                A[i_0][i_1] = (int)rand();
+            }
+        }
+
+    Memory is allocated with popsicle_malloc() from papi_utils.c - malloc() which records the allocated blocks, so that
+    they can be freed before the arrays are initialised again (see CodeTransformerAST.gen_mallocs).
+
+    In the flat layout, all elements of an array are stored in one contiguous block, so the number of allocations does
+    not depend on the size of the array, and the subscripts like A[i][j] in the original code remain valid. The blocks
+    are allocated with alloc_aligned() from papi_utils.c. The data block is advised to use huge pages if HUGE_PAGES
+    macro is non-zero (see CodeTransformerStr.add_huge_pages_macro).
+
+    With initialiser='fast', elements are filled by popsicle_rand() - an inlined xorshift generator from papi_utils.h,
+    which is much cheaper than rand(). The generator is seeded with RAND_SEED macro combined with the array name, so the
+    values are reproducible, but differ between arrays. In the flat layout, the whole data block is filled by a single
+    loop instead of the nested ones.
+
     :param name: Array name
     :param dtype: Array data type
-    :param sizes: List of dimensions sizes (as strings)
+    :param sizes: List of dimensions sizes (as sets of SymExpr options)
+    :param initialiser: One of INITIALISERS
+    :param layout: One of LAYOUTS
     :return: C code (as string)
     """
 
-    def __init__(self, name, dtype, sizes, initialiser='rand'):
+    def __init__(self, name, dtype, sizes, initialiser='rand', layout='pointers'):
+        if initialiser not in INITIALISERS:
+            raise ValueError('Incorrect \'initialiser\' value in MallocBuilder - expected one of: ' +
+                             ', '.join(INITIALISERS))
+        if layout not in LAYOUTS:
+            raise ValueError('Incorrect \'layout\' value in MallocBuilder - expected one of: ' + ', '.join(LAYOUTS))
+
         self.name = name
         self.dtype = c_ast.ID(dtype)
         self.sizes = [max_set(s) for s in sizes]
-        self.initialiser = self.__polybench_init if initialiser == 'polybench' else self.__rand_init
+        self.initialiser_name = initialiser
+        self.initialiser = {
+            'rand': self.__rand_init,
+            'polybench': self.__polybench_init,
+            'fast': self.__fast_init,
+        }[initialiser]
+        self.layout = layout
         self.counter_prefix = 'i_' if not name.startswith('i_') else 'i_' + name
 
     def generate(self) -> List[c_ast.Node]:
-        return [
-            self.__malloc_assign(0),
-            self.__for_loop(0)
-        ]
+        res = []
+
+        if self.initialiser_name == 'fast':
+            res.append(self.__srand())
+
+        if self.layout == 'flat':
+            res.append(self.__flat_alloc())
+
+            # the fast initialiser fills the whole data block at once in __flat_alloc
+            if self.initialiser_name != 'fast':
+                res.append(self.__for_loop(0))
+        else:
+            res.append(self.__malloc_assign(0))
+            res.append(self.__for_loop(0))
+
+        return res
 
     # PRIVATE MEMBERS
 
@@ -98,14 +164,15 @@ class MallocBuilder:
             sub = subs[-1]
             return c_ast.ArrayRef(self.__array_ref(subs[:-1]), sub)
 
-    def __for_loop(self, depth: int) -> c_ast.For:
+    def __counter_loop(self, depth: int, bound: c_ast.Node, block_items: List[c_ast.Node]) -> c_ast.For:
         """
-        A helper function to construct a for loop corresponding to allocating one dimension of an array.
-        Recursively calls itself to generate next levels or generates an initialisation line if it is the last level.
+        A helper function to construct a for loop iterating over one dimension of an array.
 
         Example: for(i_2 = 0; i_2 < N; i_2++) { ... }
 
-        :param depth:
+        :param depth: Dimension (determines the name of the counter)
+        :param bound: Upper bound of the counter
+        :param block_items: Body of the loop
         :return: C-ast.For
         """
         i = self.counter_prefix + str(depth)
@@ -114,29 +181,137 @@ class MallocBuilder:
             c_ast.TypeDecl(i, [], c_ast.IdentifierType(['int'])),
             c_ast.Constant('int', '0'), ''
         )])
-        cond = c_ast.BinaryOp('<', c_ast.ID(i), self.sizes[depth])
+        cond = c_ast.BinaryOp('<', c_ast.ID(i), bound)
         nxt = c_ast.Assignment('++', c_ast.ID(i), None)
-        stmt = c_ast.Compound([])
 
+        return c_ast.For(init, cond, nxt, c_ast.Compound(block_items))
+
+    def __fast_init(self, depth: int) -> c_ast.Node:
+        """
+        Generates a statement initialising an array element with the fast PRNG.
+        :param depth:
+
+        Example:
+            A[i_0][i_1] = (double) popsicle_rand();
+        """
+        subs = self.__subs(depth)
+        return c_ast.Assignment('=', self.__array_ref(subs), self.__fast_value())
+
+    def __fast_value(self) -> c_ast.Node:
+        return c_ast.Cast(self.dtype, c_ast.FuncCall(c_ast.ID('popsicle_rand'), c_ast.ExprList([])))
+
+    def __srand(self) -> c_ast.Node:
+        """
+        Seeds the fast PRNG for this array.
+
+        Example: popsicle_srand(RAND_SEED ^ 2428722211U);
+        """
+        array_seed = c_ast.Constant('int', str(zlib.crc32(self.name.encode('utf-8'))) + 'U')
+        seed = c_ast.BinaryOp('^', c_ast.ID('RAND_SEED'), array_seed)
+        return c_ast.FuncCall(c_ast.ID('popsicle_srand'), c_ast.ExprList([seed]))
+
+    def __flat_alloc(self) -> c_ast.Compound:
+        """
+        Generates a block allocating the array in the flat layout (see Example 3): the data block, tables of row pointers
+        for each but the last dimension, and the loops filling the tables.
+        """
+        n_dims = len(self.sizes)
+        dims = [self.name + '_dim' + str(depth) for depth in range(n_dims)]
+        levels = [self.name] + [self.name + '_lvl' + str(depth) for depth in range(1, n_dims)]
+
+        block_items = []
+
+        for depth in range(n_dims):
+            decl = build_decl(dims[depth], 'long')
+            decl.init = c_ast.BinaryOp('+', self.sizes[depth], c_ast.Constant('int', '2'))
+            block_items.append(decl)
+
+        # the data block goes first, then the tables of pointers to the subsequent levels
+        for depth in reversed(range(n_dims)):
+            el_type = self.dtype.name + '*' * (n_dims - depth - 1)
+            cells = exprs_prod([c_ast.ID(d) for d in dims[:depth + 1]])
+            sizeof = c_ast.FuncCall(c_ast.ID('sizeof'), c_ast.ExprList([c_ast.ID(el_type)]))
+            huge_pages = c_ast.ID('HUGE_PAGES') if depth == n_dims - 1 else c_ast.Constant('int', '0')
+            alloc = c_ast.FuncCall(c_ast.ID('alloc_aligned'),
+                                   c_ast.ExprList([c_ast.BinaryOp('*', cells, sizeof), huge_pages]))
+
+            if depth == 0:
+                block_items.append(c_ast.Assignment('=', c_ast.ID(self.name), alloc))
+            else:
+                decl = build_decl(levels[depth], el_type + '*')
+                decl.init = alloc
+                block_items.append(decl)
+
+        if n_dims > 1:
+            block_items.append(self.__flat_link_loop(0, dims, levels))
+
+        if self.initialiser_name == 'fast':
+            data = levels[-1]
+            cells = exprs_prod([c_ast.ID(d) for d in dims])
+            fill = c_ast.Assignment('=', c_ast.ArrayRef(c_ast.ID(data), c_ast.ID(self.counter_prefix + '0')),
+                                    self.__fast_value())
+            block_items.append(self.__counter_loop(0, cells, [fill]))
+
+        return c_ast.Compound(block_items)
+
+    def __flat_link_loop(self, depth: int, dims: List[str], levels: List[str]) -> c_ast.For:
+        """
+        Generates a loop setting the pointers of one level of the flat layout to consecutive rows of the next one.
+
+        Example: A[i_0][i_1] = A_lvl2 + (i_0 * A_dim1 + i_1) * A_dim2;
+
+        :param depth: Dimension
+        :param dims: Names of variables holding the sizes of dimensions
+        :param levels: Names of the pointer tables (levels[0] is the array itself)
+        """
+        subs = self.__subs(depth + 1)
+
+        # index of the row in the next level, e.g. (i_0 * A_dim1 + i_1)
+        row = subs[0]
+        for d in range(1, depth + 1):
+            row = exprs_sum([c_ast.BinaryOp('*', row, c_ast.ID(dims[d])), subs[d]])
+
+        assign = c_ast.Assignment(
+            '=',
+            self.__array_ref(subs),
+            c_ast.BinaryOp('+', c_ast.ID(levels[depth + 1]), c_ast.BinaryOp('*', row, c_ast.ID(dims[depth + 1])))
+        )
+
+        block_items = [assign]
+        if depth + 2 < len(self.sizes):
+            block_items.append(self.__flat_link_loop(depth + 1, dims, levels))
+
+        return self.__counter_loop(depth, c_ast.ID(dims[depth]), block_items)
+
+    def __for_loop(self, depth: int) -> c_ast.For:
+        """
+        A helper function to construct a for loop corresponding to allocating one dimension of an array.
+        Recursively calls itself to generate next levels or generates an initialisation line if it is the last level.
+        In the flat layout, the memory is already allocated, so the loop only initialises the elements.
+
+        Example: for(i_2 = 0; i_2 < N; i_2++) { ... }
+
+        :param depth:
+        :return: C-ast.For
+        """
         if depth < len(self.sizes) - 1:
-            stmt.block_items = [
-                self.__malloc_assign(depth + 1),
-                self.__for_loop(depth + 1)
-            ]
+            block_items = [self.__for_loop(depth + 1)]
+            if self.layout == 'pointers':
+                block_items.insert(0, self.__malloc_assign(depth + 1))
         else:
-            stmt.block_items = [
+            block_items = [
                 self.initialiser(depth + 1)
             ]
 
-        return c_ast.For(init, cond, nxt, stmt)
+        return self.__counter_loop(depth, self.sizes[depth], block_items)
 
     def __malloc(self, depth: int) -> c_ast.FuncCall:
         """
-        A helper function to generate the call of malloc function with proper arguments.
+        A helper function to generate the call of popsicle_malloc function with proper arguments.
         Note that a constant of 2 is added to the number of allocated cells. This is meant to compensate minor errors in
         size estimation.
 
-        Example: malloc((N + 2) * sizeof(int*))
+        Example: popsicle_malloc((N + 2) * sizeof(int*))
 
         :param depth: Which dimension of the array we want to allocate. Used to generate the argument of sizeof().
         :return: c_ast.FuncCall
@@ -156,13 +331,13 @@ class MallocBuilder:
 
         arg = c_ast.BinaryOp('*', size_expr, sizeof)
 
-        return c_ast.FuncCall(c_ast.ID('malloc'), c_ast.ExprList([arg]))
+        return c_ast.FuncCall(c_ast.ID('popsicle_malloc'), c_ast.ExprList([arg]))
 
     def __malloc_assign(self, depth: int) -> c_ast.Node:
         """
         A helper function to construct a malloc function call with assigment
 
-        Example: A[i_0] = malloc((N + 2) * sizeof(int*));
+        Example: A[i_0] = popsicle_malloc((N + 2) * sizeof(int*));
 
         :param depth:
         :return:
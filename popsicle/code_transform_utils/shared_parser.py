@@ -0,0 +1,49 @@
+import compileall
+import os
+import sys
+import pycparser
+from pycparser import c_parser
+
+_parser = None
+
+
+def parser_tables_dir():
+    """
+    Directory in which PLY lexer and parser tables are stored. They are generated on first use and then reused by all
+    subsequent processes. The location can be changed with POPSICLE_PARSER_TABLES environment variable.
+    """
+    default_dir = os.path.join(os.path.expanduser('~'), '.cache', 'popsicle')
+    tables_dir = os.environ.get('POPSICLE_PARSER_TABLES', default_dir)
+    return os.path.join(os.path.abspath(tables_dir), 'pycparser-' + pycparser.__version__)
+
+
+def get_parser():
+    """
+    Returns a CParser shared by all transformations in the current process.
+
+    Building a CParser requires constructing PLY lexer and parser tables, which takes longer than parsing a typical
+    LORE program. The tables are therefore written to parser_tables_dir() once and only loaded afterwards.
+    The parser is created lazily - if it is created before forking worker processes, they inherit it for free.
+
+    Note that CParser is not thread-safe, so the shared instance should not be used by multiple threads.
+    """
+    global _parser
+
+    if _parser is None:
+        tables_dir = parser_tables_dir()
+        os.makedirs(tables_dir, exist_ok=True)
+
+        # PLY imports the tables as modules
+        if tables_dir not in sys.path:
+            sys.path.append(tables_dir)
+
+        _parser = c_parser.CParser(
+            lextab='popsicle_lextab',
+            yacctab='popsicle_yacctab',
+            taboutputdir=tables_dir,
+        )
+
+        # the tables are large Python modules - make sure they are not compiled again in every process
+        compileall.compile_dir(tables_dir, quiet=1)
+
+    return _parser
@@ -0,0 +1,115 @@
+from collections import Counter
+from typing import Dict, List, Mapping, Optional
+from pycparser import c_ast
+from popsicle.code_transform_utils.code_transform_utils import NodeCollector, OpCountVisitor
+from popsicle.code_transform_utils.trip_count import TripCount
+
+# Columns of static_features.csv (apart from 'alg'), in this order
+STATIC_FEATURES = (
+    'loop_depth',           # maximal depth of nested loops
+    'n_loops',              # number of loops in the measured region
+    'n_nests',              # number of outermost loop nests in the measured region
+    'max_arr_dim',          # maximal number of array dimensions
+    'n_arrays',
+    'n_arrays_char',        # number of arrays by data type
+    'n_arrays_int',
+    'n_arrays_float',
+    'n_arrays_double',
+    'ops_add',              # operations per iteration of an innermost loop, by category (see OP_CATEGORIES) - the
+                            # maximum over the innermost loops, so that each nest is counted once
+    'ops_mul',
+    'ops_div',
+    'ops_cmp',
+    'ops_logic',
+    'ops_bitwise',
+    'calls',                # function calls per iteration of an innermost loop (maximum, like ops_*)
+    'loads',                # array accesses per iteration of an innermost loop (maximum, like ops_*)
+    'stores',
+    'trip_count_degree',    # maximal degree of the trip count polynomials (-1 if none is known)
+)
+
+
+def dtype_category(dtype: str) -> str:
+    """
+    Example: 'unsigned long' -> 'int'
+    """
+    dtype = dtype.split(' ')[-1]
+    if dtype in ('char', 'float', 'double'):
+        return dtype
+    return 'int'
+
+
+def innermost_loops(items: List[c_ast.Node]) -> List[c_ast.For]:
+    """
+    :return: All for loops in given statements which do not contain any other for loop
+    """
+    collector = NodeCollector(['For'])
+    for item in items:
+        collector.visit(item)
+
+    res = []
+    for node in collector.nodes:
+        inner = innermost_loops([node.stmt]) if node.stmt is not None else []
+        res.extend(inner if len(inner) > 0 else [node])
+    return res
+
+
+def count_loops(items: List[c_ast.Node]) -> int:
+    collector = NodeCollector(['For'])
+    for item in items:
+        collector.visit(item)
+    return sum(1 + (count_loops([node.stmt]) if node.stmt is not None else 0) for node in collector.nodes)
+
+
+def trip_count_degree(trip_counts: List[Optional[TripCount]]) -> int:
+    degrees = [max([len(monomial) for monomial, _ in tc.numerator.terms] + [0])
+               for tc in trip_counts if tc is not None]
+    return max(degrees) if len(degrees) > 0 else -1
+
+
+def extract_static_features(items: List[c_ast.Node],
+                            refs: Mapping[str, list],
+                            dtypes: Mapping[str, str],
+                            loop_depth: int,
+                            trip_counts: List[Optional[TripCount]]) -> Dict[str, int]:
+    """
+    Describes a program with features which can be determined without executing it.
+
+    :param items: Statements of the measured region
+    :param refs: Array references, as found by ArrayRefVisitor (only their number of dimensions is used)
+    :param dtypes: Data types of variables
+    :param loop_depth: Maximal depth of nested loops
+    :param trip_counts: Trip counts of loop nests in the measured region
+    :return: Dict: feature name (see STATIC_FEATURES) -> value
+    """
+    # the counts of every innermost loop separately - summing them would multiply the counts by the number of nests
+    counts = Counter()
+    for loop in innermost_loops(items):
+        if loop.stmt is not None:
+            loop_counts = Counter()
+            OpCountVisitor(loop_counts).visit(loop.stmt)
+            for key, value in loop_counts.items():
+                counts[key] = max(counts[key], value)
+
+    arrays = [arr for arr in refs if arr in dtypes]
+    arr_types = Counter(dtype_category(dtypes[arr]) for arr in arrays)
+
+    features = {
+        'loop_depth': loop_depth,
+        'n_loops': count_loops(items),
+        'n_nests': len(trip_counts),
+        'max_arr_dim': max([len(ref) for ref in refs.values()] + [0]),
+        'n_arrays': len(arrays),
+        'trip_count_degree': trip_count_degree(trip_counts),
+        'calls': counts['call'],
+        'loads': counts['load'],
+        'stores': counts['store'],
+    }
+
+    for dtype in ('char', 'int', 'float', 'double'):
+        features['n_arrays_' + dtype] = arr_types[dtype]
+
+    for category in ('add', 'mul', 'div', 'cmp', 'logic', 'bitwise'):
+        features['ops_' + category] = counts[category]
+
+    return features
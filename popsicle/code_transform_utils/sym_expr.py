@@ -0,0 +1,336 @@
+import operator
+import sys
+from collections import namedtuple
+from itertools import product
+from typing import Iterable, Mapping, Set, Callable
+
+
+def c_div(l: int, r: int) -> int:
+    """
+    Integer division as in C (rounding towards zero)
+    """
+    q = abs(l) // abs(r)
+    return q if (l >= 0) == (r >= 0) else -q
+
+
+def c_mod(l: int, r: int) -> int:
+    return l - r * c_div(l, r)
+
+
+def c_shift(op):
+    def shift(l: int, r: int) -> int:
+        if not 0 <= r < 64:
+            raise ValueError('Shift by ' + str(r) + ' bits')
+        return op(l, r)
+    return shift
+
+
+# Binary operators (other than '+', '-' and '*') which can be evaluated on integer values.
+# In symbolic expressions, their results are kept as opaque factors, e.g. (N/2)
+C_BINARY_OPS = {
+    '/': c_div,
+    '%': c_mod,
+    '<<': c_shift(operator.lshift),
+    '>>': c_shift(operator.rshift),
+    '&': operator.and_,
+    '|': operator.or_,
+    '^': operator.xor,
+    '<': lambda l, r: int(l < r),
+    '>': lambda l, r: int(l > r),
+    '<=': lambda l, r: int(l <= r),
+    '>=': lambda l, r: int(l >= r),
+    '==': lambda l, r: int(l == r),
+    '!=': lambda l, r: int(l != r),
+    '&&': lambda l, r: int(bool(l) and bool(r)),
+    '||': lambda l, r: int(bool(l) or bool(r)),
+}
+
+# A binary operation which cannot be represented as a polynomial, e.g. N/2
+Opaque = namedtuple('Opaque', ['left', 'op', 'right'])
+
+
+def operand_str(expr: 'SymExpr') -> str:
+    """
+    An operand of an Opaque operation, in parentheses unless it is a single symbol, factor or non-negative constant.
+    """
+    if len(expr.terms) == 1:
+        monomial, coef = expr.terms[0]
+        if (monomial == () and coef >= 0) or (len(monomial) == 1 and coef == 1):
+            return str(expr)
+    return '(' + str(expr) + ')'
+
+
+def factor_str(factor) -> str:
+    if type(factor) is str:
+        return factor
+    return '(' + operand_str(factor.left) + factor.op + operand_str(factor.right) + ')'
+
+
+def monomial_key(monomial: tuple) -> tuple:
+    """
+    Terms of higher degree go first, the constant term is always the last one.
+    """
+    return -len(monomial), tuple(f if type(f) is str else factor_str(f) for f in monomial)
+
+
+class SymExpr:
+    """
+    A canonical representation of an integer expression: a sum of monomials with integer coefficients.
+    Monomials are sorted tuples of factors - symbols (interned variable names) or Opaque operations.
+
+    Equivalent expressions built in different ways have the same representation, so they can be compared, hashed and
+    deduplicated in sets, e.g. N+1-1 and N are equal.
+
+    Symbols are assumed to be non-negative (they represent problem sizes), which allows to compare expressions - see
+    dominates().
+
+    Example: 2*N*M+N-1 is represented as terms (((M, N), 2), ((N,), 1), ((), -1))
+    """
+    __slots__ = ('terms', '_hash', '_text')
+
+    def __init__(self, terms: Mapping[tuple, int]=None):
+        """
+        :param terms: A map monomial -> coefficient. Factors of monomials have to be sorted by factor_str.
+        """
+        terms = {} if terms is None else terms
+        self.terms = tuple(sorted(((m, c) for m, c in terms.items() if c != 0), key=lambda t: monomial_key(t[0])))
+        self._hash = hash(self.terms)
+        self._text = None
+
+    @staticmethod
+    def symbol(name: str) -> 'SymExpr':
+        return SymExpr({(sys.intern(name),): 1})
+
+    @staticmethod
+    def constant(value: int) -> 'SymExpr':
+        return SymExpr({(): value})
+
+    @staticmethod
+    def binary_op(l: 'SymExpr', op: str, r: 'SymExpr') -> 'SymExpr':
+        """
+        Result of a C binary operation. Operations other than '+', '-' and '*' are evaluated only if both operands are
+        constant, otherwise they are represented as Opaque factors.
+        """
+        if op == '+':
+            return l + r
+        if op == '-':
+            return l - r
+        if op == '*':
+            return l * r
+
+        if l.is_constant() and r.is_constant() and op in C_BINARY_OPS:
+            try:
+                return SymExpr.constant(C_BINARY_OPS[op](l.constant_term(), r.constant_term()))
+            except (ZeroDivisionError, ValueError):
+                pass
+
+        return SymExpr({(Opaque(l, op, r),): 1})
+
+    def is_constant(self) -> bool:
+        return len(self.terms) == 0 or (len(self.terms) == 1 and self.terms[0][0] == ())
+
+    def constant_term(self) -> int:
+        if len(self.terms) > 0 and self.terms[-1][0] == ():
+            return self.terms[-1][1]
+        return 0
+
+    def variable_part(self) -> tuple:
+        """
+        :return: Terms without the constant one
+        """
+        if len(self.terms) > 0 and self.terms[-1][0] == ():
+            return self.terms[:-1]
+        return self.terms
+
+    def symbols(self) -> Set[str]:
+        """
+        :return: Names of all symbols in the expression (including the operands of Opaque factors)
+        """
+        names = set()
+        for monomial, _ in self.terms:
+            for factor in monomial:
+                if type(factor) is str:
+                    names.add(factor)
+                else:
+                    names.update(factor.left.symbols())
+                    names.update(factor.right.symbols())
+        return names
+
+    def dominates(self, other: 'SymExpr') -> bool:
+        """
+        Checks if self >= other for all non-negative values of symbols, i.e. all coefficients of (self - other) are
+        non-negative and none of its monomials contains an Opaque factor (whose sign is unknown).
+        """
+        diff = dict(self.terms)
+        for monomial, coef in other.terms:
+            diff[monomial] = diff.get(monomial, 0) - coef
+
+        for monomial, coef in diff.items():
+            if coef < 0 or (coef > 0 and any(type(f) is Opaque for f in monomial)):
+                return False
+        return True
+
+    def substitute(self, options_of: Callable[[str], Iterable['SymExpr']]) -> Set['SymExpr']:
+        """
+        Replaces every symbol with each of its possible values and returns all resulting expressions.
+
+        Example: N*2+M, options_of: {N: {K, 3}, M: {M}} -> {2*K+M, M+6}
+        :param options_of: A function returning possible values of a symbol
+        :return: Set of expressions
+        """
+        results = {SymExpr.constant(0)}
+
+        for monomial, coef in self.terms:
+            monomial_options = {SymExpr.constant(coef)}
+
+            for factor in monomial:
+                if type(factor) is str:
+                    factor_options = options_of(factor)
+                else:
+                    factor_options = {
+                        SymExpr.binary_op(l, factor.op, r)
+                        for l, r in product(factor.left.substitute(options_of), factor.right.substitute(options_of))
+                    }
+                monomial_options = {m * f for m, f in product(monomial_options, factor_options)}
+
+            results = {r + m for r, m in product(results, monomial_options)}
+
+        return results
+
+    def evaluate(self, values: Mapping[str, int], ops: Mapping[str, Callable]=None) -> int:
+        """
+        :param values: Values of symbols
+        :param ops: Implementations of the operations of Opaque factors (C_BINARY_OPS by default). Other ones allow to
+            evaluate the expression e.g. on NumPy arrays of values.
+        :return: Value of the expression
+        """
+        ops = C_BINARY_OPS if ops is None else ops
+        res = 0
+        for monomial, coef in self.terms:
+            for factor in monomial:
+                if type(factor) is str:
+                    coef *= values[factor]
+                else:
+                    coef *= ops[factor.op](factor.left.evaluate(values, ops), factor.right.evaluate(values, ops))
+            res += coef
+        return res
+
+    def __add__(self, other: 'SymExpr') -> 'SymExpr':
+        terms = dict(self.terms)
+        for monomial, coef in other.terms:
+            terms[monomial] = terms.get(monomial, 0) + coef
+        return SymExpr(terms)
+
+    def __neg__(self) -> 'SymExpr':
+        return SymExpr({monomial: -coef for monomial, coef in self.terms})
+
+    def __sub__(self, other: 'SymExpr') -> 'SymExpr':
+        return self + (-other)
+
+    def __mul__(self, other: 'SymExpr') -> 'SymExpr':
+        terms = {}
+        for l_monomial, l_coef in self.terms:
+            for r_monomial, r_coef in other.terms:
+                monomial = tuple(sorted(l_monomial + r_monomial, key=factor_str))
+                terms[monomial] = terms.get(monomial, 0) + l_coef * r_coef
+        return SymExpr(terms)
+
+    def __eq__(self, other):
+        return type(other) is SymExpr and self.terms == other.terms
+
+    def __hash__(self):
+        return self._hash
+
+    def __lt__(self, other: 'SymExpr') -> bool:
+        return str(self) < str(other)
+
+    def __str__(self):
+        """
+        :return: The expression in C syntax, e.g. 2*M*N+N-1
+        """
+        if self._text is None:
+            parts = []
+            for monomial, coef in self.terms:
+                factors = '*'.join(factor_str(f) for f in monomial)
+                if monomial == ():
+                    part = str(coef)
+                elif coef == 1:
+                    part = factors
+                elif coef == -1:
+                    part = '-' + factors
+                else:
+                    part = str(coef) + '*' + factors
+                parts.append(part if len(parts) == 0 or part.startswith('-') else '+' + part)
+            self._text = ''.join(parts) if len(parts) > 0 else '0'
+        return self._text
+
+    def __repr__(self):
+        return 'SymExpr(' + str(self) + ')'
+
+
+def parse_constant(value: str) -> SymExpr:
+    """
+    Converts a C constant to SymExpr. Constants which are not integers (e.g. 1.5 or 'a') are represented as symbols.
+
+    Example: '0x10' -> 16
+    """
+    try:
+        digits = value.rstrip('uUlL')
+        if digits.lower().startswith('0x'):
+            return SymExpr.constant(int(digits, 16))
+        if len(digits) > 1 and digits.startswith('0'):
+            return SymExpr.constant(int(digits, 8))
+        return SymExpr.constant(int(digits))
+    except ValueError:
+        return SymExpr.symbol(value)
+
+
+def keep_max_constants(exprs: Iterable[SymExpr]) -> Set[SymExpr]:
+    """
+    Out of expressions which differ only by a constant term, keeps the one with the greatest constant.
+    Assuming that we are looking for the maximum, the others would never be chosen. Non-positive constants are removed
+    as well, as they are useless for estimating sizes.
+    Works in linear time, see remove_dominated() for a more thorough (and expensive) version.
+
+    Example: [N+1, N, N+3, M, 2*M+1, 2*M+5, 3, 7, 0] -> {N+3, M, 2*M+5, 7}
+    :param exprs: Iterable of expressions
+    :return: Set of remaining expressions
+    """
+    best = {}
+
+    for expr in exprs:
+        variable_part = expr.variable_part()
+        if variable_part not in best or best[variable_part].constant_term() < expr.constant_term():
+            best[variable_part] = expr
+
+    return {expr for expr in best.values() if not (expr.is_constant() and expr.constant_term() <= 0)}
+
+
+def remove_dominated(exprs: Iterable[SymExpr]) -> Set[SymExpr]:
+    """
+    Removes expressions which are never greater than another one (see SymExpr.dominates).
+    Works in quadratic time.
+
+    Example: [N, N+M, 2*N, N*M+1, 5] -> {N+M, 2*N, N*M+1, 5}
+    :param exprs: Iterable of expressions
+    :return: Set of remaining expressions
+    """
+    exprs = keep_max_constants(exprs)
+    return {e for e in exprs if not any(o != e and o.dominates(e) for o in exprs)}
+
+
+def upper_envelope(exprs: Iterable[SymExpr]) -> SymExpr:
+    """
+    Builds a single expression which is not smaller than any of the given ones: every coefficient is the greatest
+    coefficient of the monomial among the expressions (and at least 0). It dominates every expression without Opaque
+    factors - the sign of Opaque monomials is unknown, so check dominates() if they may appear.
+
+    Example: [2*N+1, N*M, M+5] -> 2*N+N*M+M+5
+    :param exprs: Iterable of expressions
+    :return: The envelope
+    """
+    terms = {}
+    for expr in exprs:
+        for monomial, coef in expr.terms:
+            terms[monomial] = max(terms.get(monomial, 0), coef)
+    return SymExpr(terms)
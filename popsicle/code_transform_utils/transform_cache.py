@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import tempfile
+from popsicle.code_transform_utils.code_transformer import TRANSFORMER_VERSION
+
+
+class TransformCache:
+    """
+    A persistent, content-addressed cache of CodeTransformer results.
+
+    An entry is identified by the hash of the source code, the transformer options and TRANSFORMER_VERSION, so any
+    change to one of them results in a cache miss. Each entry is a JSON file containing either the outputs of a
+    successful transformation or the reason of a failure:
+
+        {'code': ..., 'max_param': ..., 'params_names': ..., 'trip_counts': [...], 'meta': [...],
+         'static_features': [...], 'error': None}
+        {'error': 'Skipping - file contains struct'}
+
+    Entries are written atomically, so the cache can be safely shared by multiple worker processes.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    @staticmethod
+    def key(source, options):
+        """
+        :param source: Original source code (before any transformation)
+        :param options: Dict of CodeTransformer options affecting the output
+        :return: Hex digest identifying the entry
+        """
+        key_data = json.dumps({
+            'source': hashlib.sha256(source.encode('utf-8')).hexdigest(),
+            'options': options,
+            'version': TRANSFORMER_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        :return: The cached entry (as a dict) or None if not found
+        """
+        try:
+            with open(self.__entry_path(key), 'r') as fin:
+                return json.load(fin)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, key, entry):
+        entry_path = self.__entry_path(key)
+        entry_dir = os.path.dirname(entry_path)
+
+        if not os.path.isdir(entry_dir):
+            os.makedirs(entry_dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fout:
+                json.dump(entry, fout)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    # PRIVATE MEMBERS
+
+    def __entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
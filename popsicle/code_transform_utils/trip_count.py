@@ -0,0 +1,307 @@
+import math
+import re
+from fractions import Fraction
+from functools import lru_cache, reduce
+from typing import Dict, List, Mapping, Optional, Tuple
+from pycparser import c_ast
+from pycparser.plyparser import ParseError
+from popsicle.code_transform_utils.code_transform_utils import NodeCollector
+from popsicle.code_transform_utils.shared_parser import get_parser
+from popsicle.code_transform_utils.sym_expr import SymExpr, c_div, parse_constant
+
+# Written to (...)_trip_counts.txt instead of the trip count of a loop nest which cannot be determined
+UNKNOWN = '?'
+
+
+class TripCount:
+    """
+    The number of iterations of the innermost loops of a loop nest, as a function of program parameters.
+    It is represented as numerator / denominator, where numerator is a SymExpr with integer coefficients and the
+    division is always exact, e.g. (N*N+N)/2 for a triangular nest.
+
+    Example:
+        tc = TripCount.parse('(PARAM_N*PARAM_N+PARAM_N)/2')
+        tc.evaluate({'PARAM_N': 100})   # 5050
+    """
+    __slots__ = ('numerator', 'denominator')
+
+    def __init__(self, numerator: SymExpr, denominator: int=1):
+        self.numerator = numerator
+        self.denominator = denominator
+
+    @staticmethod
+    def from_rational(expr: SymExpr) -> 'TripCount':
+        """
+        :param expr: SymExpr with rational (Fraction) coefficients
+        """
+        denominator = reduce(lambda a, b: a * b // math.gcd(a, b), (c.denominator for _, c in expr.terms), 1)
+        return TripCount(SymExpr({m: int(c * denominator) for m, c in expr.terms}), denominator)
+
+    @staticmethod
+    def parse(text: str, parser=None) -> 'TripCount':
+        """
+        Inverse of str(). The text is parsed as a C expression.
+        :raises ValueError: If the text is not a valid trip count
+        """
+        parser = parser if parser is not None else get_parser()
+        try:
+            node = parser.parse('int __trip_count = ' + text + ';').ext[0].init
+        except ParseError:
+            raise ValueError('Incorrect trip count: ' + text)
+
+        if type(node) is c_ast.BinaryOp and node.op == '/' and type(node.right) is c_ast.Constant:
+            return TripCount(to_sym_expr(node.left), int(parse_constant(node.right.value).constant_term()))
+        return TripCount(to_sym_expr(node))
+
+    def evaluate(self, values: Mapping[str, int]) -> int:
+        """
+        :param values: Values of program parameters, e.g. {'PARAM_N': 100}
+        :return: The number of iterations (0 if the formula gives a negative value, i.e. the loops are empty)
+        """
+        return max(c_div(self.numerator.evaluate(values), self.denominator), 0)
+
+    def __eq__(self, other):
+        return type(other) is TripCount and (self.numerator, self.denominator) == (other.numerator, other.denominator)
+
+    def __str__(self):
+        if self.denominator == 1:
+            return str(self.numerator)
+        return '(' + str(self.numerator) + ')/' + str(self.denominator)
+
+    def __repr__(self):
+        return 'TripCount(' + str(self) + ')'
+
+
+def to_sym_expr(node: c_ast.Node) -> SymExpr:
+    """
+    Converts a C expression to a single SymExpr (unlike ExprEstimator, which approximates it with a set of options).
+    :raises ValueError: If the expression contains anything else than variables, constants and arithmetic operations
+    """
+    if type(node) is c_ast.ID:
+        return SymExpr.symbol(node.name)
+    if type(node) is c_ast.Constant:
+        return parse_constant(node.value)
+    if type(node) is c_ast.BinaryOp:
+        return SymExpr.binary_op(to_sym_expr(node.left), node.op, to_sym_expr(node.right))
+    if type(node) is c_ast.UnaryOp and node.op in ('-', '+'):
+        expr = to_sym_expr(node.expr)
+        return -expr if node.op == '-' else expr
+
+    raise ValueError('Unsupported expression: ' + type(node).__name__)
+
+
+def loop_nest_trip_counts(items: List[c_ast.Node], param_names: Mapping[str, str]) -> List[Optional[TripCount]]:
+    """
+    Finds the trip counts of all outermost loop nests in given statements.
+    Sequential loops in the same body are added up and triangular nests (e.g. for(j=i; ...)) are summed exactly.
+    Loop bounds are assumed to be non-empty, i.e. the lower bound never exceeds the upper one.
+
+    :param items: Statements, e.g. the body of a function between '#pragma scop' and '#pragma endscop'
+    :param param_names: Variables allowed in the trip counts (e.g. loop bounds), mapped to the names used in the
+        result (e.g. {'n': 'PARAM_N'})
+    :return: A list with a TripCount for each loop nest, or None if it cannot be determined (e.g. the nest contains
+        a while loop, a non-unit step of a counter used in the inner loops, or depends on other variables)
+    """
+    collector = NodeCollector(['For', 'While', 'DoWhile'])
+    for item in items:
+        collector.visit(item)
+
+    counts = []
+    for node in collector.nodes:
+        try:
+            expr = loop_trip_count(node)
+        except ValueError:
+            counts.append(None)
+            continue
+
+        if not expr.symbols().issubset(param_names.keys()):
+            counts.append(None)
+            continue
+
+        renamed = expr.substitute(lambda s: {SymExpr.symbol(param_names[s])})
+        counts.append(TripCount.from_rational(renamed.pop()))
+
+    return counts
+
+
+def loop_trip_count(node: c_ast.Node) -> SymExpr:
+    """
+    :return: The number of iterations of the innermost loops, as a SymExpr with rational coefficients
+    :raises ValueError: If it cannot be determined
+    """
+    if type(node) is not c_ast.For:
+        raise ValueError('Unsupported loop: ' + type(node).__name__)
+
+    counter, low, high, step = loop_range(node)
+    body = body_trip_count(node.stmt)
+
+    if step == 1:
+        return sum_over(body, counter, low, high)
+
+    if counter in body.symbols():
+        raise ValueError('Non-unit step of a loop with dependent inner loops')
+
+    n_iter = SymExpr.binary_op(high - low + SymExpr.constant(step - 1), '/', SymExpr.constant(step))
+    return body * n_iter
+
+
+def body_trip_count(stmt: c_ast.Node) -> SymExpr:
+    """
+    :return: 1 if the body contains no loops, otherwise the sum of trip counts of its outermost loops
+    """
+    collector = NodeCollector(['For', 'While', 'DoWhile'])
+    if stmt is not None:
+        collector.visit(stmt)
+
+    if len(collector.nodes) == 0:
+        return SymExpr.constant(1)
+
+    return reduce(lambda a, b: a + b, (loop_trip_count(n) for n in collector.nodes))
+
+
+def loop_range(node: c_ast.For) -> Tuple[str, SymExpr, SymExpr, int]:
+    """
+    Normalises a for loop, so that its counter takes (high - low) / step values from the range [low, high).
+
+    Example: for(i=N; i>=1; i--) -> ('i', 1, N+1, 1)
+    :return: Tuple (counter name, low, high, step)
+    :raises ValueError: If the loop is not of the form 'for(i = A; i < B; i += C)' (or alike)
+    """
+    init, cond, nxt = node.init, node.cond, node.next
+
+    if type(init) is c_ast.Assignment and init.op == '=' and type(init.lvalue) is c_ast.ID:
+        counter, start = init.lvalue.name, init.rvalue
+    elif type(init) is c_ast.DeclList and len(init.decls) == 1 and init.decls[0].init is not None:
+        counter, start = init.decls[0].name, init.decls[0].init
+    else:
+        raise ValueError('Unsupported loop initialisation')
+
+    if type(cond) is not c_ast.BinaryOp:
+        raise ValueError('Unsupported loop condition')
+
+    op, bound = cond.op, cond.right
+    if type(cond.right) is c_ast.ID and cond.right.name == counter:
+        op, bound = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '!=': '!='}.get(op), cond.left
+    elif type(cond.left) is not c_ast.ID or cond.left.name != counter:
+        raise ValueError('Unsupported loop condition')
+
+    step = loop_step(nxt, counter)
+    start, bound = to_sym_expr(start), to_sym_expr(bound)
+    one = SymExpr.constant(1)
+
+    if step > 0 and op in ('<', '!='):
+        return counter, start, bound, step
+    if step > 0 and op == '<=':
+        return counter, start, bound + one, step
+    if step < 0 and op in ('>', '!='):
+        return counter, bound + one, start + one, -step
+    if step < 0 and op == '>=':
+        return counter, bound, start + one, -step
+
+    raise ValueError('Unsupported loop condition')
+
+
+def loop_step(nxt: c_ast.Node, counter: str) -> int:
+    """
+    :return: The constant step of a loop counter (negative if it is decremented)
+    :raises ValueError: If the step is not constant
+    """
+    if type(nxt) is c_ast.UnaryOp and type(nxt.expr) is c_ast.ID and nxt.expr.name == counter:
+        if nxt.op in ('p++', '++'):
+            return 1
+        if nxt.op in ('p--', '--'):
+            return -1
+
+    if type(nxt) is c_ast.Assignment and nxt.op in ('+=', '-=') and type(nxt.lvalue) is c_ast.ID \
+            and nxt.lvalue.name == counter:
+        step = to_sym_expr(nxt.rvalue)
+        if step.is_constant() and step.constant_term() != 0:
+            return step.constant_term() if nxt.op == '+=' else -step.constant_term()
+
+    raise ValueError('Unsupported loop increment')
+
+
+def sum_over(expr: SymExpr, var: str, low: SymExpr, high: SymExpr) -> SymExpr:
+    """
+    Symbolic sum of expr for var = low, low+1, ..., high-1 (Faulhaber's formula).
+
+    Example: sum_over(i, 'i', 0, N) -> 1/2*N*N-1/2*N
+    :raises ValueError: If expr is not a polynomial in var (e.g. var is an operand of an Opaque factor)
+    """
+    if var in low.symbols() or var in high.symbols():
+        raise ValueError('Loop bounds depend on the counter')
+
+    by_degree = {}
+    for monomial, coef in expr.terms:
+        rest = tuple(f for f in monomial if f != var)
+        if var in SymExpr({rest: 1}).symbols():
+            raise ValueError('Not a polynomial in ' + var)
+        degree = len(monomial) - len(rest)
+        by_degree[degree] = by_degree.get(degree, SymExpr()) + SymExpr({rest: coef})
+
+    result = SymExpr()
+    for degree, coef in by_degree.items():
+        result = result + coef * (power_sum(degree, high) - power_sum(degree, low))
+    return result
+
+
+def power_sum(k: int, n: SymExpr) -> SymExpr:
+    """
+    :return: 0^k + 1^k + ... + (n-1)^k as a SymExpr
+    """
+    result = SymExpr()
+    for coef in reversed(power_sum_coefs(k)):
+        result = result * n + SymExpr.constant(coef)
+    return result
+
+
+@lru_cache(maxsize=None)
+def power_sum_coefs(k: int) -> Tuple[Fraction, ...]:
+    """
+    :return: Coefficients of the polynomial 0^k + 1^k + ... + (n-1)^k in variable n (the i-th one is of degree i)
+    """
+    coefs = [Fraction(0)] * (k + 2)
+    for j in range(k + 1):
+        coefs[k + 1 - j] += binomial(k + 1, j) * bernoulli(j) / (k + 1)
+    return tuple(coefs)
+
+
+@lru_cache(maxsize=None)
+def bernoulli(n: int) -> Fraction:
+    """
+    :return: n-th Bernoulli number (with B_1 = -1/2)
+    """
+    if n == 0:
+        return Fraction(1)
+    return -sum(binomial(n + 1, j) * bernoulli(j) for j in range(n)) / (n + 1)
+
+
+def binomial(n: int, k: int) -> int:
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+def params_values(defines: str) -> Dict[str, int]:
+    """
+    Parses a line of (...)_params.txt.
+
+    Example: '-D PARAM_N=100 -D PARAM_M=20' -> {'PARAM_N': 100, 'PARAM_M': 20}
+    """
+    return {name: int(value) for name, value in re.findall(r'-D\s*(\w+)=(-?\d+)', defines)}
+
+
+def read_trip_counts(path: str, parser=None) -> List[Optional[TripCount]]:
+    """
+    Reads (...)_trip_counts.txt: a trip count of each loop nest in a separate line (UNKNOWN if not determined).
+    """
+    with open(path, 'r') as fin:
+        lines = [line.strip() for line in fin if len(line.strip()) > 0]
+    return [None if line == UNKNOWN else TripCount.parse(line, parser) for line in lines]
+
+
+def total_trip_count(trip_counts: List[Optional[TripCount]], values: Mapping[str, int]) -> Optional[int]:
+    """
+    :return: The sum of trip counts of all loop nests or None if any of them is unknown
+    """
+    if any(tc is None for tc in trip_counts):
+        return None
+    return sum(tc.evaluate(values) for tc in trip_counts)
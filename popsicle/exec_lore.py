@@ -0,0 +1,674 @@
+from __future__ import print_function
+from collections import namedtuple
+from multiprocessing import Pool, Queue
+from subprocess import CalledProcessError
+import argparse
+import csv
+import os
+import queue
+import random
+import shlex
+import statistics
+import subprocess
+import time
+from typing import Callable
+from popsicle.catalog import Catalog, catalog_path
+from popsicle.code_transform_utils.trip_count import params_values
+from popsicle.exec_utils.build_cache import BuildCache
+from popsicle.exec_utils.build_pipeline import BuildPipeline
+from popsicle.exec_utils.campaign_journal import active_time, CampaignJournal, done_programs, done_runs, read_journal
+from popsicle.exec_utils.cpu_topology import physical_cores, pin_to_cpu
+from popsicle.exec_utils.kernel_runner import KernelRunner
+from popsicle.utils import check_config, MetadataWriter
+
+# A binary built and measured for every parameter set. Its rows are written to (output name)(suffix).csv, where the
+# time is in the 'column' column.
+Variant = namedtuple('Variant', ['suffix', 'compiler', 'flags', 'column'])
+
+# An execution mode (as in popsicle-exec.sh): output subdirectory of OUT_DIR, variable with the programs directory,
+# script compiling exec_loop.o and papi_utils.o, number of trials and variants
+ExecMode = namedtuple('ExecMode', ['out_dir', 'proc_var', 'init_script', 'trials', 'variants'])
+
+EXEC_MODES = {
+    'time': ExecMode('time', 'LORE_PROC_PATH', 'popsicle-init-time.sh', 5, [
+        Variant('', 'gcc', ['-O0'], 'time'),
+    ]),
+    'gcc': ExecMode('gcc', 'LORE_PROC_PATH', 'popsicle-init-gcc.sh', 5, [
+        Variant('_O0', 'gcc', ['-O0'], 'time_O0'),
+        Variant('_O3', 'gcc', ['-O3'], 'time_O3'),
+    ]),
+    'unroll': ExecMode('unroll', 'LORE_PROC_CLANG_PATH', 'popsicle-init-unroll.sh', 3, [
+        Variant('_ur', 'clang', ['-O2', '-DPRAGMA_UNROLL="unroll(8)"'], 'time_ur'),
+        Variant('_nour', 'clang', ['-O2', '-fno-vectorize', '-DPRAGMA_UNROLL="nounroll"'], 'time_nour'),
+    ]),
+}
+
+# A program to measure (see measure_kernel): name, prefix of its files, list of parameter sets, mode name, path of the
+# list of PAPI events or None, time limit of a single execution, path of the build cache or None, whether to pass the
+# parameters on runtime and to execute all trials in one process, number of warm-up executions and whether to
+# initialise the arrays again between the executions in one process
+Task = namedtuple('Task', ['name', 'file_prefix', 'runs', 'mode', 'events_path', 'timeout', 'cache_path',
+                           'runtime_params', 'in_process', 'warmup', 'reinit'])
+
+# Result of measuring a program (or a part of its parameter sets): rows are pairs (variant index, values of a CSV row),
+# failed is the number of failed executions, cached - the number of binaries taken from the build cache, error - an
+# error message or None, idle - time (in seconds) the measurement core spent compiling
+KernelResult = namedtuple('KernelResult', ['name', 'rows', 'executed', 'failed', 'cached', 'error', 'idle'])
+
+# Default size limit of the build cache (in MB)
+BUILD_CACHE_SIZE = 4096
+
+# Default size limit of binaries built ahead of their measurement (in MB)
+MAX_PENDING = 1024
+
+# Deviation of the median parallel/serial time ratio above which the measurements are reported as disturbed
+CONTENTION_THRESHOLD = 0.05
+
+
+def pin_worker(cpus, parts=None):
+    """
+    Pool initializer: pins the worker to a CPU which is not used by any other worker.
+    :param cpus: Queue of free CPUs (see physical_cores)
+    :param parts: Queue receiving the results of the builds of programs (see measure_kernel_parts)
+    """
+    global worker_parts
+    worker_parts = parts
+    pin_to_cpu(cpus.get())
+
+
+# Queue of the results of builds in a pool worker (see pin_worker)
+worker_parts = None
+
+
+def task_builds(task: Task):
+    """
+    :return: List of builds of the program: tuples (names of the parameters passed on runtime, compilation flags with
+        the parameters, parameter sets to run)
+    """
+    if task.runtime_params:
+        params_names = sorted(set(p for params in task.runs for p in params_values(params)))
+        return [(params_names, [], task.runs)]
+    else:
+        return [([], shlex.split(params), [params]) for params in task.runs]
+
+
+def build_variants(task: Task, params_names, defines):
+    """
+    Compiles all variants of a program (or takes them from the build cache).
+    :return: List of KernelRunner (one for each variant)
+    :raises CalledProcessError: If the compilation fails (the runners are closed)
+    """
+    exec_mode = EXEC_MODES[task.mode]
+    cache = BuildCache(task.cache_path) if task.cache_path is not None else None
+
+    runners = [KernelRunner(task.file_prefix + '.c', params_names, v.compiler, v.flags + defines, cache=cache)
+               for v in exec_mode.variants]
+    try:
+        for runner in runners:
+            runner.compile()
+    except CalledProcessError:
+        for runner in runners:
+            runner.close()
+        raise
+
+    return runners
+
+
+def measure_build(task: Task, runners, runs):
+    """
+    Executes the compiled variants with the given parameter sets, the given number of times. The first failure skips
+    the remaining sets.
+
+    In-process, all trials of a variant are executed by a single exec_loop process (see KernelRunner.run_trials)
+    instead of starting it for every trial.
+
+    :return: Tuple (rows, executed, error message or None)
+    """
+    exec_mode = EXEC_MODES[task.mode]
+    exec_args = [task.events_path] if task.events_path is not None else []
+
+    if task.in_process:
+        # all trials of a variant in one process
+        rounds, trials = 1, exec_mode.trials
+    else:
+        # a process for every trial, variants in turns
+        rounds, trials = exec_mode.trials, 1
+    timeout = task.timeout * (trials + task.warmup) if task.timeout is not None else None
+
+    rows = []
+    executed = 0
+
+    for params in runs:
+        values = params_values(params) if task.runtime_params else None
+        for _ in range(rounds):
+            for i, runner in enumerate(runners):
+                lines = runner.run_trials(values, trials, task.warmup, timeout, args=exec_args, reinit=task.reinit)
+                if lines is None:
+                    return rows, executed, 'Execution error (' + params + ')'
+
+                rows.extend((i, [task.name, params] + line.split(',')) for line in lines)
+                executed += len(lines)
+
+    return rows, executed, None
+
+
+def measure_kernel(task: Task, on_part: Callable=None) -> KernelResult:
+    """
+    Measures a single program with all its parameter sets, like popsicle-exec-*.sh scripts: for each set, all variants
+    are compiled (in a private directory, or taken from the build cache) and executed in turns the given number of
+    times. The first failure skips the remaining sets of the program.
+
+    With runtime parameters, each variant is compiled only once, with the parameters read on runtime (see
+    runtime_param_defines), and executed with the values of every set.
+
+    :param on_part: Function called with the KernelResult of every build (see task_builds) as soon as it is measured
+        and whether the program is finished
+    :return: KernelResult of the whole program
+    """
+    merged = KernelResult(task.name, [], 0, 0, 0, None, 0)
+    builds = task_builds(task)
+
+    if len(builds) == 0 and on_part is not None:
+        on_part(merged, True)
+
+    for build_index, (params_names, defines, runs) in enumerate(builds):
+        start = time.time()
+        try:
+            runners = build_variants(task, params_names, defines)
+        except CalledProcessError as e:
+            part = KernelResult(task.name, [], 0, 0, 0, 'Compilation error: ' + e.stderr.decode().strip(),
+                                time.time() - start)
+        else:
+            idle = time.time() - start
+            try:
+                rows, executed, error = measure_build(task, runners, runs)
+            finally:
+                for runner in runners:
+                    runner.close()
+            part = KernelResult(task.name, rows, executed, 1 if error is not None else 0,
+                                sum(runner.cached for runner in runners), error, idle)
+
+        merged = merged._replace(rows=merged.rows + part.rows, executed=merged.executed + part.executed,
+                                 failed=merged.failed + part.failed, cached=merged.cached + part.cached,
+                                 error=part.error, idle=merged.idle + part.idle)
+        done = part.error is not None or build_index == len(builds) - 1
+        if on_part is not None:
+            on_part(part, done)
+        if done:
+            break
+
+    return merged
+
+
+def measure_kernel_parts(task: Task):
+    """
+    measure_kernel executed by pool workers: the result of every build is passed to the main process (see
+    pool_results) as soon as it is measured, so it can be written (and journaled) before the program is finished.
+    """
+    measure_kernel(task, on_part=lambda part, done: worker_parts.put((part, done)))
+
+
+def pool_results(pool: Pool, parts: Queue, tasks):
+    """
+    Measures the programs in a pool of workers, one program per worker (see measure_kernel_parts).
+    Exceptions raised by the workers are passed on, like by Pool.imap.
+    :param parts: The queue of results given to the workers (see pin_worker)
+    :param tasks: List of Task
+    :return: Iterator of pairs (KernelResult of a build, whether the program is finished)
+    """
+    async_result = pool.map_async(measure_kernel_parts, tasks, chunksize=1)
+    n_finished = 0
+
+    while n_finished < len(tasks):
+        try:
+            part, done = parts.get(timeout=1)
+        except queue.Empty:
+            if async_result.ready() and not async_result.successful():
+                async_result.get()
+            continue
+
+        n_finished += done
+        yield part, done
+
+
+def pipeline_build(job):
+    """
+    Builds a part of a program in BuildPipeline (see build_variants). Compilation errors are reported in the result,
+    other exceptions (e.g. a missing compiler) stop the campaign, like in the pool of measure_kernel.
+    :param job: Tuple (task, index of the build, names of runtime parameters, compilation flags, parameter sets)
+    :return: Pair ((task, runners or None, parameter sets, error message or None), size of the binaries)
+    """
+    task, _, params_names, defines, runs = job
+    try:
+        runners = build_variants(task, params_names, defines)
+    except CalledProcessError as e:
+        return (task, None, runs, 'Compilation error: ' + e.stderr.decode().strip()), 0
+
+    return (task, runners, runs, None), sum(os.path.getsize(runner.binary_path) for runner in runners)
+
+
+def pipeline_measure(item) -> KernelResult:
+    """
+    Measures a part of a program built by pipeline_build (see measure_build) and removes its binaries.
+    """
+    task, runners, runs, error = item
+    if error is not None:
+        return KernelResult(task.name, [], 0, 0, 0, error, 0)
+
+    try:
+        rows, executed, error = measure_build(task, runners, runs)
+    finally:
+        for runner in runners:
+            runner.close()
+
+    return KernelResult(task.name, rows, executed, 1 if error is not None else 0,
+                        sum(runner.cached for runner in runners), error, 0)
+
+
+def pipeline_results(pipeline: BuildPipeline, tasks):
+    """
+    Measures the programs in a BuildPipeline, where each build of a program (see task_builds) is a separate job.
+    The builds of a program are passed on in order, like in measure_kernel: a build is yielded as soon as it and all
+    the previous ones are measured, and the builds following a failed one are discarded, even though they may have been
+    measured already.
+    :param tasks: List of Task
+    :return: Iterator of pairs (KernelResult of a build, whether the program is finished)
+    """
+    jobs = [(task, i) + build for task in tasks for i, build in enumerate(task_builds(task))]
+    n_builds = {task.name: 0 for task in tasks}
+    for task, _, _, _, _ in jobs:
+        n_builds[task.name] += 1
+    parts = {task.name: {} for task in tasks}
+    next_build = {task.name: 0 for task in tasks}
+
+    # programs without any parameter set have nothing to build
+    for task in tasks:
+        if n_builds[task.name] == 0:
+            del parts[task.name]
+            yield KernelResult(task.name, [], 0, 0, 0, None, 0), True
+
+    for job_index, part in pipeline.run(jobs):
+        name = part.name
+        if name not in parts:
+            # the program is finished by a failure of a previous build
+            continue
+
+        parts[name][jobs[job_index][1]] = part
+        while next_build[name] in parts[name]:
+            part = parts[name].pop(next_build[name])
+            next_build[name] += 1
+            done = part.error is not None or next_build[name] == n_builds[name]
+            yield part, done
+
+            if done:
+                del parts[name]
+                break
+
+
+def read_runs(proc_dir, params_suffix):
+    """
+    :return: List of pairs (program name, parameter sets from (...)_params.txt or another file with given suffix) of
+        the programs listed in the catalog (if it exists) or all programs in the directory
+    """
+    if os.path.isfile(catalog_path(proc_dir)):
+        with Catalog(catalog_path(proc_dir)) as catalog:
+            names = [k['name'] for k in catalog.kernels()]
+    else:
+        names = sorted(n for n in os.listdir(proc_dir) if os.path.isfile(os.path.join(proc_dir, n, n + '.c')))
+
+    programs = []
+    for name in names:
+        try:
+            with open(os.path.join(proc_dir, name, name + '_' + params_suffix + '.txt'), 'r') as fin:
+                programs.append((name, [line.strip() for line in fin]))
+        except FileNotFoundError:
+            print('File ' + name + '_' + params_suffix + '.txt is missing!')
+
+    return programs
+
+
+def papi_events_header(events_path):
+    """
+    :return: Names of the measured PAPI events (the columns of exec_loop output, see papi-events.sh)
+    """
+    res = subprocess.run(['papi-events.sh'] + ([events_path] if events_path is not None else []),
+                         stdout=subprocess.PIPE, check=True)
+    return [e for e in res.stdout.decode().strip().split(',') if len(e) > 0]
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return str(seconds // 3600) + 'h ' + str(seconds % 3600 // 60) + 'm ' + str(seconds % 60) + 's'
+
+
+def output_sizes(writers):
+    """
+    Flushes the output files to the disk (see CampaignJournal).
+    :return: Dict: file name -> size
+    """
+    return {os.path.basename(writer.path): writer.sync() for writer in writers}
+
+
+def restore_outputs(journal: CampaignJournal, out_paths, headers):
+    """
+    Prepares the output files of an interrupted campaign to be appended to: truncates them to the sizes recorded by the
+    last entry of the journal, which removes the rows written after it (including a partially written one).
+    :param out_paths: Paths of the output files
+    :param headers: Expected columns of each file
+    :raises ValueError: If the files do not match the journal or the current options (e.g. another set of events)
+    """
+    sizes = journal.sizes
+
+    for path, header in zip(out_paths, headers):
+        if not os.path.isfile(path):
+            if os.path.basename(path) in sizes:
+                raise ValueError('Cannot resume: ' + path + ' is missing')
+            continue
+
+        size = sizes.get(os.path.basename(path), 0)
+        if size == 0 and os.path.getsize(path) > 0:
+            raise ValueError('Cannot resume: ' + path + ' is not recorded in the journal ' + journal.path)
+        if os.path.getsize(path) < size:
+            raise ValueError('Cannot resume: ' + path + ' is shorter than recorded in the journal ' + journal.path)
+        os.truncate(path, size)
+
+        if size > 0:
+            with open(path, 'r') as fin:
+                if next(csv.reader(fin), None) != header:
+                    raise ValueError('Cannot resume: columns of ' + path + ' differ from the measured ones')
+
+
+def print_status(journal_path, programs):
+    """
+    Prints the progress of a campaign (see CampaignJournal) and estimates the remaining time from the pace so far.
+    :param programs: List of pairs (program name, parameter sets) of the whole campaign (see read_runs)
+    """
+    entries = read_journal(journal_path)
+    if len(entries) == 0:
+        print('No journal of the campaign: ' + journal_path)
+        return
+
+    finished = done_programs(entries)
+    measured = done_runs(entries)
+    n_runs = sum(len(runs) for _, runs in programs)
+    n_measured = sum(len(set(runs) & measured.get(name, set())) for name, runs in programs)
+    # the sets following a failed one are not measured, but they are done as well
+    n_remaining = sum(len(set(runs) - measured.get(name, set())) for name, runs in programs if name not in finished)
+    executed = sum(e['executed'] for e in entries if 'alg' in e)
+    running = active_time(entries)
+
+    print('Programs: ' + str(len(finished & set(name for name, _ in programs))) + ' of ' + str(len(programs)) +
+          ' finished')
+    print('Parameter sets: ' + str(n_measured) + ' of ' + str(n_runs) + ' measured, ' + str(n_remaining) +
+          ' remaining')
+    print('Executions: ' + str(executed))
+    print('Running time: ' + format_duration(running) + ' (' + str(sum(1 for e in entries if 'start' in e)) +
+          ' starts)')
+    print('Last update: ' + format_duration(time.time() - max(e.get('time', e.get('start')) for e in entries)) +
+          ' ago')
+
+    if n_remaining == 0:
+        print('The campaign is complete')
+    elif n_measured > 0:
+        print('Estimated time remaining: ' + format_duration(running / n_measured * n_remaining))
+    else:
+        print('Estimated time remaining: unknown (no parameter sets measured yet)')
+
+
+def check_contention(tasks, times, n_samples, seed, out_path, cpu):
+    """
+    Measures a random sample of parameter sets again, one at a time, and compares the times with the ones measured in
+    parallel. Large differences mean that the workers disturbed each other (e.g. by sharing the memory bandwidth or the
+    last level cache), so fewer jobs should be used.
+
+    :param tasks: Dict: program name -> Task
+    :param times: Dict: (name, params, variant index) -> minimal time measured in parallel
+    :param out_path: Path of the CSV file with the comparison
+    :param cpu: CPU to run the measurements on
+    """
+    pin_to_cpu(cpu)
+
+    keys = sorted(set((name, params) for name, params, _ in times))
+    sample = random.Random(seed).sample(keys, min(n_samples, len(keys)))
+    ratios = []
+
+    print('Checking contention: measuring ' + str(len(sample)) + ' parameter sets serially...')
+
+    with MetadataWriter(out_path, ['alg', 'run', 'variant', 'parallel', 'serial', 'ratio']) as writer:
+        for name, params in sample:
+            result = measure_kernel(tasks[name]._replace(runs=[params]))
+            if result.error is not None:
+                print('\t' + name + ' ' + params + ': ' + result.error)
+                continue
+
+            for i, variant in enumerate(EXEC_MODES[tasks[name].mode].variants):
+                serial = min(float(row[-1]) for j, row in result.rows if j == i)
+                parallel = times[(name, params, i)]
+                ratio = parallel / serial if serial > 0 else float('nan')
+                writer.write([name, params, variant.column, parallel, serial, round(ratio, 4)])
+                ratios.append(ratio)
+
+    ratios = [r for r in ratios if r == r]
+    if len(ratios) == 0:
+        print('No measurements to compare')
+        return
+
+    median = statistics.median(ratios)
+    print('Parallel/serial time ratio: median ' + str(round(median, 3)) + ', min ' + str(round(min(ratios), 3)) +
+          ', max ' + str(round(max(ratios), 3)) + ' (details in ' + out_path + ')')
+    if abs(median - 1) > CONTENTION_THRESHOLD:
+        print('Warning: parallel measurements differ from serial ones by more than ' +
+              str(int(CONTENTION_THRESHOLD * 100)) + '% - consider using fewer jobs')
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('mode', choices=['t', 'time', 'g', 'gcc', 'u', 'unroll'],
+                           help='t (time), g (gcc) or u (unroll), as in popsicle-exec.sh')
+    argparser.add_argument('output', type=str, help='Output file name (without extension)')
+    argparser.add_argument('-j', '--jobs', type=int, default=None,
+                           help='Number of programs measured concurrently (default: the number of physical cores, '
+                                'except the ones used by --build-jobs)')
+    argparser.add_argument('-b', '--build-jobs', type=int, default=0,
+                           help='Number of cores compiling the programs ahead of their measurement (default: 0 - '
+                                'programs are compiled by the measurement workers)')
+    argparser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                           help='Size limit of the binaries compiled ahead (with --build-jobs) in MB (default: ' +
+                                str(MAX_PENDING) + ')')
+    argparser.add_argument('-e', '--events', type=str, default=None,
+                           help='Path to the list of PAPI events to measure (default: all available)')
+    argparser.add_argument('-t', '--timeout', type=float, default=10,
+                           help='Time limit of a single execution in seconds (default: 10)')
+    argparser.add_argument('-p', '--params', choices=['params', 'batch'], default='params',
+                           help='Parameter sets to run: (...)_params.txt (default) or (...)_batch.txt (see '
+                                'popsicle-select-lore)')
+    argparser.add_argument('-c', '--check-contention', type=int, default=0, metavar='N',
+                           help='Measure N random parameter sets again serially and compare the times')
+    argparser.add_argument('--seed', type=int, default=0, help='Seed of the contention check sample (default: 0)')
+    argparser.add_argument('-r', '--runtime-params', action='store_true',
+                           help='Compile each variant of a program once and pass the parameters on runtime')
+    argparser.add_argument('--in-process', action='store_true',
+                           help='Execute all trials of a binary in a single process')
+    argparser.add_argument('--warmup', type=int, default=0,
+                           help='Number of discarded executions before the measured ones in each process (default: 0)')
+    argparser.add_argument('--no-reinit', action='store_true',
+                           help='Do not initialise the arrays again between the executions in one process')
+    argparser.add_argument('--build-cache-dir', type=str, default=os.environ.get('LORE_BUILD_CACHE_PATH'),
+                           help='Directory of the cache of compiled binaries (default: LORE_BUILD_CACHE_PATH)')
+    argparser.add_argument('--no-build-cache', action='store_true', help='Compile every binary')
+    argparser.add_argument('--build-cache-size', type=int, default=BUILD_CACHE_SIZE,
+                           help='Size limit of the build cache in MB - the least recently used binaries above it are '
+                                'removed after the measurements (default: ' + str(BUILD_CACHE_SIZE) + ')')
+    argparser.add_argument('--resume', action='store_true',
+                           help='Continue an interrupted campaign with the same output name: skip the measured '
+                                'parameter sets and append to the existing files')
+    argparser.add_argument('--status', action='store_true',
+                           help='Only print the progress of the campaign and the estimated time remaining')
+    args = argparser.parse_args()
+
+    mode = {'t': 'time', 'g': 'gcc', 'u': 'unroll'}.get(args.mode, args.mode)
+    exec_mode = EXEC_MODES[mode]
+    events_path = os.path.abspath(args.events) if args.events is not None else None
+    cache_path = None
+    if args.build_cache_dir is not None and not args.no_build_cache:
+        cache_path = os.path.abspath(args.build_cache_dir)
+
+    if args.runtime_params and mode == 'unroll':
+        raise ValueError('Programs for loop unrolling use the parameters directly as loop bounds - they must be '
+                         'compiled with each parameter set')
+
+    check_config([exec_mode.proc_var, 'OUT_DIR'])
+    proc_dir = os.path.abspath(os.environ[exec_mode.proc_var])
+    out_dir = os.path.join(os.path.abspath(os.environ['OUT_DIR']), exec_mode.out_dir)
+    journal_path = os.path.join(out_dir, args.output + '_journal.jsonl')
+
+    if args.status:
+        print_status(journal_path, read_runs(proc_dir, args.params))
+        return
+
+    check_config('PAPI_UTILS_PATH')
+
+    cpus = physical_cores()
+    jobs = args.jobs if args.jobs is not None else len(cpus) - args.build_jobs
+    if not 1 <= jobs <= len(cpus) - args.build_jobs:
+        raise ValueError('Number of jobs and build jobs must not exceed the number of physical cores (' +
+                         str(len(cpus)) + '), with at least one job')
+    measure_cpus = cpus[:jobs]
+    build_cpus = cpus[jobs:jobs + args.build_jobs]
+
+    print('Compiling...')
+    subprocess.run([exec_mode.init_script], check=True)
+    events = papi_events_header(events_path)
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    programs = read_runs(proc_dir, args.params)
+    out_paths = [os.path.join(out_dir, args.output + v.suffix + '.csv') for v in exec_mode.variants]
+    headers = [['alg', 'run'] + events + [v.column] for v in exec_mode.variants]
+
+    journal = CampaignJournal(journal_path, resume=args.resume)
+    if args.resume:
+        try:
+            restore_outputs(journal, out_paths, headers)
+        except ValueError:
+            journal.close()
+            raise
+
+        finished = done_programs(journal.entries)
+        measured = done_runs(journal.entries)
+        programs = [(name, [params for params in runs if params not in measured.get(name, set())])
+                    for name, runs in programs if name not in finished]
+        print('Resuming: ' + str(len(finished)) + ' programs finished, ' +
+              str(sum(len(runs) for runs in measured.values())) + ' parameter sets measured')
+
+    tasks = {name: Task(name, os.path.join(proc_dir, name, name), runs, mode, events_path, args.timeout, cache_path,
+                        args.runtime_params, args.in_process, args.warmup, not args.no_reinit)
+             for name, runs in programs}
+    n_tasks = len(tasks)
+
+    print('Measuring ' + str(n_tasks) + ' programs on ' + str(jobs) + ' cores: ' +
+          ', '.join(str(c) for c in measure_cpus))
+    if len(build_cpus) > 0:
+        print('Compiling on ' + str(len(build_cpus)) + ' cores: ' + ', '.join(str(c) for c in build_cpus))
+
+    writers = [MetadataWriter(path, header, append=args.resume) for path, header in zip(out_paths, headers)]
+    journal.start(output_sizes(writers))
+    catalog = Catalog(catalog_path(proc_dir)) if os.path.isfile(catalog_path(proc_dir)) else None
+
+    if len(build_cpus) > 0:
+        pool = None
+        pipeline = BuildPipeline(pipeline_build, pipeline_measure, measure_cpus, build_cpus, args.max_pending * 2 ** 20)
+    else:
+        free_cpus = Queue()
+        for cpu in measure_cpus:
+            free_cpus.put(cpu)
+        parts = Queue()
+        pool = Pool(jobs, initializer=pin_worker, initargs=(free_cpus, parts))
+        pipeline = None
+
+    executed = 0
+    failed = 0
+    cached = 0
+    idle = 0
+    times = {}
+    program_executed = {name: 0 for name in tasks}
+    n_finished = 0
+    start_time = time.time()
+
+    try:
+        if pipeline is not None:
+            results = pipeline_results(pipeline, [tasks[name] for name, _ in programs])
+        else:
+            results = pool_results(pool, parts, [tasks[name] for name, _ in programs])
+
+        for result, done in results:
+            name = result.name
+            for j, row in result.rows:
+                writers[j].write(row)
+                key = (name, row[1], j)
+                times[key] = min(times.get(key, float('inf')), float(row[-1]))
+
+            # the rows are on the disk before the journal entry, so an interrupted campaign never loses them
+            runs = list(dict.fromkeys(row[1] for _, row in result.rows))
+            journal.add(name, runs, result.executed, done, output_sizes(writers))
+
+            program_executed[name] += result.executed
+            executed += result.executed
+            failed += result.failed
+            cached += result.cached
+            idle += result.idle
+
+            if not done:
+                continue
+
+            n_finished += 1
+            print('[' + str(n_finished) + '/' + str(n_tasks) + '] ' + name + ': ' + str(program_executed[name]) +
+                  ' executions')
+            if result.error is not None:
+                print('\t' + result.error)
+
+            if catalog is not None and args.params == 'params':
+                catalog.set_executed(name, mode)
+    except KeyboardInterrupt:
+        print('Interrupted - run again with --resume to continue')
+        raise
+    finally:
+        if pipeline is not None:
+            pipeline.terminate()
+        else:
+            pool.terminate()
+        for writer in writers:
+            writer.close()
+        journal.close()
+        if catalog is not None:
+            catalog.close()
+
+    wall_time = max(time.time() - start_time, 1e-9)
+
+    print('=========')
+    print(str(executed) + ' executed, ' + str(failed) + ' skipped.')
+    if cache_path is not None:
+        n_builds = sum(1 if args.runtime_params else len(runs) for _, runs in programs) * len(exec_mode.variants)
+        print(str(cached) + ' of ' + str(n_builds) + ' binaries taken from the build cache.')
+    print('Time: ' + format_duration(time.time() - start_time))
+    if pipeline is not None:
+        print('Measurement cores idle (waiting for binaries): ' +
+              ', '.join(str(cpu) + ': ' + str(round(100 * t / wall_time, 1)) + '%' for cpu, t in
+                        sorted(pipeline.idle.items())) +
+              '; peak size of pending binaries: ' + str(pipeline.peak_pending // 2 ** 20) + ' MB')
+    else:
+        print('Measurement cores idle (compiling): ' + str(round(100 * idle / (wall_time * jobs), 1)) + '%')
+
+    if args.check_contention > 0:
+        check_contention(tasks, times, args.check_contention, args.seed,
+                         os.path.join(out_dir, args.output + '_contention.csv'), cpus[0])
+
+    if cache_path is not None:
+        removed, freed = BuildCache(cache_path).evict(args.build_cache_size * 2 ** 20)
+        if removed > 0:
+            print('Build cache: removed ' + str(removed) + ' binaries (' + str(freed // 2 ** 20) + ' MB)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from typing import List, Tuple
+
+
+@lru_cache(maxsize=None)
+def compiler_version(compiler: str) -> str:
+    """
+    :return: The first line of 'compiler --version' (e.g. 'gcc (Ubuntu 9.4.0-1ubuntu1~20.04) 9.4.0')
+    """
+    res = subprocess.run([compiler, '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return res.stdout.decode().split('\n')[0].strip()
+
+
+def file_digest(path: str) -> str:
+    """
+    :return: Hash of the contents of a file
+    """
+    stat = os.stat(path)
+    return cached_digest(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=4096)
+def cached_digest(path: str, mtime_ns: int, size: int) -> str:
+    """
+    file_digest of a file which has not changed since (mtime_ns, size) - the headers are shared by all programs, so
+    they are only read once.
+    """
+    with open(path, 'rb') as fin:
+        return hashlib.sha256(fin.read()).hexdigest()
+
+
+def dependencies(source_path: str, compiler: str, flags: List[str]) -> List[str]:
+    """
+    :return: Paths of all files included by the program (including system headers and papi_utils.h), as listed by
+        'compiler -M'
+    :raises subprocess.CalledProcessError: If the compiler fails (e.g. a header is missing)
+    """
+    res = subprocess.run([compiler, '-M', source_path] + flags, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         check=True)
+    rule = res.stdout.decode().replace('\\\n', ' ')
+    return sorted(set(rule.split(':', 1)[-1].split()) - {source_path})
+
+
+@lru_cache(maxsize=None)
+def static_library(compiler: str, flag: str) -> str:
+    """
+    :param flag: A library flag, e.g. -lpapi
+    :return: Path of the static library linked by the flag (e.g. /usr/local/lib/libpapi.a) or the flag itself if the
+        compiler cannot find it
+    """
+    name = 'lib' + flag[2:] + '.a'
+    res = subprocess.run([compiler, '-print-file-name=' + name], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    path = res.stdout.decode().strip()
+    return path if os.path.isabs(path) and os.path.isfile(path) else flag
+
+
+class BuildCache:
+    """
+    A persistent, content-addressed cache of linked executables (see KernelRunner).
+
+    An entry is identified by the hash of everything affecting the binary: the source code of the program and all
+    headers it includes (e.g. papi_utils.h, see dependencies), the compiler and its version, the compilation flags
+    (including -D defines of parameters and PRAGMA_UNROLL) and the objects and static libraries linked with it
+    (exec_loop.o, papi_utils.o, libpapi.a). Therefore, the same program with the same parameters is only compiled once,
+    even in different campaigns, and it is compiled again whenever any of them changes.
+
+    Entries are written atomically, so the cache can be safely shared by multiple worker processes. Every hit updates
+    the modification time of the entry, so evict() removes the least recently used ones.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    @staticmethod
+    def key(source_path: str, compiler: str, flags: List[str], link_inputs: List[str]) -> str:
+        """
+        :param source_path: Path of the source code
+        :param compiler: C compiler
+        :param flags: Compilation flags
+        :param link_inputs: Objects (paths) and libraries (e.g. -lpapi) linked with the program
+        :return: Hex digest identifying the entry
+        :raises subprocess.CalledProcessError: If the headers of the program cannot be listed
+        """
+        link = [static_library(compiler, i) if i.startswith('-l') else i for i in link_inputs]
+        key_data = json.dumps({
+            'source': file_digest(source_path),
+            'headers': {path: file_digest(path) for path in dependencies(source_path, compiler, flags)},
+            'compiler': compiler,
+            'version': compiler_version(compiler),
+            'flags': flags,
+            'link': [file_digest(i) if os.path.isfile(i) else i for i in link],
+        }, sort_keys=True)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, dest_path: str) -> bool:
+        """
+        Places the cached executable at dest_path (as a hard link if possible).
+        :return: True if found, False otherwise
+        """
+        entry_path = self.__entry_path(key)
+
+        try:
+            os.utime(entry_path)
+            try:
+                os.link(entry_path, dest_path)
+            except OSError:
+                shutil.copy2(entry_path, dest_path)
+        except OSError:
+            return False
+
+        return True
+
+    def put(self, key: str, binary_path: str):
+        entry_path = self.__entry_path(key)
+        entry_dir = os.path.dirname(entry_path)
+
+        if not os.path.isdir(entry_dir):
+            os.makedirs(entry_dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copy2(binary_path, tmp_path)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def evict(self, max_size: int) -> Tuple[int, int]:
+        """
+        Removes the least recently used entries until the total size of the cache does not exceed max_size.
+        :param max_size: Size limit (in bytes)
+        :return: Tuple (number of removed entries, number of freed bytes)
+        """
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for f in files:
+                try:
+                    stat = os.stat(os.path.join(root, f))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, f)))
+
+        total = sum(e[1] for e in entries)
+        removed, freed = 0, 0
+
+        for _, size, path in sorted(entries):
+            if total - freed <= max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+
+        return removed, freed
+
+    # PRIVATE MEMBERS
+
+    def __entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
@@ -0,0 +1,165 @@
+import queue
+import time
+import traceback
+from multiprocessing import Condition, Process, Queue, Value
+from typing import Callable, Iterable, Iterator, Tuple
+from popsicle.exec_utils.cpu_topology import pin_to_cpu
+
+
+class PipelineError(Exception):
+    """
+    An exception raised by the build or measure function in a worker process. Its message is the traceback from the
+    worker.
+    """
+    pass
+
+
+class BuildPipeline:
+    """
+    Builds binaries ahead of their measurement: builder processes (pinned to their own cores) compile the jobs in order
+    and pass the results to measurement processes (pinned to other cores), so the measurement cores do not wait for the
+    compiler and the compiler does not disturb the measurements.
+
+    The built but not yet measured binaries are kept on disk. When their total size exceeds max_pending (in bytes), the
+    builders wait until some of them are measured and removed.
+
+    Usage:
+        pipeline = BuildPipeline(build, measure, measure_cpus=[0, 1], build_cpus=[2], max_pending=2**30)
+        for job_index, result in pipeline.run(jobs):
+            ...
+        print(pipeline.idle)
+
+    :param build: Function: job -> (item, size of its files in bytes). Executed by the builders.
+    :param measure: Function: item -> result. It should remove the files of the item. Executed by the measurement
+        processes.
+    Both functions should report expected failures (e.g. compilation errors) in their results. Any other exception
+    stops the pipeline: run() raises PipelineError, like Pool.imap does, and so it does if a worker process dies.
+    """
+    def __init__(self,
+                 build: Callable,
+                 measure: Callable,
+                 measure_cpus: Iterable[int],
+                 build_cpus: Iterable[int],
+                 max_pending: int):
+        self.build = build
+        self.measure = measure
+        self.measure_cpus = list(measure_cpus)
+        self.build_cpus = list(build_cpus)
+        self.max_pending = max_pending
+
+        # time (in seconds) each measurement core spent waiting for binaries
+        self.idle = {}
+        # the largest total size of pending binaries (in bytes)
+        self.peak_pending = 0
+
+        self.processes = []
+
+    def run(self, jobs: Iterable) -> Iterator[Tuple[int, object]]:
+        """
+        :return: Iterator of pairs (index of the job, result of measure), in the order of completion
+        :raises PipelineError: If build or measure raised an exception or a worker process died
+        """
+        jobs = list(jobs)
+        build_queue = Queue()
+        ready_queue = Queue()
+        results_queue = Queue()
+        pending = Value('q', 0)
+        peak = Value('q', 0)
+        released = Condition(pending.get_lock())
+
+        for i, job in enumerate(jobs):
+            build_queue.put((i, job))
+        for _ in self.build_cpus:
+            build_queue.put(None)
+
+        self.processes = \
+            [Process(target=self.__build_worker,
+                     args=(cpu, build_queue, ready_queue, results_queue, pending, peak, released))
+             for cpu in self.build_cpus] + \
+            [Process(target=self.__measure_worker, args=(cpu, ready_queue, results_queue, pending, released))
+             for cpu in self.measure_cpus]
+
+        for p in self.processes:
+            p.start()
+
+        for _ in range(len(jobs)):
+            i, result = self.__next_result(results_queue)
+            if isinstance(result, PipelineError):
+                raise result
+            yield i, result
+
+        for _ in self.measure_cpus:
+            ready_queue.put(None)
+        for _ in self.measure_cpus:
+            cpu, idle = results_queue.get()
+            self.idle[cpu] = idle
+
+        for p in self.processes:
+            p.join()
+        self.peak_pending = peak.value
+
+    def terminate(self):
+        for p in self.processes:
+            if p.is_alive():
+                p.terminate()
+
+    # PRIVATE MEMBERS
+
+    def __next_result(self, results_queue):
+        """
+        Waits for a result, checking that all workers are still alive (a worker killed e.g. by a signal would never
+        send its result).
+        """
+        while True:
+            try:
+                return results_queue.get(timeout=1)
+            except queue.Empty:
+                dead = [p for p in self.processes if p.exitcode is not None and p.exitcode != 0]
+                if len(dead) > 0:
+                    raise PipelineError('A worker process of the build pipeline died (exit code ' +
+                                        str(dead[0].exitcode) + ')')
+
+    def __build_worker(self, cpu, build_queue, ready_queue, results_queue, pending, peak, released):
+        pin_to_cpu(cpu)
+
+        for i, job in iter(build_queue.get, None):
+            try:
+                item, size = self.build(job)
+            except Exception:
+                results_queue.put((i, PipelineError('Building job ' + str(i) + ' failed:\n' + traceback.format_exc())))
+                continue
+
+            with released:
+                # a single item larger than the limit is passed anyway, otherwise the pipeline would stop
+                while pending.value > 0 and pending.value + size > self.max_pending:
+                    released.wait()
+                pending.value += size
+                peak.value = max(peak.value, pending.value)
+
+            ready_queue.put((i, item, size))
+
+    def __measure_worker(self, cpu, ready_queue, results_queue, pending, released):
+        pin_to_cpu(cpu)
+        idle = 0
+
+        while True:
+            start = time.time()
+            ready = ready_queue.get()
+            idle += time.time() - start
+
+            if ready is None:
+                break
+
+            i, item, size = ready
+            try:
+                result = self.measure(item)
+            except Exception:
+                result = PipelineError('Measuring job ' + str(i) + ' failed:\n' + traceback.format_exc())
+
+            with released:
+                pending.value -= size
+                released.notify_all()
+
+            results_queue.put((i, result))
+
+        results_queue.put((cpu, idle))
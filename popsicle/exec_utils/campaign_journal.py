@@ -0,0 +1,126 @@
+import json
+import os
+import time
+from typing import Dict, Iterable, List
+
+
+class CampaignJournal:
+    """
+    An append-only log of the completed work of a measurement campaign (see popsicle-exec-lore --resume), written next
+    to its output files. Each line is a JSON object - either a (re)start of the campaign:
+        {"start": 1600000000.0, "sizes": {"run_O0.csv": 52, "run_O3.csv": 52}}
+    or measured parameter sets of a program (done is set when the program is finished - all its sets are measured or
+    one of them failed):
+        {"alg": "program1", "runs": ["-D PARAM_N=100"], "executed": 10, "done": false, "time": ..., "sizes": {...}}
+
+    sizes are the sizes of the output files (by name) right after the rows of the entry were written and synced to
+    disk. When a campaign is resumed, the files are truncated to the sizes from the last entry, so the rows written
+    after it (including a partially written one) are removed and measured again. An incomplete last line of the
+    journal itself is ignored.
+
+    Usage:
+        with CampaignJournal(path, resume=True) as journal:
+            done_programs(journal.entries)
+            journal.add('program1', ['-D PARAM_N=100'], 10, False, {'run_O0.csv': 1234, 'run_O3.csv': 1234})
+    """
+    def __init__(self, path: str, resume: bool=False):
+        """
+        :param path: Path of the journal
+        :param resume: If set to True, the existing entries are loaded. Otherwise, the journal is truncated.
+        """
+        self.path = path
+        self.entries = read_journal(path) if resume else []
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if not resume:
+            flags |= os.O_TRUNC
+        self.fd = os.open(path, flags, 0o644)
+
+    @property
+    def sizes(self) -> Dict[str, int]:
+        """
+        :return: Sizes of the output files recorded by the last entry (empty if there are no entries)
+        """
+        return self.entries[-1]['sizes'] if len(self.entries) > 0 else {}
+
+    def start(self, sizes: Dict[str, int]):
+        self.__append({'start': time.time(), 'sizes': sizes})
+
+    def add(self, alg: str, runs: Iterable[str], executed: int, done: bool, sizes: Dict[str, int]):
+        self.__append({'alg': alg, 'runs': list(runs), 'executed': executed, 'done': done, 'time': time.time(),
+                       'sizes': sizes})
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # PRIVATE MEMBERS
+
+    def __append(self, entry):
+        os.write(self.fd, (json.dumps(entry) + '\n').encode('utf-8'))
+        os.fsync(self.fd)
+        self.entries.append(entry)
+
+
+def read_journal(path: str) -> List[dict]:
+    """
+    :return: Entries of the journal (an empty list if it does not exist)
+    """
+    entries = []
+    try:
+        with open(path, 'r') as fin:
+            for line in fin:
+                if not line.endswith('\n'):
+                    break
+                entries.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def done_programs(entries: List[dict]) -> set:
+    """
+    :return: Names of the finished programs
+    """
+    return set(e['alg'] for e in entries if e.get('done'))
+
+
+def done_runs(entries: List[dict]) -> Dict[str, set]:
+    """
+    :return: Dict: program name -> measured parameter sets
+    """
+    runs = {}
+    for e in entries:
+        if 'alg' in e:
+            runs.setdefault(e['alg'], set()).update(e['runs'])
+    return runs
+
+
+def active_time(entries: List[dict]) -> float:
+    """
+    :return: Time (in seconds) the campaign was running: the sum over all its (re)starts of the time until the last
+        entry following it
+    """
+    total = 0
+    start = None
+    last = None
+
+    for e in entries:
+        if 'start' in e:
+            if last is not None:
+                total += last - start
+            start, last = e['start'], None
+        elif start is not None:
+            last = e['time']
+
+    if last is not None:
+        total += last - start
+
+    return total
@@ -0,0 +1,50 @@
+import os
+from typing import List, Set
+
+
+def parse_cpu_list(text: str) -> Set[int]:
+    """
+    Parses a list of CPUs in the format used by the kernel (e.g. in /sys/devices/system/cpu).
+
+    Example: '0-3,8' -> {0, 1, 2, 3, 8}
+    """
+    cpus = set()
+    for part in text.strip().split(','):
+        if len(part) == 0:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def smt_siblings(cpu: int) -> Set[int]:
+    """
+    :return: Logical CPUs sharing the physical core with the given one (including itself)
+    """
+    try:
+        with open('/sys/devices/system/cpu/cpu' + str(cpu) + '/topology/thread_siblings_list', 'r') as fin:
+            return parse_cpu_list(fin.read())
+    except (IOError, ValueError):
+        return {cpu}
+
+
+def physical_cores() -> List[int]:
+    """
+    Selects a single logical CPU of each physical core available to the process (the lowest-numbered one). The other
+    SMT siblings are never used, so processes pinned to the returned CPUs do not share any core.
+    """
+    available = os.sched_getaffinity(0)
+    cores = set()
+    for cpu in available:
+        cores.add(min(smt_siblings(cpu) & available))
+    return sorted(cores)
+
+
+def pin_to_cpu(cpu: int):
+    """
+    Restricts the current process (and the processes it starts later) to a single logical CPU.
+    """
+    os.sched_setaffinity(0, {cpu})
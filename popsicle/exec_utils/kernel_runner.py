@@ -0,0 +1,207 @@
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+from typing import List, Mapping, Optional
+from popsicle.exec_utils.build_cache import BuildCache
+from popsicle.utils import check_config
+
+check_config('PAPI_UTILS_PATH')
+papi_utils_path = os.path.abspath(os.environ['PAPI_UTILS_PATH'])
+
+LINK_LIBS = ['-lpfm', '-lpapi', '-lm']
+
+# 'static' - exec_loop.o, papi_utils.o and the PAPI libraries are linked with every program (like popsicle-compile-*.sh
+#   scripts used to)
+# 'prelinked' - they are linked once into popsicle_harness.o (by popsicle-init-*.sh scripts), so linking a program only
+#   resolves the C library. The binary is still static, so the measurements do not change.
+LINK_MODES = ('static', 'prelinked')
+HARNESS_OBJECT = 'popsicle_harness.o'
+
+
+def physical_memory() -> int:
+    """
+    :return: Size of the physical memory of the machine (in bytes)
+    """
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def default_link_mode() -> str:
+    """
+    :return: 'prelinked' if the harness object has been built, 'static' otherwise
+    """
+    return 'prelinked' if os.path.isfile(os.path.join(papi_utils_path, HARNESS_OBJECT)) else 'static'
+
+
+def link_inputs(link_mode: str) -> List[str]:
+    """
+    :param link_mode: One of LINK_MODES
+    :return: Objects and libraries linked with a program, e.g. ['.../exec_loop.o', '.../papi_utils.o', '-lpfm', ...]
+    """
+    if link_mode == 'prelinked':
+        return [os.path.join(papi_utils_path, HARNESS_OBJECT), '-lm', '-static']
+    elif link_mode == 'static':
+        return [os.path.join(papi_utils_path, 'exec_loop.o'),
+                os.path.join(papi_utils_path, 'papi_utils.o')] + LINK_LIBS + ['-static']
+    else:
+        raise ValueError('Incorrect \'link_mode\' value - expected one of: ' + ', '.join(LINK_MODES))
+
+
+def runtime_param_defines(params_names: List[str]) -> List[str]:
+    """
+    Compiler flags which make the values of PARAM_* macros read on runtime (see popsicle_param in papi_utils.h).
+
+    Example: ['PARAM_N'] -> ['-DPARAM_N=popsicle_param("PARAM_N")']
+    """
+    return ['-D' + p + '=popsicle_param("' + p + '")' for p in params_names]
+
+
+class KernelRunner:
+    """
+    Compiles a transformed program once (with exec_loop, like popsicle-compile-*.sh scripts) and runs it with different
+    parameter values, which are passed on runtime through environment variables.
+
+    The binary is built in a private temporary directory, so multiple runners do not overwrite each other's files.
+    It is removed by close(). If a BuildCache is given, the binary is taken from it instead of compiling whenever the
+    same program was already built with the same flags, and stored in it otherwise.
+
+    Usage:
+        with KernelRunner('proc/program1/program1.c', ['PARAM_N']) as runner:
+            runner.compile()
+            time = runner.run({'PARAM_N': 1000}, timeout=10)
+    """
+    def __init__(self,
+                 source_path: str,
+                 params_names: List[str],
+                 compiler: str='gcc',
+                 flags: List[str]=None,
+                 cache: BuildCache=None,
+                 link_mode: str=None):
+        """
+        :param source_path: Path of the transformed program
+        :param params_names: Names of the parameters to be set on runtime, e.g. ['PARAM_N', 'PARAM_M']
+        :param compiler: C compiler
+        :param flags: Additional compilation flags (default: -O0, as in popsicle-compile-time.sh)
+        :param cache: Cache of linked executables (optional)
+        :param link_mode: One of LINK_MODES (default: 'prelinked' if the harness object has been built)
+        """
+        self.source_path = os.path.abspath(source_path)
+        self.params_names = list(params_names)
+        self.compiler = compiler
+        self.flags = ['-O0'] if flags is None else list(flags)
+        self.cache = cache
+        self.link_mode = link_mode if link_mode is not None else default_link_mode()
+        self.cached = False
+
+        self.build_dir = tempfile.mkdtemp(prefix='popsicle_')
+        self.binary_path = os.path.join(self.build_dir, 'exec_loop')
+
+    def compile(self):
+        """
+        Builds the binary (or takes it from the cache - then self.cached is set to True).
+        :raises subprocess.CalledProcessError: If the compilation or linking fails
+        """
+        obj_path = os.path.join(self.build_dir, 'kernel.o')
+        flags = self.flags + runtime_param_defines(self.params_names)
+        inputs = link_inputs(self.link_mode)
+
+        key = None
+        if self.cache is not None:
+            key = BuildCache.key(self.source_path, self.compiler, flags, inputs)
+            self.cached = self.cache.get(key, self.binary_path)
+            if self.cached:
+                return
+
+        subprocess.run([self.compiler, '-c', self.source_path, '-o', obj_path] + flags,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+        subprocess.run([self.compiler, obj_path] + inputs + ['-o', self.binary_path],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+        if key is not None:
+            self.cache.put(key, self.binary_path)
+
+    def run(self, values: Mapping[str, int], timeout: float=None, memory_limit: int=None) -> Optional[float]:
+        """
+        Executes the program once.
+
+        :param values: Values of the parameters
+        :param timeout: Time limit of the execution (in seconds)
+        :param memory_limit: Limit of the address space of the process (in bytes)
+        :return: Measured time (in milliseconds, the last column of exec_loop output) or None if the program failed,
+            ran out of memory or exceeded the time limit
+        """
+        output = self.run_output(values, timeout, memory_limit)
+        if output is None:
+            return None
+
+        try:
+            return float(output.split(',')[-1])
+        except ValueError:
+            return None
+
+    def run_output(self,
+                   values: Mapping[str, int]=None,
+                   timeout: float=None,
+                   memory_limit: int=None,
+                   args: List[str]=None) -> Optional[str]:
+        """
+        Executes the program once. Parameters as in run().
+
+        :param args: Arguments of exec_loop (e.g. the path of the list of PAPI events to measure)
+        :return: The last line of exec_loop output (values of PAPI counters and the time, comma-separated) or None if
+            the program failed, ran out of memory or exceeded the time limit
+        """
+        lines = self.run_trials(values, 1, 0, timeout, memory_limit, args)
+        return lines[-1] if lines is not None else None
+
+    def run_trials(self,
+                   values: Mapping[str, int]=None,
+                   trials: int=1,
+                   warmup: int=0,
+                   timeout: float=None,
+                   memory_limit: int=None,
+                   args: List[str]=None,
+                   reinit: bool=True) -> Optional[List[str]]:
+        """
+        Executes the measured region several times in a single process (see exec_loop.c), so the startup of the
+        program and the initialisation of PAPI are not repeated. Other parameters as in run_output().
+
+        :param trials: Number of measured executions
+        :param warmup: Number of executions before the measured ones, whose results are discarded
+        :param timeout: Time limit of the whole process (in seconds)
+        :param reinit: Whether to initialise the arrays again before every execution (disable only if the program
+            does not depend on the values of its arrays)
+        :return: Lines of exec_loop output (one for each measured execution) or None if the program failed, ran out of
+            memory, exceeded the time limit or printed fewer lines
+        """
+        env = dict(os.environ)
+        env.update({name: str(value) for name, value in (values or {}).items()})
+        env.update({'POPSICLE_TRIALS': str(trials), 'POPSICLE_WARMUP': str(warmup),
+                    'POPSICLE_REINIT': '1' if reinit else '0'})
+
+        def limit_memory():
+            if memory_limit is not None:
+                resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+        try:
+            res = subprocess.run([self.binary_path] + (args or []), env=env, timeout=timeout,
+                                 preexec_fn=limit_memory, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except subprocess.TimeoutExpired:
+            return None
+
+        if res.returncode != 0:
+            return None
+
+        lines = [line for line in res.stdout.decode().strip().split('\n') if len(line) > 0]
+        return lines[-trials:] if len(lines) >= trials else None
+
+    def close(self):
+        shutil.rmtree(self.build_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,268 @@
+import math
+import warnings
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from popsicle.code_transform_utils.trip_count import TripCount
+
+SAMPLINGS = ('diagonal', 'sobol', 'lhs')
+
+# Parameter space of a program: each of its parameters ranges from low to high. trip_counts (see
+# read_trip_counts) restrict the space to points whose total trip count is between the ones of (low, ..., low) and
+# (high, ..., high), i.e. the range found by the calibration - None if they are not known.
+ParamSpace = namedtuple('ParamSpace', ['params_names', 'low', 'high', 'loop_depth', 'trip_counts'])
+
+# Operations of Opaque factors (see SymExpr.evaluate) on float arrays. The others (bitwise) are not supported.
+ARRAY_OPS = {
+    '/': lambda l, r: np.trunc(l / r),
+    '%': np.fmod,
+    '<<': lambda l, r: l * np.exp2(r),
+    '>>': lambda l, r: np.floor(l / np.exp2(r)),
+    '<': lambda l, r: (l < r).astype(float),
+    '>': lambda l, r: (l > r).astype(float),
+    '<=': lambda l, r: (l <= r).astype(float),
+    '>=': lambda l, r: (l >= r).astype(float),
+    '==': lambda l, r: (l == r).astype(float),
+    '!=': lambda l, r: (l != r).astype(float),
+    '&&': lambda l, r: np.logical_and(l, r).astype(float),
+    '||': lambda l, r: np.logical_or(l, r).astype(float),
+}
+
+
+def allocate_budget(budget: int, weights: Sequence[float]) -> List[int]:
+    """
+    Splits the total number of parameter sets between programs proportionally to weights (largest remainder method).
+    Every program gets at least one set, unless the budget is smaller than the number of programs.
+
+    Example: allocate_budget(10, [1, 2, 2]) -> [2, 4, 4]
+    """
+    n = len(weights)
+    if n == 0:
+        return []
+    if budget < n:
+        return [1] * budget + [0] * (n - budget)
+
+    total = float(sum(weights))
+    shares = [1 + (budget - n) * w / total for w in weights]
+    counts = [int(math.floor(s)) for s in shares]
+
+    by_remainder = sorted(range(n), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[:budget - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+class ShiftedSobol:
+    """
+    A scrambled Sobol sequence shared by the designs of several parameter spaces, shifted randomly (modulo 1) for
+    each of them. Every design takes the points of the sequence in order, so its first n_points are a prefix of the
+    sequence (balanced if n_points is a power of 2) and the points drawn again (see redraw_points) are the next ones.
+    """
+    def __init__(self, n_spaces: int, dim: int, rng: np.random.RandomState):
+        from scipy.stats import qmc
+        self.engine = qmc.Sobol(dim, scramble=True, seed=rng.randint(2**31))
+        self.points = np.empty((0, dim))
+        self.shifts = rng.random_sample((n_spaces, dim))
+        self.used = np.zeros(n_spaces, dtype=np.int64)
+
+    def draw(self, spaces: np.ndarray) -> np.ndarray:
+        """
+        :param spaces: For each point to draw, the index of its parameter space (sorted)
+        :return: Array of shape (len(spaces), dim) - the next points of the design of each space
+        """
+        rank = np.arange(len(spaces)) - np.searchsorted(spaces, spaces)
+        positions = self.used[spaces] + rank
+        self.used += np.bincount(spaces, minlength=len(self.used))
+
+        missing = int(positions.max(initial=-1)) + 1 - len(self.points)
+        if missing > 0:
+            with warnings.catch_warnings():
+                # scipy warns about every draw which is not a power of 2, i.e. for most batches and all redraws
+                warnings.simplefilter('ignore', UserWarning)
+                self.points = np.concatenate([self.points, self.engine.random(missing)])
+
+        return np.mod(self.points[positions] + self.shifts[spaces], 1.0)
+
+
+def unit_designs(sampling: str, counts: np.ndarray, dim: int, rng: np.random.RandomState):
+    """
+    Space-filling designs in the unit cube, a different one for each parameter space.
+
+    sobol - a scrambled Sobol sequence, shifted randomly for each space (see ShiftedSobol)
+    lhs - a Latin hypercube: every parameter takes a value from each of count equal intervals exactly once
+
+    :param counts: Number of points of each design, shape (n_spaces,)
+    :return: Pair (array of shape (n_spaces, max(counts), dim) with values in [0, 1) - the rows after the count of a
+        space are not used, ShiftedSobol drawing further points or None)
+    """
+    n_spaces, n_points = len(counts), int(counts.max())
+    used = np.arange(n_points)[np.newaxis, :] < counts[:, np.newaxis]
+
+    if sampling == 'sobol':
+        sequence = ShiftedSobol(n_spaces, dim, rng)
+        units = np.zeros((n_spaces, n_points, dim))
+        units[used] = sequence.draw(np.nonzero(used)[0])
+        return units, sequence
+
+    if sampling == 'lhs':
+        # the unused rows get the greatest keys, so the first count strata of every space are a permutation
+        keys = rng.random_sample((n_spaces, dim, n_points)) + ~used[:, np.newaxis, :]
+        strata = keys.argsort(axis=2).transpose((0, 2, 1))
+        units = (strata + rng.random_sample((n_spaces, n_points, dim))) / counts[:, np.newaxis, np.newaxis]
+        units[~used] = 0
+        return units, None
+
+    raise ValueError('Incorrect sampling: ' + str(sampling))
+
+
+def redraw_points(units: np.ndarray, pending: np.ndarray, counts: np.ndarray, sequence: Optional[ShiftedSobol],
+                  rng: np.random.RandomState):
+    """
+    Draws new values of the rejected points of all designs at once (in place).
+
+    With lhs, the design stays a Latin hypercube: for each parameter, the strata of the rejected points of a space
+    are shuffled between them. With sobol, the rejected points are replaced with the next points of the sequence.
+
+    :param units: Designs, array of shape (n_spaces, n_points, dim) (see unit_designs)
+    :param pending: Boolean mask of the rejected points, shape (n_spaces, n_points)
+    :param counts: Number of points of each design, shape (n_spaces,)
+    """
+    spaces, points = np.nonzero(pending)
+
+    if sequence is not None:
+        units[spaces, points] = sequence.draw(spaces)
+        return
+
+    n_points = counts[spaces].astype(float)[:, np.newaxis]
+    strata = np.floor(units[spaces, points] * n_points)
+    for j in range(units.shape[2]):
+        # a random order within each space (spaces are sorted)
+        order = np.lexsort((rng.random_sample(len(spaces)), spaces))
+        strata[:, j] = strata[order, j]
+    units[spaces, points] = (strata + rng.random_sample(strata.shape)) / n_points
+
+
+def scale_designs(units: np.ndarray, low: np.ndarray, high: np.ndarray, loop_depth: np.ndarray) -> np.ndarray:
+    """
+    Maps designs from the unit cube to the parameter ranges, so that param^loop_depth (which is roughly proportional to
+    the execution time) is uniformly distributed, like in intermediate_value.
+
+    :param units: Array of shape (n_spaces, n_points, dim)
+    :param low: Lower ends of the ranges, shape (n_spaces,)
+    :param high: Upper ends of the ranges, shape (n_spaces,)
+    :param loop_depth: Exponents, shape (n_spaces,)
+    :return: Array of integer values of the same shape as units
+    """
+    p = np.maximum(loop_depth, 1).astype(float)[:, np.newaxis, np.newaxis]
+    low_p = np.power(low.astype(float)[:, np.newaxis, np.newaxis], p)
+    high_p = np.power(high.astype(float)[:, np.newaxis, np.newaxis], p)
+    return np.round(np.power(low_p + units * (high_p - low_p), 1 / p)).astype(np.int64)
+
+
+def trip_count_array(trip_counts: Optional[List[Optional[TripCount]]],
+                     values: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+    """
+    Vectorised total_trip_count: the total trip count for each of the points (approximate, computed on floats).
+    :param values: Parameter name -> array of its values
+    :return: Array of trip counts or None if any of them is unknown or cannot be evaluated
+    """
+    if trip_counts is None or len(trip_counts) == 0 or any(tc is None for tc in trip_counts):
+        return None
+
+    try:
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            total = sum(np.maximum(np.trunc(tc.numerator.evaluate(values, ARRAY_OPS) / tc.denominator), 0)
+                        for tc in trip_counts)
+    except KeyError:
+        return None
+
+    if np.ndim(total) == 0 or not np.all(np.isfinite(total)):
+        return None
+    return total
+
+
+def sample_params(spaces: List[ParamSpace], counts: List[int], sampling: str='sobol', seed: int=0,
+                  max_rounds: int=8) -> List[List[Tuple[int, ...]]]:
+    """
+    Generates parameter sets covering the parameter space of each program (not only its diagonal, where all
+    parameters are equal). Programs with the same number of parameters are processed together.
+
+    For each program, a design of count points is drawn (see unit_designs). The points which do not satisfy the trip
+    count constraint (see ParamSpace), so the memory (bounded by high) or the execution time would exceed the range of
+    the diagonal, and the duplicates (after rounding to integers) are rejected. Only the rejected points are drawn again
+    (see redraw_points), at most max_rounds times, so a small range can yield fewer sets. Parameters are never 0, even
+    if the range starts at 0 (not calibrated).
+
+    :param spaces: Parameter spaces of the programs
+    :param counts: Number of parameter sets of each program
+    :param sampling: 'sobol' or 'lhs' (see unit_designs)
+    :return: For each program, a list of tuples of parameter values (in the order of params_names), sorted by their
+        product
+    """
+    rng = np.random.RandomState(seed)
+    results = [[] for _ in spaces]
+
+    by_dim = {}
+    for i, space in enumerate(spaces):
+        if counts[i] > 0:
+            by_dim.setdefault(len(space.params_names), []).append(i)
+
+    for dim, indices in sorted(by_dim.items()):
+        if dim == 0:
+            for i in indices:
+                results[i] = [()]
+            continue
+
+        samples = sample_spaces([spaces[i] for i in indices], np.array([counts[i] for i in indices]), dim, sampling,
+                                rng, max_rounds)
+        for i, sample in zip(indices, samples):
+            results[i] = sample
+
+    return results
+
+
+def sample_spaces(spaces: List[ParamSpace], counts: np.ndarray, dim: int, sampling: str, rng: np.random.RandomState,
+                  max_rounds: int) -> List[List[Tuple[int, ...]]]:
+    """
+    Samples the parameter spaces of programs with dim parameters (see sample_params).
+    :return: For each program, a list of distinct points, sorted by the product of values
+    """
+    low = np.maximum(np.array([space.low for space in spaces], dtype=float), 1)
+    high = np.maximum(np.array([space.high for space in spaces], dtype=float), 1)
+    depth = np.array([space.loop_depth for space in spaces], dtype=float)
+
+    units, sequence = unit_designs(sampling, counts, dim, rng)
+    pending = np.arange(units.shape[1])[np.newaxis, :] < counts[:, np.newaxis]
+
+    diagonals = [trip_count_array(space.trip_counts, {p: np.array([low[k], high[k]]) for p in space.params_names})
+                 for k, space in enumerate(spaces)]
+    selected = [set() for _ in spaces]
+
+    for _ in range(max_rounds):
+        points = scale_designs(units, low, high, depth)
+
+        for k, space in enumerate(spaces):
+            indices = np.flatnonzero(pending[k])
+            if len(indices) == 0:
+                continue
+
+            candidates = points[k, indices]
+            feasible = np.ones(len(candidates), dtype=bool)
+
+            values = {p: candidates[:, j].astype(float) for j, p in enumerate(space.params_names)}
+            trip_counts = trip_count_array(space.trip_counts, values)
+            if trip_counts is not None and diagonals[k] is not None:
+                feasible = (trip_counts >= diagonals[k][0]) & (trip_counts <= diagonals[k][1])
+
+            for index, point, ok in zip(indices, candidates, feasible):
+                point = tuple(int(v) for v in point)
+                if ok and point not in selected[k]:
+                    selected[k].add(point)
+                    pending[k, index] = False
+
+        if not pending.any():
+            break
+
+        redraw_points(units, pending, counts, sequence, rng)
+
+    return [sorted(points, key=lambda point: (np.prod(point, dtype=float), point)) for points in selected]
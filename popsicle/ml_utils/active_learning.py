@@ -0,0 +1,51 @@
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KNeighborsRegressor
+
+
+def neighbour_disagreement(regr: KNeighborsRegressor, y_train: np.array, x: np.array) -> np.array:
+    """
+    Estimates the uncertainty of the predictions of a fitted KNN regressor: the standard deviation of the logarithms of
+    the targets of the nearest neighbours, weighted by the inverse distance (like the prediction itself).
+    Logarithms are used, since the targets (times, speedups) are positive and span several orders of magnitude.
+
+    :param regr: Fitted regressor
+    :param y_train: Targets of the training samples (in the order used to fit regr)
+    :param x: Transformed features of the candidates
+    :return: Array of uncertainties (0 if all neighbours agree)
+    """
+    dist, ind = regr.kneighbors(x)
+    log_y = np.log(np.maximum(np.asarray(y_train, dtype=float)[ind], 1e-9))
+    weights = 1 / np.maximum(dist, 1e-9)
+
+    mean = (weights * log_y).sum(axis=1) / weights.sum(axis=1)
+    var = (weights * (log_y - mean[:, np.newaxis]) ** 2).sum(axis=1) / weights.sum(axis=1)
+    return np.sqrt(var)
+
+
+def select_batch(candidates: pd.Index, scores: np.array, batch_size: int, max_per_alg: int=1) \
+        -> List[Tuple[str, str]]:
+    """
+    Selects the candidates with the highest scores. At most max_per_alg candidates of the same program are selected,
+    so that the batch is not spent on a single uncertain program.
+
+    :param candidates: Index of (alg, run) pairs
+    :param scores: Score of each candidate (e.g. neighbour_disagreement)
+    :return: List of selected (alg, run) pairs, from the highest score
+    """
+    batch = []
+    per_alg = {}
+
+    for i in np.argsort(-np.asarray(scores), kind='stable'):
+        alg, run = candidates[i]
+        if per_alg.get(alg, 0) >= max_per_alg:
+            continue
+
+        batch.append((alg, run))
+        per_alg[alg] = per_alg.get(alg, 0) + 1
+
+        if len(batch) == batch_size:
+            break
+
+    return batch
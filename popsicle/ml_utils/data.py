@@ -16,9 +16,13 @@ class Data:
             self.mode = 'unroll'
             self.drop_cols = ['time_ur', 'time_nour', 'max_arr_dim', 'loop_depth']
             self.y_col = 'speedup'
+        elif mode in ('static', 's'):
+            self.mode = 'static'
+            self.drop_cols = []
+            self.y_col = 'time'
         elif mode in ('predict', 'p'):
             self.mode = 'predict'
-            self.drop_cols = []
+            self.drop_cols = ['max_arr_dim', 'loop_depth']
             self.y_col = 'time'
         else:
             raise Exception('Unknown mode')
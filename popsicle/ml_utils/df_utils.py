@@ -1,7 +1,11 @@
 import os
-from typing import Tuple, List
+from typing import Dict, Tuple, List, Iterable
 from random import shuffle
 import pandas as pd
+from popsicle.catalog import Catalog, catalog_path
+from popsicle.code_transform_utils.shared_parser import get_parser
+from popsicle.code_transform_utils.access_patterns import ACCESS_FEATURES
+from popsicle.code_transform_utils.trip_count import params_values, read_trip_counts, total_trip_count
 from popsicle.ml_utils.data_set import DataSet
 from popsicle.utils import check_config
 
@@ -17,6 +21,50 @@ def df_aggregate(df: pd.DataFrame) -> pd.DataFrame:
     return df.groupby(['alg', 'run']).min()
 
 
+def df_add_static_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the static features (see STATIC_FEATURES), the access pattern features (see ACCESS_FEATURES) and the total
+    trip count of each run ('trip_count' column) to a DataFrame indexed by (alg, run). Programs without static
+    features are dropped.
+    """
+    algs = df.index.get_level_values(0).unique()
+    df_static = get_df_static(algs=algs)
+    df_access = get_df_meta(algs=algs, columns=ACCESS_FEATURES)
+    trip_counts = get_trip_counts(algs)
+
+    df = df.join(df_static, on='alg', how='inner').join(df_access, on='alg', how='inner')
+    df['trip_count'] = [run_trip_count(trip_counts.get(alg), run) for alg, run in df.index]
+    return df
+
+
+def get_runs(algs: Iterable[str]=None) -> pd.MultiIndex:
+    """
+    All runs which can be measured: (alg, run) pairs from (...)_params.txt files (or the catalog, if it exists).
+    Programs without parameters are skipped.
+    :param algs: If provided, only runs of these programs are listed
+    """
+    pairs = []
+
+    if os.path.isfile(catalog_path(proc_dir)):
+        with Catalog(catalog_path(proc_dir)) as catalog:
+            for kernel in catalog.kernels():
+                pairs.extend((kernel['name'], run) for run in catalog.params(kernel['name']))
+    else:
+        for file_name in sorted(os.listdir(proc_dir)):
+            try:
+                with open(os.path.join(proc_dir, file_name, file_name + '_params.txt'), 'r') as fin:
+                    pairs.extend((file_name, line.strip()) for line in fin)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    if algs is not None:
+        algs = set(algs)
+        pairs = [(alg, run) for alg, run in pairs if alg in algs]
+
+    pairs = [(alg, run) for alg, run in pairs if len(run) > 0]
+    return pd.MultiIndex.from_tuples(pairs, names=['alg', 'run'])
+
+
 def df_get_index_col(df: pd.DataFrame, col: str) -> List:
     """
     Finds a column with given name in DataFrame's index.
@@ -78,8 +126,69 @@ def df_train_test_split(df: pd.DataFrame, test_split: float=0.3) -> Tuple[pd.Dat
     return df_train, df_test
 
 
-def get_df_meta() -> pd.DataFrame:
+def get_df_meta(algs: Iterable[str]=None, columns: List[str]=None, chunksize: int=100000) -> pd.DataFrame:
     """
     Loads metadata to a DataFrame, which then can be merged with the rest of data.
+    :param algs: If provided, only metadata of these programs is loaded. The file is then read in chunks, so the
+        metadata of the entire corpus is never kept in memory at once.
+    :param columns: If provided, only these columns are loaded (in addition to 'alg' index)
+    :param chunksize: Number of rows read at once (only if algs is provided)
     """
-    return pd.read_csv(os.path.join(proc_dir, 'metadata.csv'), index_col='alg')
+    return read_proc_csv('metadata.csv', algs, columns, chunksize)
+
+
+def get_df_static(algs: Iterable[str]=None, columns: List[str]=None, chunksize: int=100000) -> pd.DataFrame:
+    """
+    Loads static features of programs (see STATIC_FEATURES) to a DataFrame. Parameters as in get_df_meta().
+    """
+    return read_proc_csv('static_features.csv', algs, columns, chunksize)
+
+
+def get_trip_counts(algs: Iterable[str]) -> Dict[str, List]:
+    """
+    Loads trip counts of loop nests of given programs (see read_trip_counts).
+    :return: Dict: program name -> list of TripCount (or None if the file is missing)
+    """
+    parser = get_parser()
+    res = {}
+
+    for alg in algs:
+        try:
+            res[alg] = read_trip_counts(os.path.join(proc_dir, alg, alg + '_trip_counts.txt'), parser)
+        except (IOError, ValueError):
+            res[alg] = None
+
+    return res
+
+
+def run_trip_count(trip_counts: List, run: str) -> int:
+    """
+    :param trip_counts: Trip counts of the loop nests of a program (or None if unknown)
+    :param run: Parameters of the run (as in (...)_params.txt)
+    :return: Total trip count or -1 if unknown
+    """
+    if trip_counts is None:
+        return -1
+    total = total_trip_count(trip_counts, params_values(run))
+    return total if total is not None else -1
+
+
+def read_proc_csv(file_name: str, algs: Iterable[str]=None, columns: List[str]=None,
+                  chunksize: int=100000) -> pd.DataFrame:
+    """
+    Loads a CSV file from LORE_PROC_PATH indexed by 'alg'. See get_df_meta() for the parameters.
+    """
+    path = os.path.join(proc_dir, file_name)
+    usecols = None if columns is None else ['alg'] + list(columns)
+
+    if algs is None:
+        return pd.read_csv(path, index_col='alg', usecols=usecols)
+
+    algs = set(algs)
+    chunks = [chunk.loc[chunk.index.isin(algs)]
+              for chunk in pd.read_csv(path, index_col='alg', usecols=usecols, chunksize=chunksize)]
+
+    if len(chunks) == 0:
+        return pd.read_csv(path, index_col='alg', usecols=usecols, nrows=0)
+
+    return pd.concat(chunks)
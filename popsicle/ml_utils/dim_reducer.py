@@ -193,7 +193,8 @@ class DimReducer:
                     best_n_neighbors = n_neighbors
 
         feats_list = sorted(best_feats)
-        if require_tot_ins and 'PAPI_TOT_INS' not in feats_list:
+        # PAPI_TOT_INS is missing in static mode, which does not use PAPI counters
+        if require_tot_ins and 'PAPI_TOT_INS' in data.x.columns and 'PAPI_TOT_INS' not in feats_list:
             feats_list.insert(0, 'PAPI_TOT_INS')
 
         print()
@@ -2,7 +2,8 @@ import os
 import pandas as pd
 from typing import List
 from popsicle.ml_utils.data import Data
-from popsicle.ml_utils.df_utils import df_aggregate, df_sort_cols, df_scale_by_tot_ins, get_df_meta
+from popsicle.ml_utils.df_utils import df_aggregate, df_sort_cols, df_scale_by_tot_ins, get_df_meta, \
+    df_add_static_features
 from popsicle.utils import check_config
 
 check_config(['OUT_DIR'])
@@ -29,7 +30,7 @@ class FileLoader:
         self.dim = dim
         self.scaler = scaler
         self.df = None
-        self.df_meta = get_df_meta()
+        self.df_meta = None
 
         if mode in ('time', 't'):
             self.load = self.load_time
@@ -43,8 +44,14 @@ class FileLoader:
         elif mode in ('predict', 'p'):
             self.load = self.load_predict
             self.mode = 'predict'
+        elif mode in ('static', 's'):
+            self.load = self.load_static
+            self.mode = 'static'
         else:
             raise Exception('Unknown feature selection mode')
+
+        # static mode uses the results of time measurements, but none of the PAPI counters
+        self.data_dir = 'time' if self.mode == 'static' else self.mode
             
         self.load()
 
@@ -86,25 +93,54 @@ class FileLoader:
 
         self.data = Data(self.mode, self.df, self.scaler)
 
+    def load_static(self):
+        """
+        Loads execution times together with the static features of programs (see STATIC_FEATURES) and the total trip
+        count of their loop nests for the parameters of each run. PAPI counters are not used, so a model trained on
+        this data can make predictions for programs which have never been executed.
+        """
+        self.df = self.__csv_to_df(cols=['alg', 'run', 'time'])
+
+        self.__df_filter_by_min_time('time')
+        self.__df_add_static_features()
+        self.__df_sort_cols()
+
+        self.data = Data(self.mode, self.df, self.scaler)
+
     def load_predict(self):
-        df = self.__csv_to_df()
+        self.df = self.__csv_to_df()
 
-        if any(df['time'] < min_time):
+        if any(self.df['time'] < min_time):
             raise ValueError('Execution time should be at leat 100ms to perform prediction!')
 
-        df = df_sort_cols(df)
-        self.data = Data(self.mode, df, self.scaler)
+        # the same columns as in training: metadata of LORE programs or the access pattern features of user programs
+        # (see popsicle-transform-user-input --metadata), -1 for unknown values
+        self.__df_add_metadata(self.__read_user_metadata())
+        self.__df_sort_cols()
+        self.data = Data(self.mode, self.df, self.scaler)
 
     # PRIVATE MEMBERS
 
-    def __df_add_metadata(self):
+    def __df_add_metadata(self, user_meta: List[pd.DataFrame]=None):
+        self.df_meta = get_df_meta(algs=self.df.index.get_level_values(0).unique())
+
+        if user_meta:
+            self.df_meta = pd.concat([self.df_meta] + user_meta, sort=False).fillna(-1)
+            self.df_meta = self.df_meta.loc[~self.df_meta.index.duplicated(keep='last')]
+
         for col in self.df_meta.columns:
             if col != 'alg':
                 self.df[col] = self.df.index.get_level_values(0)
                 self.df[col] = self.df[col].apply(lambda alg: self.__get_metadata(alg, col))
 
-                if self.dim is not None:
-                    self.df = self.df.loc[self.df[col].isin(self.dim)]
+        if self.dim is not None:
+            self.df = self.df.loc[self.df['max_arr_dim'].isin(self.dim)]
+
+    def __df_add_static_features(self):
+        self.df = df_add_static_features(self.df)
+
+        if self.dim is not None:
+            self.df = self.df.loc[self.df['max_arr_dim'].isin(self.dim)]
 
     def __df_add_speedup_col(self, col_before, col_after):
         self.df['speedup'] = self.df[col_before] / self.df[col_after]
@@ -126,7 +162,7 @@ class FileLoader:
         :param cols: Which columns to load
         :return: DataFrame
         """
-        paths = [os.path.join(out_dir, self.mode, p) for p in self.files]
+        paths = [os.path.join(out_dir, self.data_dir, p) for p in self.files]
 
         dfs = [pd.read_csv(path + name_suffix + '.csv', error_bad_lines=False) for path in paths]
         df = pd.concat(dfs, join='inner')
@@ -140,6 +176,13 @@ class FileLoader:
 
         return df
 
+    def __read_user_metadata(self) -> List[pd.DataFrame]:
+        """
+        Loads the metadata saved next to the input files ([file]_meta.csv, see popsicle-predict.sh)
+        """
+        paths = [os.path.join(out_dir, self.data_dir, p) + '_meta.csv' for p in self.files]
+        return [pd.read_csv(path, index_col='alg') for path in paths if os.path.isfile(path)]
+
     def __get_metadata(self, alg: str, col: str):
         try:
             return self.df_meta.loc[alg, col]
@@ -2,68 +2,179 @@ import math
 import argparse
 import os
 
+from popsicle.catalog import Catalog, catalog_path
+from popsicle.code_transform_utils.shared_parser import get_parser
+from popsicle.code_transform_utils.trip_count import read_trip_counts
+from popsicle.exec_utils.params_sampler import SAMPLINGS, ParamSpace, allocate_budget, sample_params
 from popsicle.ml_utils.df_utils import get_df_meta
 from popsicle.utils import check_config
 
 
-def intermediate_value(k, k_max, n_params, max_param):
-    return int(math.pow(k / k_max, 1/n_params) * max_param)
+def intermediate_value(k, k_max, n_params, max_param, min_param=0):
+    """
+    k-th of k_max values between min_param and max_param. The values are distributed so that param^n_params (which
+    is roughly proportional to the execution time) grows linearly with k.
+    """
+    low, high = math.pow(min_param, n_params), math.pow(max_param, n_params)
+    return int(round(math.pow(low + k / k_max * (high - low), 1/n_params), 6))
+
+
+def read_min_param(path):
+    """
+    Reads the lower end of the parameter range, written by popsicle-calibrate-lore (0 if the program was not
+    calibrated).
+    """
+    try:
+        with open(path, 'r') as fin:
+            return int(fin.read())
+    except FileNotFoundError:
+        return 0
+
+
+def params_lines(n_values, params_names, loop_depth, max_param, min_param=0):
+    """
+    :return: Lines of (...)_params.txt, e.g. ['-D PARAM_N=50', '-D PARAM_N=100'] (a single empty line if the program
+        has no parameters)
+    """
+    if len(params_names) == 0:
+        return ['']
+
+    lines = []
+    for k in range(1, n_values + 1):
+        value = intermediate_value(k, n_values, loop_depth, max_param, min_param)
+        lines.append(' '.join(['-D ' + p + '=' + str(value) for p in params_names]))
+    return lines
+
+
+def defines_lines(params_names, points):
+    """
+    Example: ['PARAM_N', 'PARAM_M'], [(10, 20)] -> ['-D PARAM_N=10 -D PARAM_M=20']
+    """
+    if len(params_names) == 0:
+        return ['']
+    return [' '.join(['-D ' + p + '=' + str(v) for p, v in zip(params_names, point)]) for point in points]
+
+
+def read_kernel_trip_counts(proc_dir, file_name):
+    """
+    :return: Trip counts of a program (see popsicle-transform-lore) or None if they are not available
+    """
+    try:
+        return read_trip_counts(os.path.join(proc_dir, file_name, file_name + '_trip_counts.txt'), get_parser())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def read_kernels(proc_dir):
+    """
+    Reads the parameters of all programs from (...)_params_names.txt, (...)_max_param.txt and (...)_min_param.txt
+    files and metadata.csv (used if the directory has no catalog, e.g. it was transformed by an older version).
+
+    :return: List of tuples (name, parameter names, loop depth, max_param, min_param) or (name, error message)
+    """
+    df_meta = get_df_meta(columns=['loop_depth'])
+    kernels = []
+
+    for file_name in sorted(os.listdir(proc_dir)):
+        file_prefix = os.path.join(proc_dir, file_name, file_name)
+        if not os.path.isdir(os.path.join(proc_dir, file_name)):
+            continue
+
+        try:
+            with open(file_prefix + '_params_names.txt', 'r') as fin_names, \
+                    open(file_prefix + '_max_param.txt', 'r') as fin_max:
+                params_names = [p for p in fin_names.read().strip().split(',') if len(p) > 0]
+                max_param = int(fin_max.read())
+        except FileNotFoundError:
+            kernels.append((file_name, 'File (...)_params_names.txt or (...)_max_param.txt is missing.'))
+            continue
+
+        try:
+            loop_depth = df_meta.loc[file_name, 'loop_depth']
+        except KeyError:
+            kernels.append((file_name, 'Cannot generate params - unknown loop depth'))
+            continue
+
+        kernels.append((file_name, params_names, loop_depth, max_param,
+                        read_min_param(file_prefix + '_min_param.txt')))
+
+    return kernels
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("n_values", type=int, help="Number of values to generate")
+    parser.add_argument("n_values", type=int, nargs='?', default=None,
+                        help="Number of values to generate for each program")
     parser.add_argument('-u', '--unroll', action='store_true', help='Generate parameters for unroll speedup prediction')
+    parser.add_argument('-s', '--sampling', choices=SAMPLINGS, default='diagonal',
+                        help='Sampling of the parameter space: the same value of all parameters (diagonal, default), '
+                             'a Sobol sequence (sobol) or a Latin hypercube (lhs)')
+    parser.add_argument('-b', '--budget', type=int, default=None,
+                        help='Total number of values to generate for all programs (instead of n_values), split '
+                             'between programs proportionally to their number of parameters')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the sobol and lhs sampling (default: 0)')
     args = parser.parse_args()
     n_values = args.n_values
     unroll = args.unroll
+    sampling = args.sampling
+
+    if (n_values is None) == (args.budget is None):
+        parser.error('exactly one of n_values and --budget is required')
 
     var_name = 'LORE_PROC_CLANG_PATH' if unroll else 'LORE_PROC_PATH'
     check_config([var_name])
     proc_dir = os.path.abspath(os.environ[var_name])
 
-    dirs = os.listdir(proc_dir)
-    n_dirs = len(dirs)
+    catalog = Catalog(catalog_path(proc_dir)) if os.path.isfile(catalog_path(proc_dir)) else None
+
+    if catalog is not None:
+        kernels = [(k['name'], [p for p in k['params_names'].split(',') if len(p) > 0], k['loop_depth'],
+                    k['max_param'], k['min_param'] or 0) for k in catalog.kernels()]
+    else:
+        kernels = read_kernels(proc_dir)
+
+    n_kernels = len(kernels)
+
+    # kernel name -> lines of (...)_params.txt
+    valid = [k for k in kernels if len(k) > 2]
+    if args.budget is not None:
+        counts = allocate_budget(args.budget, [max(len(k[1]), 1) for k in valid])
+    else:
+        counts = [n_values] * len(valid)
+
+    if sampling == 'diagonal':
+        lines_of = {k[0]: params_lines(count, k[1], k[2], k[3], k[4]) for k, count in zip(valid, counts)}
+    else:
+        spaces = [ParamSpace(params_names, min_param, max_param, loop_depth, read_kernel_trip_counts(proc_dir, name))
+                  for name, params_names, loop_depth, max_param, min_param in valid]
+        samples = sample_params(spaces, counts, sampling, args.seed)
+        lines_of = {k[0]: defines_lines(k[1], points) for k, points in zip(valid, samples)}
 
     parsed = 0
     failed = 0
 
-    df_meta = get_df_meta()
+    try:
+        for i, kernel in enumerate(kernels):
+            file_name = kernel[0]
+            print('[' + str(i + 1) + '/' + str(n_kernels) + '] Generating params for ' + file_name)
 
-    for i, file_name in enumerate(dirs):
-        if not os.path.isdir(os.path.join(proc_dir, file_name)):
-            failed += 1
-            continue
+            if len(kernel) == 2:
+                failed += 1
+                print('\t' + kernel[1])
+                continue
 
-        print('[' + str(i) + '/' + str(n_dirs) + '] Generating params for ' + file_name)
+            lines = lines_of[file_name]
 
-        try:
-            with open(os.path.join(proc_dir, file_name, file_name + '_params.txt'), 'w') as fout, \
-                    open(os.path.join(proc_dir, file_name, file_name + '_params_names.txt'), 'r') as fin_names, \
-                    open(os.path.join(proc_dir, file_name, file_name + '_max_param.txt'), 'r') as fin_max:
+            with open(os.path.join(proc_dir, file_name, file_name + '_params.txt'), 'w') as fout:
+                fout.write(''.join(line + '\n' for line in lines))
 
-                max_param = int(fin_max.read())
-                param_names = fin_names.read().strip().split(',')
-                try:
-                    loop_depth = df_meta.loc[file_name, 'loop_depth']
-                except KeyError:
-                    print('\tCannot generate params - unknown loop depth')
-                    failed += 1
-                    continue
-
-                if len(param_names) > 0 and len(param_names[0]) > 0:
-                    for k in range(1, n_values + 1):
-                        defines = ['-D ' + p + '=' + str(intermediate_value(k, n_values, loop_depth, max_param))
-                                   for p in param_names]
-                        fout.write(' '.join(defines) + '\n')
-                else:
-                    fout.write('\n')
-
-                parsed += 1
+            if catalog is not None:
+                catalog.set_params(file_name, lines)
 
-        except FileNotFoundError:
-            failed += 1
-            print('\tFile (...)_params_names.txt or (...)_max_param.txt is missing.')
+            parsed += 1
+    finally:
+        if catalog is not None:
+            catalog.close()
 
     print('========')
     print(str(parsed) + ' parsed, ' + str(failed) + ' skipped')
@@ -1,9 +1,11 @@
 from __future__ import print_function
 import argparse
 import os
+import pandas as pd
 from sklearn.externals import joblib
+from popsicle.ml_utils.df_utils import df_add_static_features, df_sort_cols, get_runs
 from popsicle.ml_utils.file_loader import FileLoader
-from popsicle.utils import check_config
+from popsicle.utils import check_config, MetadataWriter
 
 check_config(['OUT_DIR', 'MODELS_DIR'])
 
@@ -18,14 +20,58 @@ def load_models():
     return scaler, dim_reducer, regr
 
 
+def predict_static(algs, out_path):
+    """
+    Predicts the execution time of runs which have not been executed, with a model trained in static mode (see
+    popsicle-train static). The features are built like in training: the static features and the access pattern
+    features of each program and the trip count of each run of (...)_params.txt (see df_add_static_features).
+    :param algs: Names of the programs or None (all programs in LORE_PROC_PATH)
+    :param out_path: Path of the CSV file with predictions
+    """
+    runs = get_runs(algs)
+    df = df_sort_cols(df_add_static_features(pd.DataFrame(index=runs)))
+    n_skipped = len(runs.get_level_values(0).unique()) - len(df.index.get_level_values(0).unique())
+    print('Runs to predict: ' + str(len(df)) + ' (' + str(n_skipped) + ' programs without static features skipped)')
+    if len(df) == 0:
+        return
+
+    scaler, dim_reducer, regr = load_models()
+    x = pd.DataFrame(scaler.transform(df), index=df.index, columns=df.columns)
+    y = regr.predict(dim_reducer.transform(x))
+
+    with MetadataWriter(out_path, ['alg', 'run', 'time']) as writer:
+        for (alg, run), time in zip(df.index, y):
+            writer.write([alg, run, time])
+
+    print('Predicted times saved to ' + out_path)
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input', action='append', required=True,
-                        help='<Required> input files in CSV format (names without extensions). You can provide multiple'
-                             ' files (-i file1 -i file2...).')
+    parser.add_argument('-i', '--input', action='append', default=[],
+                        help='Input files in CSV format (names without extensions). You can provide multiple files '
+                             '(-i file1 -i file2...). Required unless --static is used.')
+    parser.add_argument('-s', '--static', action='store_true',
+                        help='Predict the time of programs which have not been executed, with a model trained in '
+                             'static mode')
+    parser.add_argument('-a', '--alg', action='append', default=None,
+                        help='With --static: program to predict (default: all programs in LORE_PROC_PATH). You can '
+                             'provide multiple programs (-a alg1 -a alg2...).')
+    parser.add_argument('-o', '--output', type=str, default='static',
+                        help='With --static: output file name, without extension (default: static)')
     args = parser.parse_args()
     files = args.input
 
+    if args.static:
+        predict_dir = os.path.join(out_dir, 'predict')
+        if not os.path.isdir(predict_dir):
+            os.makedirs(predict_dir)
+        predict_static(args.alg, os.path.join(predict_dir, args.output + '.csv'))
+        return
+
+    if len(files) == 0:
+        parser.error('at least one input file (-i) is required without --static')
+
     scaler, dim_reducer, regr = load_models()
     fl = FileLoader(files, mode='p', scaler=scaler)
 
@@ -0,0 +1,121 @@
+from __future__ import print_function
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.preprocessing import RobustScaler
+from popsicle.ml_utils.active_learning import neighbour_disagreement, select_batch
+from popsicle.ml_utils.data_set import DataSet
+from popsicle.ml_utils.df_utils import df_add_static_features, df_get_index_col, get_runs
+from popsicle.ml_utils.dim_reducer import DimReducer
+from popsicle.ml_utils.file_loader import FileLoader, out_dir
+from popsicle.ml_utils.ml_utils import regr_score
+from popsicle.utils import check_config
+
+# Minimal number of measured programs to train a model (cross-validation in regr_score uses 3 groups of programs)
+MIN_ALGS = 3
+
+
+def read_measured(files) -> set:
+    """
+    :param files: Results of time measurements (names without extensions, as in popsicle-train)
+    :return: All measured (alg, run) pairs, including the runs shorter than the minimal time, which are not used for
+        training, but should not be measured again either
+    """
+    measured = set()
+    for file in files:
+        file = file[:-4] if file.endswith('.csv') else file
+        df = pd.read_csv(os.path.join(out_dir, 'time', file + '.csv'), usecols=['alg', 'run'], error_bad_lines=False)
+        measured.update(zip(df['alg'], df['run'].astype(str)))
+    return measured
+
+
+def fit_model(data: DataSet, n_neighbors_list, step: int, n_iter: int):
+    """
+    Trains the model like popsicle-train, but on all data collected so far.
+    :return: Tuple (scaler, dim_reducer, regressor, adjusted R2 score in cross-validation)
+    """
+    scaler = RobustScaler(quantile_range=(10, 90))
+    x = pd.DataFrame(scaler.fit_transform(data.x), index=data.x.index, columns=data.x.columns)
+
+    dr = DimReducer('greedy', n_neighbors_list=n_neighbors_list)
+    dr.fit(DataSet(x, data.y), step=step, n_iter=n_iter)
+    x = dr.transform(x)
+
+    regr = KNeighborsRegressor(n_neighbors=dr.n_neighbors, weights='distance')
+    score = regr_score(DataSet(x, data.y), regr)
+    regr.fit(x, data.y)
+
+    return scaler, dr, regr, score
+
+
+def write_batch(proc_dir, algs, batch):
+    """
+    Writes the selected runs of each program to (...)_batch.txt (in the format of (...)_params.txt). Files of programs
+    without any selected run are emptied, so no run from a previous batch is repeated.
+    """
+    runs_of = {}
+    for alg, run in batch:
+        runs_of.setdefault(alg, []).append(run)
+
+    for alg in algs:
+        with open(os.path.join(proc_dir, alg, alg + '_batch.txt'), 'w') as fout:
+            fout.write(''.join(run + '\n' for run in runs_of.get(alg, [])))
+
+
+def main():
+    check_config(['LORE_PROC_PATH'])
+
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-i', '--input', action='append', default=[],
+                           help='Results of time measurements collected so far, as in popsicle-train (names without '
+                                'extensions). Without them, a random batch is selected.')
+    argparser.add_argument('-b', '--batch-size', type=int, default=20,
+                           help='Number of runs to select (default: 20)')
+    argparser.add_argument('--max-per-alg', type=int, default=1,
+                           help='Maximal number of selected runs of a single program (default: 1)')
+    argparser.add_argument('--seed', type=int, default=0, help='Seed of the random selection (default: 0)')
+    args = argparser.parse_args()
+    files = args.input
+    proc_dir = os.path.abspath(os.environ['LORE_PROC_PATH'])
+
+    n_neighbors_list = [4, 8, 12]
+    dr_step = 5
+    dr_n_iter = 3
+
+    candidates = get_runs()
+    algs = candidates.get_level_values(0).unique()
+    data = FileLoader(files, mode='static').data if len(files) > 0 else None
+
+    if data is not None:
+        measured = read_measured(files)
+        candidates = candidates[[c not in measured for c in candidates]]
+        print('Measured runs: ' + str(len(measured)) + ', candidates: ' + str(len(candidates)))
+
+    if data is None or len(set(df_get_index_col(data.full_set.x, 'alg'))) < MIN_ALGS:
+        print('Not enough measurements to train a model (at least ' + str(MIN_ALGS) + ' programs needed) - '
+              'selecting random runs')
+        scores = np.random.RandomState(args.seed).random_sample(len(candidates))
+    else:
+        scaler, dr, regr, score = fit_model(data.full_set, n_neighbors_list, dr_step, dr_n_iter)
+        print('Score in cross-validation:', round(score, 2))
+
+        df = df_add_static_features(pd.DataFrame(index=candidates))
+        x = df[data.full_set.x.columns]
+        x = pd.DataFrame(scaler.transform(x), index=x.index, columns=x.columns)
+
+        candidates = df.index
+        scores = neighbour_disagreement(regr, data.full_set.y, dr.transform(x))
+
+    batch = select_batch(candidates, scores, args.batch_size, args.max_per_alg)
+    write_batch(proc_dir, algs, batch)
+
+    print('========')
+    print('Selected ' + str(len(batch)) + ' runs:')
+    for alg, run in batch:
+        print('\t' + alg + ' ' + run)
+
+
+if __name__ == "__main__":
+    main()
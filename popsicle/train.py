@@ -25,8 +25,9 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('mode', type=str, help='Use \'time\'/\'t\' for training time prediction model, '
                                                '\'gcc\'/\'g\' for speedup after gcc optimisation, '
-                                               '\'unroll\'/\'u\' for speedup after clang loop unrolling or '
-                                               '\'predict\'/\'p\' for prediction.')
+                                               '\'unroll\'/\'u\' for speedup after clang loop unrolling, '
+                                               '\'static\'/\'s\' for time prediction based on static features only '
+                                               'or \'predict\'/\'p\' for prediction.')
     parser.add_argument('-i', '--input', action='append', required=True,
                         help='<Required> input files in CSV format (names without extensions). You can provide multiple'
                              ' files (-i file1 -i file2...).')
@@ -34,7 +35,7 @@ def main():
     mode = args.mode
     files = args.input
 
-    if mode not in ('time', 't', 'gcc', 'g', 'unroll', 'u'):
+    if mode not in ('time', 't', 'gcc', 'g', 'unroll', 'u', 'static', 's'):
         raise ValueError('Unsupported mode')
 
     n_neighbors_list = [4, 8, 12]
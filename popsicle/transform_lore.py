@@ -1,10 +1,119 @@
 from __future__ import print_function
+from popsicle.catalog import Catalog, catalog_path
+from popsicle.code_transform_utils.access_patterns import ACCESS_FEATURES
 from popsicle.code_transform_utils.code_transformer import CodeTransformer
-from popsicle.code_transform_utils.code_transform_utils import split_code
+from popsicle.code_transform_utils.exceptions import ParseException
+from popsicle.code_transform_utils.malloc_builder import LAYOUTS, INITIALISERS
+from popsicle.code_transform_utils.shared_parser import get_parser
+from popsicle.code_transform_utils.static_features import STATIC_FEATURES
+from popsicle.code_transform_utils.transform_cache import TransformCache
+from popsicle.code_transform_utils.trip_count import UNKNOWN
+from pycparser.plyparser import ParseError
+from multiprocessing import Pool
 import argparse
 import os
-from popsicle.utils import check_config
-import pandas as pd
+from popsicle.utils import check_config, MetadataWriter, ProfileSummary, StageProfiler, profile_stage
+
+METADATA_COLUMNS = ('alg', 'max_arr_dim', 'loop_depth') + ACCESS_FEATURES
+
+
+def transform_file(task):
+    """
+    Transforms a single LORE program and saves the results in its own subdirectory of proc_path.
+    This function is executed by pool workers, so it must not share any state with the main process.
+
+    :param task: Tuple (orig_path, proc_path, file_name, options, verbose, timeout, cache_path, profile), where
+        options are CodeTransformer parameters (see transformer_options)
+    :return: Tuple (file name without extension, (parameter names, max_param) or None, metadata row or None, static
+        features row or None, error message or None, StageProfiler records or None if profile is disabled)
+    """
+    orig_path, proc_path, file_name, options, verbose, timeout, cache_path, profile = task
+
+    file_path = os.path.join(orig_path, file_name)
+    file_name = str(file_name[:-2])
+    out_dir = os.path.join(proc_path, file_name)
+    profiler = StageProfiler() if profile else None
+    records = profiler.records if profile else None
+
+    try:
+        with profile_stage(profiler, 'read'):
+            with open(file_path, 'r') as fin:
+                source = fin.read()
+
+        with profile_stage(profiler, 'cache_get'):
+            cache = TransformCache(cache_path) if cache_path is not None else None
+            cache_key = TransformCache.key(source, options) if cache is not None else None
+            entry = cache.get(cache_key) if cache is not None else None
+
+        if entry is None:
+            res = next(CodeTransformer.transform_many([(file_name, source)], timeout=timeout, profile=profile,
+                                                      verbose=verbose, **options))
+            if profile:
+                profiler.extend(res.profile)
+
+            if res.error is not None:
+                # failures of this kind are deterministic - no need to parse the file again next time
+                if cache is not None and isinstance(res.error, (ParseException, ParseError)):
+                    cache.put(cache_key, {'error': str(res.error)})
+                raise res.error
+
+            entry = {
+                'code': res.code,
+                'max_param': res.max_param,
+                'params_names': ','.join(['PARAM_' + b.upper() for b in res.bounds]),
+                'trip_counts': [UNKNOWN if tc is None else str(tc) for tc in res.trip_counts],
+                'meta': [res.max_arr_dim, res.loop_depth] + [res.access_features[f] for f in ACCESS_FEATURES],
+                'static_features': [res.static_features[f] for f in STATIC_FEATURES],
+                'error': None,
+            }
+
+            if cache is not None:
+                with profile_stage(profiler, 'cache_put'):
+                    cache.put(cache_key, entry)
+
+        if entry['error'] is not None:
+            return file_name, None, None, None, entry['error'], records
+
+        with profile_stage(profiler, 'write'):
+            if not os.path.isdir(out_dir):
+                os.makedirs(out_dir)
+
+            with open(os.path.join(out_dir, file_name + '.c'), 'w') as fout:
+                fout.write(entry['code'])
+
+            with open(os.path.join(out_dir, file_name + '_max_param.txt'), 'w') as fout:
+                fout.write(str(entry['max_param']))
+
+            with open(os.path.join(out_dir, file_name + '_params_names.txt'), 'w') as fout:
+                fout.write(entry['params_names'])
+
+            with open(os.path.join(out_dir, file_name + '_trip_counts.txt'), 'w') as fout:
+                fout.write(''.join(tc + '\n' for tc in entry['trip_counts']))
+
+        kernel = ([p for p in entry['params_names'].split(',') if len(p) > 0], entry['max_param'])
+        return file_name, kernel, [file_name] + entry['meta'], [file_name] + entry['static_features'], None, records
+
+    except Exception as e:
+        return file_name, None, None, None, str(e), records
+
+
+def transformer_options(args):
+    """
+    CodeTransformer parameters affecting the output, based on the command line arguments.
+    They are also a part of the TransformCache key.
+    """
+    return {
+        'papi_scope': 'pragma',
+        'main_name': 'loop',
+        'modifiers_to_remove': ['extern'],
+        'gen_mallocs': True,
+        'malloc_layout': args.layout,
+        'huge_pages': args.huge_pages,
+        'initialiser': args.initialiser,
+        'seed': args.seed,
+        'rename_bounds': not args.unroll,
+        'add_pragma_unroll': args.unroll,
+    }
 
 
 def main():
@@ -13,80 +122,107 @@ def main():
     argparser = argparse.ArgumentParser()
     argparser.add_argument('-v', '--verbose', action='store_true', help='Verbose')
     argparser.add_argument('-u', '--unroll', action='store_true', help='If enabled prepare code for loop unrolling')
+    argparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='Number of worker processes (default: 1, i.e. no parallelism)')
+    argparser.add_argument('-t', '--timeout', type=float, default=None,
+                           help='Time limit (in seconds) for transforming a single file. Files exceeding it are '
+                                'skipped.')
+    argparser.add_argument('--cache-dir', type=str, default=os.environ.get('LORE_CACHE_PATH'),
+                           help='Directory of the transformation cache (default: $LORE_CACHE_PATH). Files whose source '
+                                'and options did not change since the last run are not transformed again.')
+    argparser.add_argument('--no-cache', action='store_true', help='Disable the transformation cache')
+    argparser.add_argument('-l', '--layout', choices=LAYOUTS, default='pointers',
+                           help='Memory layout of multidimensional arrays: a separate allocation for each row '
+                                '(pointers, default) or a single contiguous block per array (flat)')
+    argparser.add_argument('--huge-pages', action='store_true',
+                           help='Advise huge pages for arrays (flat layout only; can be also enabled on compilation '
+                                'time with -D HUGE_PAGES=1)')
+    argparser.add_argument('-i', '--initialiser', choices=INITIALISERS, default='rand',
+                           help='Initialisation of array elements: rand() (default), polybench-style formula or a fast '
+                                'inlined PRNG (fast)')
+    argparser.add_argument('--seed', type=int, default=0,
+                           help='Seed of the PRNG used by the fast initialiser (can be also changed on compilation time '
+                                'with -D RAND_SEED=...)')
+    argparser.add_argument('--profile', type=str, nargs='?', const='', default=None, metavar='PATH',
+                           help='Record time and peak memory of each transformation stage for every file in a CSV '
+                                'file (default: profile.csv in $LORE_PROC_PATH) and print the slowest files')
+    argparser.add_argument('--profile-top', type=int, default=10,
+                           help='Number of the slowest files printed with --profile (default: 10)')
     args = argparser.parse_args()
     verbose = args.verbose
-    unroll = args.unroll
+    jobs = args.jobs
+    timeout = args.timeout
+    options = transformer_options(args)
+    cache_path = None if args.no_cache or args.cache_dir is None else os.path.abspath(args.cache_dir)
     orig_path = os.path.abspath(os.environ['LORE_ORIG_PATH'])
     proc_path = os.path.abspath(os.environ['LORE_PROC_PATH'])
+    profile = args.profile is not None
+    profile_path = (args.profile or os.path.join(proc_path, 'profile.csv')) if profile else None
 
-    df_meta = pd.DataFrame(columns=('alg', 'max_arr_dim', 'loop_depth'))
-    print(df_meta)
+    if jobs < 1:
+        raise ValueError('Number of jobs must be positive')
 
     if not os.path.isdir(proc_path):
         os.makedirs(proc_path)
 
-    dirs = os.listdir(orig_path)
+    dirs = sorted(os.listdir(orig_path))
     n_dirs = len(dirs)
     parsed = 0
     failed = 0
 
-    for i, file_name in enumerate(dirs):
-        try:
-            if not file_name.endswith(".c"):
-                continue
+    indices = [i for i, file_name in enumerate(dirs) if file_name.endswith('.c')]
+    tasks = [(orig_path, proc_path, dirs[i], options, verbose, timeout, cache_path, profile) for i in indices]
 
-            print('[' + str(i + 1) + '/' + str(n_dirs) + '] Parsing %s' % file_name)
+    # build the parser before forking, so that the workers inherit it
+    get_parser()
 
-            file_path = os.path.join(orig_path, file_name)
-            file_name = str(file_name[:-2])
-            out_dir = os.path.join(proc_path, file_name)
+    pool = Pool(jobs) if jobs > 1 else None
+    results = pool.imap(transform_file, tasks) if pool is not None else map(transform_file, tasks)
 
-            with open(file_path, 'r') as fin:
-                code = fin.read()
-                includes, code = split_code(code)
-
-                ct = CodeTransformer(
-                    includes=includes,
-                    code=code,
-                    papi_scope='pragma',
-                    verbose=verbose,
-                    main_name='loop',
-                    modifiers_to_remove=['extern'],
-                    gen_mallocs=True,
-                    rename_bounds=(not unroll),
-                    add_pragma_unroll=unroll
-                )
-
-                code = ct.transform()
-
-                if not os.path.isdir(out_dir):
-                    os.makedirs(out_dir)
+    # rows are written as soon as files are processed, so metadata of the finished files survives a crash
+    meta_writer = MetadataWriter(os.path.join(proc_path, 'metadata.csv'), METADATA_COLUMNS)
+    features_writer = MetadataWriter(os.path.join(proc_path, 'static_features.csv'), ('alg',) + STATIC_FEATURES)
+    profile_summary = ProfileSummary(profile_path, args.profile_top) if profile else None
+    catalog = Catalog(catalog_path(proc_path))
 
-                with open(os.path.join(out_dir, file_name + '.c'), 'w') as fout:
-                    fout.write(code)
+    try:
+        # imap preserves the order of tasks, so the output does not depend on the number of workers
+        for i, (file_name, kernel, row, features_row, error, records) in zip(indices, results):
+            print('[' + str(i + 1) + '/' + str(n_dirs) + '] Parsing %s' % dirs[i])
 
-                with open(os.path.join(out_dir, file_name + '_max_param.txt'), 'w') as fout:
-                    fout.write(str(ct.max_param))
+            if profile_summary is not None:
+                profile_summary.add(file_name, records)
 
-                with open(os.path.join(out_dir, file_name + '_params_names.txt'), 'w') as fout:
-                    fout.write(','.join(['PARAM_' + b.upper() for b in ct.pp.bounds]))
-
-                df_meta = df_meta.append(pd.DataFrame(
-                    [[file_name, ct.max_arr_dim, ct.loop_depth]],
-                    columns=df_meta.columns
-                ), ignore_index=True)
+            if error is not None:
+                failed += 1
+                print('\t', error)
+                catalog.put_failed(file_name, os.path.join(orig_path, dirs[i]), error)
+                continue
 
-                parsed += 1
+            meta_writer.write(row)
+            features_writer.write(features_row)
 
-        except Exception as e:
-            failed += 1
-            print('\t', e)
+            params_names, max_param = kernel
+            catalog.put_parsed(file_name, os.path.join(orig_path, dirs[i]),
+                               os.path.join(proc_path, file_name, file_name + '.c'), params_names, max_param,
+                               row[1], row[2])
 
-    df_meta.to_csv(os.path.join(proc_path, 'metadata.csv'), index_label=False, index=False)
+            parsed += 1
+    finally:
+        meta_writer.close()
+        features_writer.close()
+        catalog.close()
+        if profile_summary is not None:
+            profile_summary.close()
+        if pool is not None:
+            pool.terminate()
 
     print('========')
     print(str(parsed) + ' parsed, ' + str(failed) + ' skipped')
 
+    if profile_summary is not None:
+        profile_summary.print_summary()
+
 
 if __name__ == "__main__":
     main()
@@ -1,41 +1,89 @@
 from __future__ import print_function
+from popsicle.code_transform_utils.access_patterns import ACCESS_FEATURES
 from popsicle.code_transform_utils.code_transformer import CodeTransformer
-from popsicle.code_transform_utils.code_transform_utils import split_code
+from popsicle.utils import MetadataWriter, ProfileSummary, StageProfiler, profile_stage
 import argparse
+import os
+
+
+def read_sources(file_paths):
+    """
+    Lazily reads the input files, so that only one of them is kept in memory at once.
+    Files which cannot be read are skipped.
+    """
+    for file_path in file_paths:
+        print('Parsing %s' % file_path)
+
+        try:
+            with open(file_path, 'r') as fin:
+                code = fin.read()
+        except IOError as e:
+            print('\t', e)
+            continue
+
+        yield file_path, code
 
 
 def main():
     argparser = argparse.ArgumentParser()
-    argparser.add_argument('file_path', type=str, help='input file path')
+    argparser.add_argument('file_path', type=str, nargs='+', help='input file path(s)')
     argparser.add_argument('-v', '--verbose', action='store_true', help='Verbose')
+    argparser.add_argument('--profile', type=str, nargs='?', const='profile.csv', default=None, metavar='PATH',
+                           help='Record time and peak memory of each transformation stage for every file in a CSV '
+                                'file (default: profile.csv) and print the slowest files')
+    argparser.add_argument('--profile-top', type=int, default=10,
+                           help='Number of the slowest files printed with --profile (default: 10)')
+    argparser.add_argument('-m', '--metadata', type=str, default=None, metavar='PATH',
+                           help='Save the access pattern features of the programs (keyed by their file names) in a '
+                                'CSV file, so that popsicle-predict-ml can use them like metadata.csv of LORE')
     args = argparser.parse_args()
     verbose = args.verbose
-    file_path = args.file_path
+    file_paths = args.file_path
+    profile = args.profile is not None
 
-    try:
-        print('Parsing %s' % file_path)
+    results = CodeTransformer.transform_many(
+        read_sources(file_paths),
+        papi_scope='pragma',
+        verbose=verbose,
+        main_name='loop',
+        modifiers_to_remove=['extern'],
+        gen_mallocs=False,
+        profile=profile,
+    )
 
-        with open(file_path, 'r') as fin:
-            code = fin.read()
-            includes, code = split_code(code)
+    profile_summary = ProfileSummary(args.profile, args.profile_top) if profile else None
+    metadata_writer = MetadataWriter(args.metadata, ('alg',) + ACCESS_FEATURES) if args.metadata is not None else None
+
+    try:
+        for res in results:
+            profiler = StageProfiler() if profile else None
+            if profile:
+                profiler.extend(res.profile)
 
-            ct = CodeTransformer(
-                includes=includes,
-                code=code,
-                papi_scope='pragma',
-                verbose=verbose,
-                main_name='loop',
-                modifiers_to_remove=['extern'],
-                gen_mallocs=False,
-            )
+            if res.error is None:
+                try:
+                    with profile_stage(profiler, 'write'):
+                        with open(res.name[:-2] + '_papi.c', 'w') as fout:
+                            fout.write(res.code)
 
-            code = ct.transform()
+                    if metadata_writer is not None:
+                        metadata_writer.write([os.path.basename(res.name)] +
+                                              [res.access_features[f] for f in ACCESS_FEATURES])
+                except Exception as e:
+                    print('\t', e)
+            else:
+                print('\t', res.error)
 
-            with open(file_path[:-2] + '_papi.c', 'w') as fout:
-                fout.write(code)
+            if profile_summary is not None:
+                profile_summary.add(res.name, profiler.records)
+    finally:
+        if profile_summary is not None:
+            profile_summary.close()
+        if metadata_writer is not None:
+            metadata_writer.close()
 
-    except Exception as e:
-        print('\t', e)
+    if profile_summary is not None:
+        profile_summary.print_summary()
 
 
 if __name__ == "__main__":
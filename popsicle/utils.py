@@ -1,4 +1,13 @@
+import csv
+import fcntl
+import io
 import os
+import resource
+import signal
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable, List, Tuple
 
 
 def check_config(var_names):
@@ -10,3 +19,196 @@ def check_config(var_names):
             raise EnvironmentError(
                 var + ' environment variable not found. Check your config and run it with \'source\' command.'
             )
+
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Interrupts the enclosed block with TimeoutError if it runs longer than given number of seconds.
+    Relies on SIGALRM, so it can only be used in the main thread of a process (which is the case for pool workers).
+
+    :param seconds: Time limit. None or 0 disables the limit.
+    """
+    if not seconds:
+        yield
+        return
+
+    def handler(signum, frame):
+        raise TimeoutError('Timeout - processing took longer than ' + str(seconds) + 's')
+
+    old_handler = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+
+
+class MetadataWriter:
+    """
+    Writes rows of a CSV file (e.g. metadata.csv) incrementally, as soon as they are available.
+
+    Every row is written with a single unbuffered write to a file opened in append mode, under an exclusive lock.
+    Therefore, if the process crashes, all rows written so far are preserved, and multiple processes (e.g. pool
+    workers) can write to the same file without interleaving their rows.
+
+    Usage:
+        with MetadataWriter(path, ['alg', 'max_arr_dim', 'loop_depth']) as writer:
+            writer.write(['program1', 2, 3])
+    """
+    def __init__(self, path: str, columns: Iterable[str], append: bool=False):
+        """
+        :param path: Path of the CSV file
+        :param columns: Names of the columns (written as a header if the file is empty)
+        :param append: If set to True, rows are appended to the existing file. Otherwise, the file is truncated.
+        """
+        self.path = path
+        self.columns = list(columns)
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if not append:
+            flags |= os.O_TRUNC
+        self.fd = os.open(path, flags, 0o644)
+
+        with self.__locked():
+            if os.fstat(self.fd).st_size == 0:
+                self.__write_line(self.columns)
+
+    def write(self, row: Iterable):
+        """
+        Appends a single row. The number of values must match the number of columns.
+        """
+        row = list(row)
+        if len(row) != len(self.columns):
+            raise ValueError('Expected ' + str(len(self.columns)) + ' values in a row, got ' + str(len(row)))
+
+        with self.__locked():
+            self.__write_line(row)
+
+    def sync(self) -> int:
+        """
+        Flushes the written rows to the disk.
+        :return: Size of the file (in bytes)
+        """
+        os.fsync(self.fd)
+        return os.fstat(self.fd).st_size
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # PRIVATE MEMBERS
+
+    @contextmanager
+    def __locked(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def __write_line(self, values: Iterable):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator='\n').writerow(values)
+        data = buf.getvalue().encode('utf-8')
+
+        # a short write should never happen for regular files, but if it does, the rest of the line is not lost
+        while len(data) > 0:
+            data = data[os.write(self.fd, data):]
+
+
+# Columns of the profile written with --profile option (one row per file and stage)
+PROFILE_COLUMNS = ('alg', 'stage', 'time_ms', 'max_rss_kb')
+
+
+def peak_memory() -> int:
+    """
+    :return: The peak resident set size of the current process so far (in kB)
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageProfiler:
+    """
+    Records wall time and peak memory of consecutive stages of processing a single file.
+    It only reads the clock and calls getrusage() once per stage, so it is cheap enough to be left enabled.
+    The memory is the peak RSS of the whole process at the end of the stage - a stage which increased it is the one
+    responsible for the peak.
+
+    Usage:
+        profiler = StageProfiler()
+        with profiler.stage('parse'):
+            ...
+        profiler.records    # [('parse', 12.5, 51234)] - (stage, time in ms, peak RSS in kB)
+    """
+    def __init__(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append((name, round((time.perf_counter() - start) * 1000, 3), peak_memory()))
+
+    def extend(self, records: Iterable[Tuple[str, float, int]]):
+        """
+        Appends records of another profiler (e.g. one used by a library function)
+        """
+        self.records.extend(records)
+
+
+@contextmanager
+def profile_stage(profiler, name: str):
+    """
+    profiler.stage(name) or nothing if profiler is None
+    """
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(name):
+            yield
+
+
+class ProfileSummary:
+    """
+    Collects per-file profiles (see StageProfiler), writes them to a CSV file (see PROFILE_COLUMNS) as soon as they
+    are available and prints a summary at the end: the slowest files and the total time of each stage.
+    """
+    def __init__(self, path: str, top_n: int=10):
+        self.writer = MetadataWriter(path, PROFILE_COLUMNS)
+        self.top_n = top_n
+        self.file_times = {}
+        self.stage_times = Counter()
+        self.max_rss = 0
+
+    def add(self, name: str, records: List[Tuple[str, float, int]]):
+        for stage, time_ms, max_rss in records:
+            self.writer.write([name, stage, time_ms, max_rss])
+            self.stage_times[stage] += time_ms
+            self.max_rss = max(self.max_rss, max_rss)
+
+        self.file_times[name] = sum(r[1] for r in records)
+
+    def print_summary(self):
+        print('Slowest files:')
+        for name, time_ms in sorted(self.file_times.items(), key=lambda f: -f[1])[:self.top_n]:
+            print('\t%10.1f ms  %s' % (time_ms, name))
+
+        print('Total time by stage:')
+        for stage, time_ms in self.stage_times.most_common():
+            print('\t%10.1f ms  %s' % (time_ms, stage))
+
+        print('Peak memory: ' + str(self.max_rss // 1024) + ' MB')
+
+    def close(self):
+        self.writer.close()
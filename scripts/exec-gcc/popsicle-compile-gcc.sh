@@ -18,12 +18,16 @@ if ! [ -e ${PAPI_UTILS_PATH}/exec_loop.o ]; then
     gcc -c ${PAPI_UTILS_PATH}/exec_loop.c
 fi
 
+# prelinked harness (see popsicle-init-*.sh) if available
+if [ -e ${PAPI_UTILS_PATH}/popsicle_harness.o ]; then
+    harness="${PAPI_UTILS_PATH}/popsicle_harness.o"
+else
+    harness="${PAPI_UTILS_PATH}/exec_loop.o ${PAPI_UTILS_PATH}/papi_utils.o -lpfm -lpapi"
+fi
+
 if [ -e ${file_prefix}_O${optimization}.o ]; then
     gcc ${file_prefix}_O${optimization}.o \
-        ${PAPI_UTILS_PATH}/exec_loop.o \
-        ${PAPI_UTILS_PATH}/papi_utils.o \
-        -lpfm \
-        -lpapi \
+        ${harness} \
         -lm \
         -static -o ${PAPI_UTILS_PATH}/exec_loop_O${optimization}
 else
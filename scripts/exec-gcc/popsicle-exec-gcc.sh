@@ -29,12 +29,17 @@ echo ",time_O3" >> ${out_file_O3}
 
 start_time=$SECONDS
 
-file_count=`find ${LORE_PROC_PATH} -iname '*.c' | wc -l`
+# programs are listed from the catalog (see popsicle-catalog) if it exists, otherwise from the directory
+if [ -e ${LORE_PROC_PATH}/catalog.db ]; then
+    names=`popsicle-catalog list`
+else
+    names=`find ${LORE_PROC_PATH} -iname '*.c' -exec basename {} .c \;`
+fi
+
+file_count=`echo ${names} | wc -w`
 file_i=1
 
-for path in `find ${LORE_PROC_PATH} -iname '*.c'`; do
-    name=`basename "${path%.*}"`
-
+for name in ${names}; do
     file_prefix=${LORE_PROC_PATH}/${name}/${name}
 
     if [ -e ${file_prefix}_params.txt ]; then
@@ -65,6 +70,8 @@ for path in `find ${LORE_PROC_PATH} -iname '*.c'`; do
             done
 
         done < ${file_prefix}_params.txt
+
+        if [ -e ${LORE_PROC_PATH}/catalog.db ]; then popsicle-catalog mark-executed gcc ${name}; fi
     fi
 
     ((file_i++))
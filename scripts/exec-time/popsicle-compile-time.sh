@@ -14,12 +14,16 @@ gcc -c \
     ${params} \
     -O0 -o ${file_prefix}.o
 
+# prelinked harness (see popsicle-init-*.sh) if available
+if [ -e ${PAPI_UTILS_PATH}/popsicle_harness.o ]; then
+    harness="${PAPI_UTILS_PATH}/popsicle_harness.o"
+else
+    harness="${PAPI_UTILS_PATH}/exec_loop.o ${PAPI_UTILS_PATH}/papi_utils.o -lpfm -lpapi"
+fi
+
 if [ -e ${file_prefix}.o ]; then
     gcc ${file_prefix}.o \
-        ${PAPI_UTILS_PATH}/exec_loop.o \
-        ${PAPI_UTILS_PATH}/papi_utils.o \
-        -lpfm \
-        -lpapi \
+        ${harness} \
         -lm \
         -static -o ${PAPI_UTILS_PATH}/exec_loop
 else
@@ -2,12 +2,14 @@
 
 # PARAMS:
 #   $1 output file name (without extension)
+#   $2 parameters to run: params (default, (...)_params.txt) or batch ((...)_batch.txt, see popsicle-select-lore)
 
 if [ -z "$LORE_PROC_PATH" ]; then echo "Invalid config (LORE_PROC_PATH) missing!"; exit 1; fi
 if [ -z "$OUT_DIR" ]; then echo "Invalid config (OUT_DIR) missing!"; exit 1; fi
 
 readonly trials=5
 readonly out_file=${OUT_DIR}time/$1.csv
+readonly params_suffix=${2:-params}
 
 mkdir -p ${OUT_DIR}/time
 
@@ -17,12 +19,17 @@ echo -n "alg,run," > ${out_file}
 papi-events.sh >> ${out_file}
 echo ",time" >> ${out_file}
 
-for path in `find ${LORE_PROC_PATH} -iname '*.c'`; do
-    name=`basename "${path%.*}"`
+# programs are listed from the catalog (see popsicle-catalog) if it exists, otherwise from the directory
+if [ -e ${LORE_PROC_PATH}/catalog.db ]; then
+    names=`popsicle-catalog list`
+else
+    names=`find ${LORE_PROC_PATH} -iname '*.c' -exec basename {} .c \;`
+fi
 
+for name in ${names}; do
     file_prefix=${LORE_PROC_PATH}/${name}/${name}
 
-    if [ -e ${file_prefix}_params.txt ]; then
+    if [ -e ${file_prefix}_${params_suffix}.txt ]; then
         while read -r params; do
             if ! popsicle-compile-time.sh ${file_prefix} "${params}"; then
                 break
@@ -39,7 +46,9 @@ for path in `find ${LORE_PROC_PATH} -iname '*.c'`; do
                 fi
             done
 
-        done < ${file_prefix}_params.txt
+        done < ${file_prefix}_${params_suffix}.txt
+
+        if [ ${params_suffix} == "params" ] && [ -e ${LORE_PROC_PATH}/catalog.db ]; then popsicle-catalog mark-executed time ${name}; fi
     fi
 
 done
@@ -14,5 +14,19 @@ compile_papi_utils() {
         -o ${PAPI_UTILS_PATH}/papi_utils.o
 }
 
+# exec_loop.o, papi_utils.o and the PAPI libraries linked once into a single object, so linking a program only
+# resolves the C library (see popsicle-compile-*.sh). Without static PAPI libraries, programs are linked as before.
+link_harness() {
+    rm -f ${PAPI_UTILS_PATH}/popsicle_harness.o
+    gcc -r -nostdlib \
+        ${PAPI_UTILS_PATH}/exec_loop.o \
+        ${PAPI_UTILS_PATH}/papi_utils.o \
+        -Wl,-Bstatic \
+        -Wl,--start-group -lpapi -lpfm -Wl,--end-group \
+        -o ${PAPI_UTILS_PATH}/popsicle_harness.o \
+        || rm -f ${PAPI_UTILS_PATH}/popsicle_harness.o
+}
+
 compile_exec_loop
 compile_papi_utils
+link_harness
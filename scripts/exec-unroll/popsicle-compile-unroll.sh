@@ -21,12 +21,16 @@ clang -c -Rpass=unroll -O2 \
     -D PRAGMA_UNROLL='"'${unroll}'"' \
     -o ${file_prefix}_${u_or_n}.o
 
+# prelinked harness (see popsicle-init-*.sh) if available
+if [ -e ${PAPI_UTILS_PATH}/popsicle_harness.o ]; then
+    harness="${PAPI_UTILS_PATH}/popsicle_harness.o"
+else
+    harness="${PAPI_UTILS_PATH}/exec_loop.o ${PAPI_UTILS_PATH}/papi_utils.o -lpfm -lpapi"
+fi
+
 if [ -e ${file_prefix}_${u_or_n}.o ]; then
     clang ${file_prefix}_${u_or_n}.o \
-        ${PAPI_UTILS_PATH}/exec_loop.o \
-        ${PAPI_UTILS_PATH}/papi_utils.o \
-        -lpfm \
-        -lpapi \
+        ${harness} \
         -lm \
         -static -o ${PAPI_UTILS_PATH}/exec_loop_${u_or_n}
 else
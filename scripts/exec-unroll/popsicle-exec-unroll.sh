@@ -29,12 +29,17 @@ echo ",time_nour" >> ${out_file_nour}
 
 start_time=$SECONDS
 
-file_count=`find ${LORE_PROC_CLANG_PATH} -iname '*.c' | wc -l`
+# programs are listed from the catalog (see popsicle-catalog) if it exists, otherwise from the directory
+if [ -e ${LORE_PROC_CLANG_PATH}/catalog.db ]; then
+    names=`popsicle-catalog -u list`
+else
+    names=`find ${LORE_PROC_CLANG_PATH} -iname '*.c' -exec basename {} .c \;`
+fi
+
+file_count=`echo ${names} | wc -w`
 file_i=1
 
-for path in `find ${LORE_PROC_CLANG_PATH} -iname '*.c'`; do
-    name=`basename "${path%.*}"`
-
+for name in ${names}; do
     file_prefix=${LORE_PROC_CLANG_PATH}/${name}/${name}
     ((file_i++))
 
@@ -68,6 +73,8 @@ for path in `find ${LORE_PROC_CLANG_PATH} -iname '*.c'`; do
             done
 
         done < ${file_prefix}_params.txt
+
+        if [ -e ${LORE_PROC_CLANG_PATH}/catalog.db ]; then popsicle-catalog -u mark-executed unroll ${name}; fi
     else
         echo "File ${file_prefix}_params.txt is missing!"
     fi
@@ -3,17 +3,33 @@
 # PARAMS:
 #   $1 mode (t - time, g - gcc or u - unroll)
 #   $2 output file name (without extension)
+#   $3 parameters to run in t mode: params (default) or batch (see popsicle-select-lore)
+#   --resume (optional) continue an interrupted campaign, skipping the measured parameter sets
+#   --status (optional) only print the progress of the campaign and the estimated time remaining
+#
+# The programs are measured by popsicle-exec-lore one at a time, like by popsicle-exec-time.sh, popsicle-exec-gcc.sh
+# and popsicle-exec-unroll.sh (same compilation flags, trials and output files), but the progress is recorded in
+# a journal, so an interrupted campaign can be resumed.
 
 
 mode=$1
 file_name=$2
+params=params
+options=()
+
+for arg in "${@:3}"; do
+    case ${arg} in
+        --resume|--status) options+=(${arg}) ;;
+        *) params=${arg} ;;
+    esac
+done
 
 if [[ ${mode} == "t" ]]; then
-    popsicle-exec-time.sh $2
+    popsicle-exec-lore t ${file_name} -j 1 -p ${params} "${options[@]}"
 elif [[ ${mode} == "g" ]]; then
-    popsicle-exec-gcc.sh $2
+    popsicle-exec-lore g ${file_name} -j 1 "${options[@]}"
 elif [[ ${mode} == "u" ]]; then
-    popsicle-exec-unroll.sh $2
+    popsicle-exec-lore u ${file_name} -j 1 "${options[@]}"
 else
     echo "Available modes are: t (time), g (gcc) and u (unroll)."
     exit 1
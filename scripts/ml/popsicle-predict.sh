@@ -18,8 +18,11 @@ else
     exit 1
 fi
 
+mkdir -p ${OUT_DIR}/predict/
+out_file=${OUT_DIR}/predict/${file_name_without_ext}_papi.csv
+
 echo "Adding PAPI instructions to ${path}"
-popsicle-transform-user-input ${path}
+popsicle-transform-user-input ${path} -m ${OUT_DIR}/predict/${file_name_without_ext}_papi_meta.csv
 
 echo "Compiling..."
 if [[ ${mode} == "t" || ${mode} == "g" ]]; then
@@ -31,9 +34,6 @@ else
     exit 1
 fi
 
-mkdir -p ${OUT_DIR}/predict/
-out_file=${OUT_DIR}/predict/${file_name_without_ext}_papi.csv
-
 echo -n "alg,run," > ${out_file}
 papi-events.sh >> ${out_file}
 echo ",time" >> ${out_file}
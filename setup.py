@@ -7,7 +7,7 @@ setup(name='popsicle',
       author='Maciej Kocot',
       author_email='mkocot@op.pl',
       license='MIT',
-      packages=['popsicle', 'popsicle.code_transform_utils', 'popsicle.ml_utils'],
+      packages=['popsicle', 'popsicle.code_transform_utils', 'popsicle.exec_utils', 'popsicle.ml_utils'],
       install_requires=[
           'pandas',
           'pycparser',
@@ -20,8 +20,12 @@ setup(name='popsicle',
                               'popsicle-transform-lore = popsicle.transform_lore:main',
                               'popsicle-transform-pips = popsicle.transform_pips:main',
                               'popsicle-transform-user-input = popsicle.transform_user_input:main',
+                              'popsicle-calibrate-lore = popsicle.calibrate_lore:main',
                               'popsicle-params-lore = popsicle.params_lore:main',
+                              'popsicle-catalog = popsicle.catalog:main',
                               'popsicle-train = popsicle.train:main',
+                              'popsicle-exec-lore = popsicle.exec_lore:main',
+                              'popsicle-select-lore = popsicle.select_lore:main',
                               'popsicle-predict-ml = popsicle.predict_ml:main',
 
                               'popsicle-exec = popsicle.fake_bash:exec',